@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+
+# ------------------------- Dose biologicamente efetiva -------------------------
+# bloco de código para levar o eixo de dose das curvas DVH a BED/EQD2 (modelo linear-quadrático),
+# de modo que volumes de planos com fracionamentos diferentes possam ser comparados
+
+
+def validar_alfa_beta(alfa_beta):
+    """α/β [Gy] como float; ValueError se não for um número positivo (zero ou negativo daria inf/NaN)."""
+    try:
+        valor = float(alfa_beta)
+    except (TypeError, ValueError):
+        raise ValueError(f"α/β inválido: {alfa_beta!r} (informe um número de Gy maior que zero).") from None
+    if not np.isfinite(valor) or valor <= 0:
+        raise ValueError(f"α/β inválido: {alfa_beta!r} (informe um número de Gy maior que zero).")
+    return valor
+
+
+# α/β [Gy] usado na conversão; 2 Gy é o valor usual para o tecido cerebral (radionecrose)
+ALFA_BETA_PADRAO = validar_alfa_beta(os.environ.get("DVH_ALFA_BETA", "2"))
+
+# Limiares de radionecrose já usados no SRS, como (dose física [cGy], número de frações): em EQD2,
+# todos passam a valer para qualquer fracionamento
+REFERENCIAS_RADIONECROSE = ((1000.0, 1), (1200.0, 1), (1800.0, 3), (2000.0, 3), (2400.0, 5), (3000.0, 5))
+
+
+def bed(dose_cgy, n_fracoes, alfa_beta=ALFA_BETA_PADRAO):
+    """BED [cGy] de uma dose total (número ou array, em cGy) entregue em n_fracoes: D·(1 + d/(α/β))."""
+    dose = np.asarray(dose_cgy, dtype=float)
+    return dose * (1.0 + dose / n_fracoes / (alfa_beta * 100.0))
+
+
+def eqd2(dose_cgy, n_fracoes, alfa_beta=ALFA_BETA_PADRAO):
+    """Dose equivalente em frações de 2 Gy [cGy]: BED / (1 + 2 Gy/(α/β))."""
+    return bed(dose_cgy, n_fracoes, alfa_beta) / (1.0 + 2.0 / alfa_beta)
+
+
+GRANDEZAS = {"bed": bed, "eqd2": eqd2}
+
+
+def volumes_acima(doses, volumes, limiares):
+    """
+    Volumes da curva cumulativa (doses em ordem crescente) no primeiro ponto com dose >= cada limiar,
+    todos de uma vez por busca binária. Limiares acima da última dose da tabela retornam NaN.
+    """
+    limiares = np.asarray(limiares, dtype=float)
+    indices = np.searchsorted(doses, limiares, side="left")
+    resultado = np.full(len(limiares), np.nan)
+    dentro = indices < len(doses)
+    resultado[dentro] = volumes[indices[dentro]]
+    return resultado
+
+
+def rotulo_eqd2(dose_cgy, n_fracoes, alfa_beta=ALFA_BETA_PADRAO):
+    """Nome da métrica de volume acima do EQD2 equivalente a dose_cgy em n_fracoes."""
+    limiar = float(eqd2(dose_cgy, n_fracoes, alfa_beta))
+    return f"Volume EQD2 >{limiar / 100:.1f} Gy (≡ {dose_cgy / 100:g} Gy em {n_fracoes} fx) (cm³)"
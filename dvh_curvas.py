@@ -0,0 +1,269 @@
+import warnings
+
+import numpy as np
+
+# ------------------------- Leitura das curvas DVH -------------------------
+# bloco de código para leitura das tabelas DVH como arrays numéricos
+
+# Rótulos da linha que abre cada estrutura no DVH tabulado (Eclipse em português ou inglês)
+MARCAS_ESTRUTURA = ("Estrutura:", "Structure:", "estrutura:", "structure:", "ESTRUTURA:", "STRUCTURE:")
+
+
+def decodificar_tabela(texto_tabela):
+    """
+    Converte de uma só vez o texto de uma tabela DVH em um array (N, 3) de floats, aceitando
+    vírgula ou ponto como separador decimal. Linhas que não têm exatamente 3 valores numéricos
+    são descartadas, como na leitura linha a linha.
+    """
+    texto = texto_tabela.replace(',', '.').strip()
+    if not texto:
+        return np.empty((0, 3))
+    # Linhas em branco no meio da tabela também desviam para o caminho lento (mais linhas que valores)
+    n_linhas = texto.count("\n") + 1
+
+    # Caminho rápido: o bloco inteiro é convertido pelo parser de texto do numpy, que para no
+    # primeiro valor não numérico (o total de valores deixa de bater com 3 por linha)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            valores = np.fromstring(texto, dtype=float, sep=" ")
+    except ValueError:
+        valores = None
+    if valores is not None and len(valores) == 3 * n_linhas:
+        valores = valores.reshape(-1, 3)
+        # Linhas com 2 e 4 valores manteriam o total, mas desalinhariam a coluna de dose
+        if np.all(np.diff(valores[:, 0]) >= 0):
+            return valores
+
+    # Bloco com linhas malformadas: cada linha é validada como na leitura original
+    linhas_validas = []
+    for linha in texto.splitlines():
+        partes = linha.split()
+        if len(partes) != 3:
+            continue
+        try:
+            linhas_validas.append([float(p) for p in partes])
+        except ValueError:
+            continue
+    return np.array(linhas_validas, dtype=float).reshape(-1, 3)
+
+
+def _inicios_estrutura(texto):
+    """Posições (início da linha, fim do rótulo) de cada linha "Estrutura:"/"Structure:" do texto."""
+    inicios = []
+    for marca in MARCAS_ESTRUTURA:
+        i = texto.find(marca)
+        while i != -1:
+            inicio_linha = texto.rfind("\n", 0, i) + 1
+            if not texto[inicio_linha:i].strip():
+                inicios.append((inicio_linha, i + len(marca)))
+            i = texto.find(marca, i + 1)
+    return sorted(inicios)
+
+
+def separar_estruturas(texto):
+    """
+    Divide o texto do arquivo DVH nos blocos de cada estrutura, sem percorrer as linhas em Python.
+    Retorna uma lista de (nome da estrutura como no arquivo, texto antes da tabela, texto da tabela).
+    """
+    inicios = _inicios_estrutura(texto)
+    blocos = []
+    for i, (_, fim_rotulo) in enumerate(inicios):
+        fim_nome = texto.find("\n", fim_rotulo)
+        if fim_nome == -1:
+            fim_nome = len(texto)
+        fim = inicios[i + 1][0] if i + 1 < len(inicios) else len(texto)
+        nome = texto[fim_rotulo:fim_nome].strip()
+        secao = texto[fim_nome:fim]
+        dados, tabela = secao, ""
+
+        # Cabeçalho da tabela: linha com "Dose relativa [%]" e "Volume da estrutura"
+        inicio = secao.find("Dose relativa [%]")
+        while inicio != -1:
+            inicio_linha = secao.rfind("\n", 0, inicio) + 1
+            fim_linha = secao.find("\n", inicio)
+            if fim_linha == -1:
+                fim_linha = len(secao)
+            if "Volume da estrutura" in secao[inicio_linha:fim_linha]:
+                dados, tabela = secao[:inicio_linha], secao[fim_linha:]
+                break
+            inicio = secao.find("Dose relativa [%]", fim_linha)
+
+        blocos.append((nome, dados, tabela))
+    return blocos
+
+
+# ------------------------- DVH diferencial -------------------------
+# bloco de código para aceitar a exportação diferencial (menor em bins finos), convertida aqui
+# para a curva cumulativa usada em todo o restante da análise
+
+TIPO_DIFERENCIAL = "histograma de dose volume diferencial"
+
+
+def formato_dvh(texto):
+    """
+    Lê no cabeçalho do arquivo se o DVH é diferencial e, nesse caso, se o volume da tabela está
+    por unidade de dose ([cm³/cGy]) ou por bin ([cm³]). Retorna (diferencial, volume_por_dose).
+    """
+    inicios = _inicios_estrutura(texto)
+    cabecalho = texto[:inicios[0][0]] if inicios else texto
+    if TIPO_DIFERENCIAL not in cabecalho.lower():
+        return False, False
+
+    i = texto.find("Volume da estrutura [")
+    fim = texto.find("]", i)
+    unidade = texto[i:fim].lower() if i != -1 else ""
+    return True, "/cgy" in unidade
+
+
+def cumulativa_de_diferencial(tabela, volume_por_dose=True):
+    """
+    Converte uma tabela DVH diferencial (N, 3) na cumulativa equivalente: o volume de cada bin
+    (valor x largura do bin, quando o volume vem por cGy) é somado do fim para o início, de modo
+    que V(D) seja o volume que recebe pelo menos a dose D.
+    """
+    if not len(tabela):
+        return tabela
+    dose = tabela[:, 0]
+    volumes = tabela[:, 2]
+    if volume_por_dose:
+        # O último bin tem a mesma largura do anterior
+        larguras = np.diff(dose, append=dose[-1] + (dose[-1] - dose[-2] if len(dose) > 1 else 1.0))
+        volumes = volumes * larguras
+    cumulativa = tabela.copy()
+    cumulativa[:, 2] = np.cumsum(volumes[::-1])[::-1]
+    return cumulativa
+
+
+def extrair_curvas_dvh(texto):
+    """
+    Lê todas as tabelas DVH do texto de um arquivo e retorna um dicionário
+    {nome da estrutura (minúsculo): array (N, 3)} com as colunas dose [cGy],
+    dose relativa [%] e volume [cm³]. DVHs diferenciais são convertidos para cumulativos.
+    """
+    diferencial, volume_por_dose = formato_dvh(texto)
+    curvas = {}
+    for nome, _, tabela in separar_estruturas(texto):
+        curva = decodificar_tabela(tabela)
+        if diferencial:
+            curva = cumulativa_de_diferencial(curva, volume_por_dose)
+        if len(curva):
+            curvas[nome.lower()] = curva
+    return curvas
+
+
+def ler_curvas_dvh(caminho_arquivo):
+    """Lê as curvas DVH diretamente do arquivo."""
+    with open(caminho_arquivo, 'r', encoding='utf-8') as file:
+        return extrair_curvas_dvh(file.read())
+
+
+def volume_relativo(curva):
+    """Converte a coluna de volume absoluto [cm³] em percentual do volume total da estrutura."""
+    volume_total = curva[0, 2] if len(curva) else 0.0
+    if not volume_total:
+        return np.zeros(len(curva))
+    return curva[:, 2] / volume_total * 100.0
+
+
+# ------------------------- Métricas a partir das curvas -------------------------
+# bloco de código para doses médias, doses integrais e volumes de isodose calculados diretamente das
+# curvas cumulativas, sem as linhas "Dose média" do arquivo nem estruturas auxiliares de isodose
+
+# Níveis de isodose (% da prescrição) lidos da curva do Body; o primeiro é a referência dos gradientes
+NIVEIS_ISODOSE = (100, 50, 25)
+
+
+def integral_dose_volume(curva, dose_minima=0.0):
+    """
+    Dose integral [cGy·cm³] da região da estrutura que recebe pelo menos dose_minima, a partir do
+    DVH cumulativo: dose_minima·V(dose_minima) + integral de V(D) dD acima dela (regra dos trapézios).
+    """
+    dose, volume = curva[:, 0], curva[:, 2]
+    if dose_minima > dose[0]:
+        acima = dose > dose_minima
+        dose = np.concatenate(([dose_minima], dose[acima]))
+        volume = np.concatenate(([np.interp(dose_minima, curva[:, 0], curva[:, 2])], volume[acima]))
+    area = np.sum((volume[1:] + volume[:-1]) * np.diff(dose)) / 2.0
+    return float(dose[0] * volume[0] + area)
+
+
+def calcular_metricas_curvas(curva_ptv, curva_body, niveis=NIVEIS_ISODOSE):
+    """
+    Calcula, em uma passada sobre as curvas já lidas, a dose média e a dose integral do PTV e do Body,
+    os volumes de isodose de cada nível (Body, dose relativa) e os índices de gradiente entre eles.
+    Os nomes levam "curva" para não se confundirem com as colunas da planilha de mesmo assunto
+    (dose média exportada pelo Eclipse, volumes das estruturas de isodose).
+    """
+    metricas = {}
+    for rotulo, curva in (("PTV", curva_ptv), ("Body", curva_body)):
+        if len(curva) and curva[0, 2] > 0:
+            integral = integral_dose_volume(curva)
+            metricas[f"Dose média {rotulo} (curva, cGy)"] = integral / curva[0, 2]
+            metricas[f"Dose integral {rotulo} (curva, Gy·cm³)"] = integral / 100.0
+        else:
+            metricas[f"Dose média {rotulo} (curva, cGy)"] = None
+            metricas[f"Dose integral {rotulo} (curva, Gy·cm³)"] = None
+
+    volume_ptv = float(curva_ptv[0, 2]) if len(curva_ptv) else None
+    if not len(curva_body):
+        return metricas
+
+    # Volumes de todos os níveis em uma interpolação (acima da dose máxima o volume é zero)
+    dose_relativa = curva_body[:, 1]
+    volumes = np.interp(niveis, dose_relativa, curva_body[:, 2], right=0.0)
+    for nivel, volume in zip(niveis, volumes):
+        metricas[f"Volume Isodose {nivel}% (curva, cm³)"] = float(volume)
+        if volume_ptv:
+            metricas[f"Isodose {nivel}%/PTV"] = float(volume) / volume_ptv
+
+    referencia = volumes[0]
+    for nivel, volume in zip(niveis[1:], volumes[1:]):
+        metricas[f"GI (isodose{nivel}/isodose{niveis[0]})"] = float(volume / referencia) if referencia else None
+
+    # Gn: dose integral do PTV / dose integral da região dentro da isodose de 50%
+    if metricas["Dose integral PTV (curva, Gy·cm³)"] is not None and dose_relativa[-1] >= 50:
+        dose_50 = float(np.interp(50.0, dose_relativa, curva_body[:, 0]))
+        integral_50 = integral_dose_volume(curva_body, dose_50) / 100.0
+        metricas["Gn (curvas)"] = metricas["Dose integral PTV (curva, Gy·cm³)"] / integral_50 if integral_50 else None
+    else:
+        metricas["Gn (curvas)"] = None
+
+    return metricas
+
+
+# ------------------------- Redução de pontos (LTTB) -------------------------
+
+def reduzir_curva_lttb(x, y, n_pontos):
+    """
+    Reduz a curva (x, y) para n_pontos usando o algoritmo Largest-Triangle-Three-Buckets,
+    que preserva a forma da curva (ombros e quedas) mesmo com poucos pontos.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_pontos >= n or n_pontos < 3:
+        return x, y
+
+    # Os pontos internos são divididos em n_pontos - 2 baldes; o primeiro e o último são mantidos
+    bordas = np.linspace(1, n - 1, n_pontos - 1).astype(int)
+    indices = np.empty(n_pontos, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    anterior = 0
+    for i in range(n_pontos - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        proximo_fim = bordas[i + 2] if i + 2 < len(bordas) else n
+        x_medio = x[fim:proximo_fim].mean()
+        y_medio = y[fim:proximo_fim].mean()
+
+        # Área do triângulo formado pelo ponto anterior, cada candidato e a média do próximo balde
+        areas = np.abs(
+            (x[anterior] - x_medio) * (y[inicio:fim] - y[anterior])
+            - (x[anterior] - x[inicio:fim]) * (y_medio - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+
+    return x[indices], y[indices]
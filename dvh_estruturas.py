@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import unicodedata
+
+# ------------------------- Resolução dos nomes das estruturas -------------------------
+# bloco de código para encontrar as estruturas no DVH mesmo quando o planejador usa outra grafia
+# ("Encéfalo" x "Encefalo", "Pulmoes-PTV" x "Pulmões - PTV", "Iso50" x "Dose 50[%]")
+
+# Outros nomes aceitos para cada papel, por tipo de tratamento ("*" vale para todos os tipos)
+ALIASES_PADRAO = {
+    "*": {
+        "body": ["Body", "External", "Externo", "Corpo", "Outer Contour"],
+        "iso50": ["Dose 50[%]", "Iso50", "Isodose 50", "Isodose 50%", "Dose 50%"],
+    },
+    "SRS (Radiocirurgia)": {
+        "encefalo": ["Encefalo", "Brain", "Cerebro"],
+    },
+    "SBRT de Pulmão": {
+        "pulmao": ["Pulmões - PTV", "Pulmoes-PTV", "Pulmao - PTV", "Lungs - PTV", "Lung-PTV"],
+    },
+}
+
+# Tabela da instituição no mesmo formato de ALIASES_PADRAO (JSON), somada à padrão
+CAMINHO_ALIASES = os.environ.get(
+    "DVH_ALIASES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "aliases_estruturas.json")
+)
+
+
+def normalizar_nome(nome):
+    """Chave de comparação: sem acentos, sem diferença de maiúsculas, espaços e pontuação ("Pulmões - PTV" -> "pulmoesptv")."""
+    decomposto = unicodedata.normalize("NFKD", nome)
+    return "".join(c for c in decomposto.casefold() if c.isalnum())
+
+
+def carregar_aliases(caminho=CAMINHO_ALIASES):
+    """Junta os aliases padrão com os da instituição (se o arquivo existir)."""
+    tabela = {tipo: {papel: list(nomes) for papel, nomes in papeis.items()} for tipo, papeis in ALIASES_PADRAO.items()}
+    if not caminho or not os.path.exists(caminho):
+        return tabela
+
+    with open(caminho, "r", encoding="utf-8") as f:
+        instituicao = json.load(f)
+    for tipo, papeis in instituicao.items():
+        for papel, nomes in papeis.items():
+            tabela.setdefault(tipo, {}).setdefault(papel, []).extend(nomes)
+    return tabela
+
+
+def impressao_aliases(tabela):
+    """Hash curto da tabela de aliases: muda quando a instituição altera o arquivo de aliases."""
+    texto = json.dumps(tabela, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def aliases_do_papel(tabela, tipo_tratamento, papel):
+    return tabela.get("*", {}).get(papel, []) + tabela.get(tipo_tratamento, {}).get(papel, [])
+
+
+class IndiceEstruturas:
+    """
+    Índice, montado uma vez por arquivo, dos nomes das estruturas presentes no DVH. A busca
+    tenta o nome exato (sem diferença de maiúsculas) e depois o nome normalizado, ambos em dicionário.
+    Nomes diferentes que se normalizam na mesma chave ("PTV 1" e "PTV-1") ficam em 'colisoes': a
+    busca normalizada por essa chave não escolhe nenhum deles e a estrutura é tratada como ausente.
+    """
+
+    def __init__(self, nomes):
+        self.exatos = {}
+        self.normalizados = {}
+        self.colisoes = {}  # chave normalizada -> nomes do arquivo com essa chave
+        for nome in nomes:
+            self.exatos.setdefault(nome.strip().lower(), nome)
+            chave = normalizar_nome(nome)
+            anterior = self.normalizados.setdefault(chave, nome)
+            if anterior.strip().lower() != nome.strip().lower():
+                nomes_chave = self.colisoes.setdefault(chave, [anterior])
+                if all(outro.strip().lower() != nome.strip().lower() for outro in nomes_chave):
+                    nomes_chave.append(nome)
+
+    def __contains__(self, nome):
+        return self.resolver(nome) is not None
+
+    def resolver(self, nome, aliases=()):
+        """
+        Retorna o nome da estrutura como está no arquivo, ou None se nenhum candidato existir. Um
+        candidato que só é encontrado por uma chave normalizada ambígua também retorna None (sem
+        passar aos seguintes), como uma estrutura ausente.
+        """
+        for candidato in (nome, *aliases):
+            if not candidato:
+                continue
+            encontrado = self.exatos.get(candidato.strip().lower())
+            if encontrado is not None:
+                return encontrado
+            chave = normalizar_nome(candidato)
+            if chave in self.colisoes:
+                return None
+            encontrado = self.normalizados.get(chave)
+            if encontrado is not None:
+                return encontrado
+        return None
+
+
+def resolver_estruturas(indice, tipo_tratamento, estruturas, tabela_aliases=None):
+    """
+    Troca cada nome informado {papel: nome} pelo nome encontrado no arquivo, usando os aliases do
+    tipo de tratamento quando o nome informado não existe. Nomes não encontrados ficam como estão.
+    """
+    tabela_aliases = TABELA_ALIASES if tabela_aliases is None else tabela_aliases
+    resolvidas = {}
+    for papel, nome in estruturas.items():
+        encontrado = indice.resolver(nome, aliases_do_papel(tabela_aliases, tipo_tratamento, papel))
+        resolvidas[papel] = encontrado if encontrado is not None else nome
+    return resolvidas
+
+
+TABELA_ALIASES = carregar_aliases()
+IMPRESSAO_ALIASES = impressao_aliases(TABELA_ALIASES)
@@ -0,0 +1,135 @@
+import threading
+
+import numpy as np
+
+from dvh_regras import numeros_da_coluna
+
+# ------------------------- Histórico institucional das métricas -------------------------
+# bloco de código para situar cada métrica do plano atual entre os planos já registrados na
+# planilha (mesmo tipo de tratamento e fracionamento), a partir do espelho local
+
+# Colunas da planilha que identificam o plano e não são métricas
+COLUNAS_IDENTIFICACAO = ("Nome do Paciente", "ID do Paciente", "Data/Hora", "Fracionamento")
+
+# Abaixo deste número de planos anteriores o percentil não é mostrado
+MINIMO_PLANOS = 5
+
+
+class HistoricoMetricas:
+    """
+    Valores já registrados de cada métrica, mantidos em arrays ordenados por coorte (tipo de
+    tratamento, número de frações). As linhas novas do espelho são incorporadas aos poucos
+    (inserção ordenada) e o percentil de um valor sai de duas buscas binárias. Os valores de cada
+    linha também ficam guardados, para trocar os de uma linha substituída na planilha e para tirar
+    o próprio plano do cálculo do seu percentil.
+    """
+
+    def __init__(self, espelho):
+        self.espelho = espelho
+        self.valores = {}  # (tipo, frações) -> {métrica: array ordenado}
+        self.valores_linha = {}  # (aba, linha) -> (coorte, {métrica: valor})
+        self._ultima_linha = {}  # aba -> última linha do espelho já incorporada
+        self._versao_cabecalho = {}
+        self._trava = threading.Lock()
+
+    def _incorporar(self, tipo_tratamento, novas):
+        """Insere nos arrays ordenados os valores das linhas (DataFrame do espelho, indexado pela linha)."""
+        if "Fracionamento" in novas:
+            fracoes = numeros_da_coluna(novas["Fracionamento"])
+        else:
+            fracoes = np.full(len(novas), np.nan)
+        colunas = {
+            coluna: numeros_da_coluna(novas[coluna]) for coluna in novas.columns if coluna not in COLUNAS_IDENTIFICACAO
+        }
+
+        for i, linha in enumerate(novas.index):
+            coorte = (tipo_tratamento, None if np.isnan(fracoes[i]) else int(fracoes[i]))
+            valores = {metrica: float(numeros[i]) for metrica, numeros in colunas.items() if not np.isnan(numeros[i])}
+            self.valores_linha[(tipo_tratamento, int(linha))] = (coorte, valores)
+
+        for fracao in np.unique(fracoes):
+            mascara = np.isnan(fracoes) if np.isnan(fracao) else fracoes == fracao
+            coorte = (tipo_tratamento, None if np.isnan(fracao) else int(fracao))
+            por_metrica = self.valores.setdefault(coorte, {})
+            for metrica, numeros in colunas.items():
+                novos = numeros[mascara]
+                novos = np.sort(novos[~np.isnan(novos)])
+                if not len(novos):
+                    continue
+                atuais = por_metrica.get(metrica, np.empty(0))
+                por_metrica[metrica] = np.insert(atuais, np.searchsorted(atuais, novos), novos)
+
+    def _retirar(self, tipo_tratamento, linha):
+        """Tira dos arrays ordenados os valores já incorporados de uma linha."""
+        coorte, valores = self.valores_linha.pop((tipo_tratamento, linha), (None, {}))
+        por_metrica = self.valores.get(coorte, {})
+        for metrica, valor in valores.items():
+            atuais = por_metrica.get(metrica)
+            i = np.searchsorted(atuais, valor) if atuais is not None else 0
+            if atuais is not None and i < len(atuais) and atuais[i] == valor:
+                por_metrica[metrica] = np.delete(atuais, i)
+
+    def atualizar(self, tipo_tratamento):
+        """Incorpora as linhas do espelho ainda não vistas; retorna quantas foram incorporadas."""
+        estado = self.espelho.estado(tipo_tratamento)
+        if estado is None:
+            return 0
+
+        with self._trava:
+            # Espelho refeito (colunas movidas na planilha): o histórico da aba é recalculado
+            if self._versao_cabecalho.get(tipo_tratamento) != estado["versao_cabecalho"]:
+                for coorte in [c for c in self.valores if c[0] == tipo_tratamento]:
+                    del self.valores[coorte]
+                for chave in [c for c in self.valores_linha if c[0] == tipo_tratamento]:
+                    del self.valores_linha[chave]
+                self._ultima_linha[tipo_tratamento] = 0
+                self._versao_cabecalho[tipo_tratamento] = estado["versao_cabecalho"]
+
+            novas = self.espelho.tabela(tipo_tratamento, apos_linha=self._ultima_linha[tipo_tratamento])
+            if novas.empty:
+                return 0
+            self._incorporar(tipo_tratamento, novas)
+            self._ultima_linha[tipo_tratamento] = int(novas.index.max())
+            return len(novas)
+
+    def atualizar_linha(self, tipo_tratamento, linha):
+        """
+        Relê do espelho uma linha já incorporada que foi reescrita (plano substituído na planilha),
+        trocando os valores antigos pelos novos. Linhas ainda não incorporadas ficam para atualizar().
+        """
+        with self._trava:
+            if linha > self._ultima_linha.get(tipo_tratamento, 0):
+                return
+            self._retirar(tipo_tratamento, linha)
+            relida = self.espelho.tabela(tipo_tratamento, apos_linha=linha - 1, ate_linha=linha)
+            if not relida.empty:
+                self._incorporar(tipo_tratamento, relida)
+
+    def percentil(self, tipo_tratamento, n_fracoes, metrica, valor, linha_propria=None):
+        """
+        Percentil (0-100) do valor entre os planos anteriores da coorte e o número de planos, ou
+        None se a métrica não tiver histórico suficiente. Valores empatados contam pela metade.
+        linha_propria é a linha da planilha em que o próprio plano já foi gravado (se houver), que
+        fica fora da comparação.
+        """
+        if valor is None:
+            return None
+        with self._trava:
+            valores = self.valores.get((tipo_tratamento, n_fracoes), {}).get(metrica)
+            coorte_propria, valores_proprios = self.valores_linha.get((tipo_tratamento, linha_propria), (None, {}))
+        if valores is None:
+            return None
+        abaixo = np.searchsorted(valores, valor, side="left")
+        iguais = np.searchsorted(valores, valor, side="right") - abaixo
+        n_planos = len(valores)
+
+        # O próprio plano sai da contagem, do lado em que estiver
+        if coorte_propria == (tipo_tratamento, n_fracoes) and metrica in valores_proprios:
+            n_planos -= 1
+            if valores_proprios[metrica] < valor:
+                abaixo -= 1
+            elif valores_proprios[metrica] == valor:
+                iguais -= 1
+        if n_planos < MINIMO_PLANOS:
+            return None
+        return 100.0 * (abaixo + 0.5 * iguais) / n_planos, n_planos
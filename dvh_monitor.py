@@ -0,0 +1,235 @@
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from dvh_motor import ESTRUTURAS_PADRAO, FormatoDVHInvalido, TIPOS_TRATAMENTO, analisar_conteudo_dvh, hash_conteudo
+from dvh_resultados import CAMINHO_BANCO, ArmazemResultados, chave_parametros
+
+# ------------------------- Monitor de pasta de exportação -------------------------
+# bloco de código para analisar automaticamente os DVHs exportados pelo TPS para uma pasta
+
+# Eventos do inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+TAMANHO_EVENTO = struct.calcsize("iIII")
+
+
+class ObservadorInotify:
+    """Recebe do kernel (inotify) os nomes dos arquivos criados ou alterados na pasta."""
+
+    def __init__(self, pasta):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        mascara = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(pasta), mascara) < 0:
+            erro = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(erro, f"inotify_add_watch falhou para {pasta}")
+
+    def aguardar(self, timeout):
+        """Espera até timeout segundos e retorna o conjunto de nomes de arquivos com eventos."""
+        prontos, _, _ = select.select([self._fd], [], [], timeout)
+        if not prontos:
+            return set()
+
+        nomes = set()
+        try:
+            dados = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return nomes
+        posicao = 0
+        while posicao + TAMANHO_EVENTO <= len(dados):
+            _, _, _, tamanho = struct.unpack_from("iIII", dados, posicao)
+            nome = dados[posicao + TAMANHO_EVENTO:posicao + TAMANHO_EVENTO + tamanho].rstrip(b"\0")
+            if nome:
+                nomes.add(os.fsdecode(nome))
+            posicao += TAMANHO_EVENTO + tamanho
+        return nomes
+
+    def fechar(self):
+        os.close(self._fd)
+
+
+class ObservadorPolling:
+    """Alternativa ao inotify: compara tamanho e data de modificação dos arquivos a cada intervalo."""
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self._estado = self._ler_estado()
+
+    def _ler_estado(self):
+        estado = {}
+        with os.scandir(self.pasta) as entradas:
+            for entrada in entradas:
+                if entrada.is_file():
+                    info = entrada.stat()
+                    estado[entrada.name] = (info.st_size, info.st_mtime_ns)
+        return estado
+
+    def aguardar(self, timeout):
+        time.sleep(timeout)
+        novo_estado = self._ler_estado()
+        nomes = {nome for nome, assinatura in novo_estado.items() if self._estado.get(nome) != assinatura}
+        self._estado = novo_estado
+        return nomes
+
+    def fechar(self):
+        pass
+
+
+def criar_observador(pasta, polling=False):
+    """Usa o inotify quando disponível (Linux) e, caso contrário, o polling."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return ObservadorInotify(pasta)
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify indisponível ({e}); usando polling.")
+    return ObservadorPolling(pasta)
+
+
+class MonitorPasta:
+    """
+    Analisa cada DVH novo da pasta com o motor de dvh_motor.py e guarda o resultado no banco local.
+    Um arquivo só é lido depois de ficar `espera` segundos sem mudar de tamanho ou data (arquivo
+    ainda sendo gravado). Arquivos cujo conteúdo (hash) já foi analisado com sucesso com os mesmos
+    parâmetros são ignorados, o que permite reiniciar o monitor sem reprocessar a pasta. Os arquivos
+    recusados por formato inválido ficam registrados pelo tamanho e data de modificação e só são
+    lidos de novo quando mudam; os que terminaram em outro erro são tentados de novo.
+    """
+
+    def __init__(self, pasta, tipo_tratamento, estruturas=None, n_fracoes=None, armazem=None,
+                 espera=2.0, intervalo=1.0, polling=False, extensoes=(".txt",)):
+        self.pasta = os.path.abspath(pasta)
+        self.tipo_tratamento = tipo_tratamento
+        self.estruturas = {**ESTRUTURAS_PADRAO, **(estruturas or {})}
+        self.n_fracoes = n_fracoes
+        self.parametros = chave_parametros(tipo_tratamento, self.estruturas, n_fracoes)
+        self.armazem = armazem or ArmazemResultados()
+        self.espera = espera
+        self.intervalo = intervalo
+        self.extensoes = extensoes
+        self.observador = criar_observador(self.pasta, polling)
+        self.pendentes = {}  # caminho -> (instante da última mudança, (tamanho, mtime))
+
+    def _assinatura(self, caminho):
+        try:
+            info = os.stat(caminho)
+        except FileNotFoundError:
+            return None
+        return info.st_size, info.st_mtime_ns
+
+    def agendar(self, nome):
+        if not nome.lower().endswith(self.extensoes):
+            return
+        caminho = os.path.join(self.pasta, nome)
+        self.pendentes[caminho] = (time.monotonic(), self._assinatura(caminho))
+
+    def processar_estaveis(self):
+        """Processa os arquivos pendentes que não mudaram durante o tempo de espera."""
+        agora = time.monotonic()
+        for caminho, (instante, assinatura) in list(self.pendentes.items()):
+            if agora - instante < self.espera:
+                continue
+            atual = self._assinatura(caminho)
+            if atual is None:
+                del self.pendentes[caminho]  # arquivo removido ou renomeado
+            elif atual != assinatura:
+                self.pendentes[caminho] = (agora, atual)  # ainda sendo gravado
+            else:
+                del self.pendentes[caminho]
+                self.processar(caminho)
+
+    def processar(self, caminho):
+        """Analisa um arquivo e registra o resultado; retorna o status gravado no índice (ou None)."""
+        assinatura = self._assinatura(caminho)
+        if assinatura is not None and self.armazem.falha_registrada(caminho, self.parametros, *assinatura):
+            return None
+        try:
+            with open(caminho, "rb") as f:
+                conteudo = f.read()
+        except OSError as e:
+            print(f"❌ {caminho}: {e}")
+            return None
+
+        hash_arquivo = hash_conteudo(conteudo)
+        if self.armazem.ja_processado(hash_arquivo, self.parametros):
+            return None
+
+        try:
+            resultado = analisar_conteudo_dvh(conteudo, self.tipo_tratamento, self.estruturas, self.n_fracoes)
+        except FormatoDVHInvalido:
+            status = "formato_invalido"
+            if assinatura is not None:
+                self.armazem.registrar_falha(caminho, self.parametros, *assinatura)
+            print(f"⚠️ {os.path.basename(caminho)}: formato do DVH incorreto")
+        except Exception as e:
+            status = "erro"
+            print(f"❌ {os.path.basename(caminho)}: erro ao analisar ({e})")
+        else:
+            status = "ok"
+            self.armazem.guardar_resultado(hash_arquivo, self.parametros, resultado)
+            print(f"✅ {os.path.basename(caminho)}: {resultado['nome_paciente']} ({resultado['id_paciente']}) analisado")
+
+        self.armazem.marcar_processado(hash_arquivo, caminho, status)
+        return status
+
+    def executar(self, parar=None):
+        """Laço principal; `parar` é uma função opcional que encerra o laço quando retorna True."""
+        # Arquivos já presentes na pasta (exportados com o monitor parado)
+        with os.scandir(self.pasta) as entradas:
+            for entrada in entradas:
+                if entrada.is_file():
+                    self.agendar(entrada.name)
+
+        try:
+            while not (parar and parar()):
+                for nome in self.observador.aguardar(self.intervalo):
+                    self.agendar(nome)
+                self.processar_estaveis()
+        finally:
+            self.observador.fechar()
+
+
+# ------------------------- Linha de comando -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitora uma pasta e analisa os DVHs exportados pelo TPS.")
+    parser.add_argument("pasta", help="Pasta para onde o TPS exporta os DVHs tabulados")
+    parser.add_argument("--tipo", default=TIPOS_TRATAMENTO[0], choices=TIPOS_TRATAMENTO)
+    parser.add_argument("--fracoes", type=int, choices=[1, 3, 5], help="Número de frações (SRS)")
+    for chave, nome in ESTRUTURAS_PADRAO.items():
+        parser.add_argument(f"--{chave}", default=nome, help=f"Nome da estrutura ({nome})")
+    parser.add_argument("--banco", default=CAMINHO_BANCO, help="Banco SQLite local de resultados")
+    parser.add_argument("--espera", type=float, default=2.0, help="Segundos sem alteração antes de ler o arquivo")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="Intervalo de verificação [s]")
+    parser.add_argument("--polling", action="store_true", help="Não usar inotify")
+    args = parser.parse_args()
+
+    # O número de frações só é usado (e registrado) no SRS; o padrão da página é 1
+    n_fracoes = (args.fracoes or 1) if args.tipo == "SRS (Radiocirurgia)" else None
+
+    monitor = MonitorPasta(
+        args.pasta, args.tipo,
+        estruturas={chave: getattr(args, chave) for chave in ESTRUTURAS_PADRAO},
+        n_fracoes=n_fracoes,
+        armazem=ArmazemResultados(args.banco),
+        espera=args.espera, intervalo=args.intervalo, polling=args.polling,
+    )
+    print(f"👀 Monitorando {monitor.pasta} ({type(monitor.observador).__name__})")
+    try:
+        monitor.executar()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,778 @@
+import hashlib
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from dvh_biologico import (
+    ALFA_BETA_PADRAO, GRANDEZAS, REFERENCIAS_RADIONECROSE, eqd2, rotulo_eqd2, validar_alfa_beta, volumes_acima,
+)
+from dvh_curvas import (
+    calcular_metricas_curvas,
+    cumulativa_de_diferencial,
+    decodificar_tabela,
+    formato_dvh,
+    separar_estruturas,
+)
+from dvh_estruturas import IndiceEstruturas, resolver_estruturas
+
+# ------------------------- Configuração -------------------------
+
+TIPOS_TRATAMENTO = ["SRS (Radiocirurgia)", "SBRT de Pulmão", "SBRT de Próstata"]
+
+# Nomes padrão das estruturas no DVH (os mesmos sugeridos na interface)
+ESTRUTURAS_PADRAO = {
+    "ptv": "PTV",
+    "body": "Body",
+    "overlap": "Overlap",
+    "iso50": "Dose 50[%]",
+    "pulmao": "Pulmões - PTV",
+    "encefalo": "Encefalo",
+}
+
+# Limiares de dose física [Gy] dos volumes de radionecrose (SRS)
+LIMIARES_RADIONECROSE_GY = (10, 12, 18, 20, 24, 30)
+# Limiares mostrados para cada fracionamento do SRS
+LIMIARES_POR_FRACIONAMENTO = {1: (10, 12), 3: (18, 20), 5: (24, 30)}
+
+# Valores ideais dos índices (mostrados junto de cada métrica)
+VALORES_IDEAIS = {
+    'CI1 (isodose100/PTV)': 1,
+    'CI2 (Overlap/isodose100)': 1,
+    'CI3 (Overlap/PTV)': 1,
+    'CI4 (Paddick)': 1,
+    'HI1 (Dmax_PTV/Dmin_PTV)': 1,
+    'HI2 (Dmax_PTV/D_prescricao)': 1,
+    'HI3 ((D2-D98)/D_prescricao)': 0,
+    'HI4 ((D5-D95)/D_prescricao)': 0,
+    'HI5 (S-índex)': 0,
+    'Gn (Dose integral[PTV]/Dose integral[V50%])': 1,
+}
+
+# Blocos de índices, na ordem em que são mostrados
+BLOCOS_METRICAS = {
+    "🔹 Índices de Conformidade": [
+        'CI1 (isodose100/PTV)',
+        'CI2 (Overlap/isodose100)',
+        'CI3 (Overlap/PTV)',
+        'CI4 (Paddick)'
+    ],
+    "🔹 Índices de Homogeneidade": [
+        'HI1 (Dmax_PTV/Dmin_PTV)',
+        'HI2 (Dmax_PTV/D_prescricao)',
+        'HI3 ((D2-D98)/D_prescricao)',
+        'HI4 ((D5-D95)/D_prescricao)',
+        'HI5 (S-índex)'
+    ],
+    "🔹 Índices de Gradiente": [
+        'GI1 (isodose50/isodose100)',
+        'GI2 (raio50/raio100)',
+        'GI3 (isodose50/PTV)'
+    ],
+    "🔹 Índice de Eficiência Global": [
+        'Gn (Dose integral[PTV]/Dose integral[V50%])'
+    ]
+}
+
+# Versão do cálculo: aumentar sempre que a análise mudar (métricas novas ou calculadas de outro
+# modo), para que os resultados guardados no banco local (dvh_resultados.py) sejam refeitos
+VERSAO_ANALISE = 3
+
+CABECALHO_TABELA_DVH = "dose [cgy]   dose relativa [%] volume da estrutura [cm³]"
+# DVH diferencial: volume por cGy ou por bin (convertido para cumulativo na leitura)
+CABECALHOS_TABELA_DIFERENCIAL = (
+    "dose [cgy]   dose relativa [%] volume da estrutura [cm³/cgy]",
+    CABECALHO_TABELA_DVH,
+)
+
+
+class FormatoDVHInvalido(ValueError):
+    """O arquivo não é um DVH tabulado (cumulativo ou diferencial) com dose e volume absolutos."""
+
+
+# ------------------------- Funções auxiliares -------------------------
+# bloco de código para coleta de dados
+
+def extrair_dados_paciente(caminho_arquivo):
+    """Lê as duas primeiras linhas do arquivo DVH e retorna apenas o conteúdo após ':'."""
+    try:
+        with open(caminho_arquivo, "r", encoding="utf-8") as f:
+            linhas = f.readlines()
+
+            # Extrai e limpa o nome do paciente
+            if len(linhas) > 0:
+                nome_paciente = linhas[0].strip()
+                if ":" in nome_paciente:
+                    nome_paciente = nome_paciente.split(":", 1)[1].strip()
+            else:
+                nome_paciente = "Nome não encontrado"
+
+            # Extrai e limpa o ID do paciente
+            if len(linhas) > 1:
+                id_paciente = linhas[1].strip()
+                if ":" in id_paciente:
+                    id_paciente = id_paciente.split(":", 1)[1].strip()
+            else:
+                id_paciente = "ID não encontrado"
+
+        return nome_paciente, id_paciente
+
+    except Exception:
+        return "Nome não encontrado", "ID não encontrado"
+
+def extrair_volume_dose_100(filepath, nome_body):
+    return extrair_volume_para_dose_relativa(filepath, alvo_dose=100.0, estrutura_alvo=nome_body)
+
+def extrair_volume_dose_50(filepath, nome_body):
+    return extrair_volume_para_dose_relativa(filepath, alvo_dose=50.0, estrutura_alvo=nome_body)
+
+def extrair_volume_dose_10gy(filepath, estrutura_alvo):
+    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=1000.0, estrutura_alvo=estrutura_alvo)
+
+def extrair_volume_dose_12gy(filepath, estrutura_alvo):
+    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=1200.0, estrutura_alvo=estrutura_alvo)
+
+def extrair_volume_dose_18gy(filepath, estrutura_alvo):
+    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=1800.0, estrutura_alvo=estrutura_alvo)
+
+def extrair_volume_dose_20gy(filepath, estrutura_alvo):
+    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=2000.0, estrutura_alvo=estrutura_alvo)
+
+def extrair_volume_dose_24gy(filepath, estrutura_alvo):
+    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=2400.0, estrutura_alvo=estrutura_alvo)
+
+def extrair_volume_dose_30gy(filepath, estrutura_alvo):
+    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=3000.0, estrutura_alvo=estrutura_alvo)
+
+def extrair_volume_ptv(filepath, nome_ptv):
+    return extrair_volume_por_estrutura(filepath, estrutura_alvo=nome_ptv.strip().lower())
+
+def extrair_volume_overlap(filepath, nome_overlap):
+    return extrair_volume_por_estrutura(filepath, estrutura_alvo=nome_overlap.strip().lower())
+
+def extrair_dose_max_body(filepath, nome_body):
+    return extrair_dado_numerico_por_estrutura(filepath, estrutura_alvo=nome_body.strip().lower(), chave="dose máx")
+
+# Novas funções para PTV (mín/máx)
+def extrair_dose_max_ptv(filepath, nome_ptv):
+    return extrair_dado_numerico_por_estrutura(filepath, estrutura_alvo=nome_ptv.strip().lower(), chave="dose máx")
+
+def extrair_dose_min_ptv(filepath, nome_ptv):
+    return extrair_dado_numerico_por_estrutura(filepath, estrutura_alvo=nome_ptv.strip().lower(), chave="dose mín")
+
+
+def extrair_dose_prescricao(filepath):
+    with open(filepath, 'r', encoding='utf-8') as file:
+        for linha in file:
+            if linha.lower().strip().startswith("dose total"):
+                try:
+                    valor = linha.split(":", 1)[-1].strip().replace(',', '.')
+                    return float(valor)
+                except ValueError:
+                    return None
+    return None
+
+
+def _blocos_arquivo(filepath):
+    """
+    Blocos do arquivo separados por estrutura, com o índice dos nomes (dvh_estruturas.py), montados
+    uma vez por arquivo: a análise consulta o mesmo arquivo várias vezes, então o resultado fica
+    guardado pela assinatura do arquivo (caminho, tamanho e data de modificação).
+    """
+    info = os.stat(filepath)
+    assinatura = (os.path.abspath(filepath), info.st_size, info.st_mtime_ns)
+    arquivo = _cache_blocos.obter(assinatura)
+    if arquivo is None:
+        with open(filepath, 'r', encoding='utf-8') as file:
+            texto = file.read()
+        blocos = separar_estruturas(texto)
+        por_nome = {}
+        for nome, dados, tabela in blocos:
+            por_nome.setdefault(nome.lower(), []).append((dados, tabela))
+        arquivo = {
+            "blocos": por_nome,
+            "indice": IndiceEstruturas(nome for nome, _, _ in blocos),
+            "tabelas": {},  # tabelas já decodificadas, por nome
+            "formato": formato_dvh(texto),  # (diferencial, volume por cGy)
+            "eixos": {},  # eixos de dose BED/EQD2, por (nome, frações, α/β, grandeza)
+        }
+        _cache_blocos.guardar(assinatura, arquivo)
+    return arquivo
+
+
+def indice_estruturas(filepath):
+    """Índice dos nomes das estruturas presentes no arquivo DVH."""
+    return _blocos_arquivo(filepath)["indice"]
+
+
+def _ler_bloco_estrutura(filepath, estrutura_alvo):
+    """
+    Separa as linhas da estrutura alvo: as linhas de dados antes da tabela (Volume, Dose máx, ...)
+    e a tabela DVH, decodificada em bloco por decodificar_tabela (array N x 3, somente leitura,
+    com dose [cGy], dose relativa [%] e volume [cm³]). Tabelas diferenciais saem já cumulativas.
+    """
+    arquivo = _blocos_arquivo(filepath)
+    chave = estrutura_alvo.strip().lower()
+    blocos = arquivo["blocos"].get(chave, [])
+
+    linhas_dados = [linha.strip() for dados, _ in blocos for linha in dados.splitlines()]
+    tabela = arquivo["tabelas"].get(chave)
+    if tabela is None:
+        diferencial, volume_por_dose = arquivo["formato"]
+        if diferencial:
+            # Cada bloco (ex.: mesma estrutura em planos diferentes) é convertido separadamente:
+            # a soma acumulada não pode passar de um bloco para o outro
+            tabelas = [cumulativa_de_diferencial(decodificar_tabela(texto), volume_por_dose) for _, texto in blocos]
+            tabela = np.concatenate(tabelas) if tabelas else np.empty((0, 3))
+        else:
+            tabela = decodificar_tabela("\n".join(texto for _, texto in blocos))
+        tabela.flags.writeable = False
+        arquivo["tabelas"][chave] = tabela
+    return linhas_dados, tabela
+
+
+def tabela_dvh(filepath, estrutura_alvo):
+    """
+    Tabela DVH cumulativa (N x 3, somente leitura) da estrutura, a mesma já decodificada para a
+    análise; array vazio se a estrutura não estiver no arquivo.
+    """
+    return _ler_bloco_estrutura(filepath, estrutura_alvo)[1]
+
+
+def extrair_volume_por_estrutura(filepath, estrutura_alvo):
+    """
+    Extrai o volume da estrutura alvo (PTV, BODY, etc.) a partir da primeira linha da tabela DVH,
+    logo abaixo do cabeçalho 'Volume da estrutura [cm³]'.
+    """
+    _, tabela = _ler_bloco_estrutura(filepath, estrutura_alvo)
+    return float(tabela[0, 2]) if len(tabela) else None
+
+
+def extrair_dado_numerico_por_estrutura(filepath, estrutura_alvo, chave):
+    linhas_dados, _ = _ler_bloco_estrutura(filepath, estrutura_alvo)
+
+    for linha in linhas_dados:
+        if linha.lower().startswith(chave.lower()):
+            try:
+                valor_str = linha.split(":", 1)[-1].strip().replace(',', '.')
+                return float(valor_str)
+            except ValueError:
+                continue
+
+    return None
+
+
+def extrair_volume_para_dose_relativa(filepath, alvo_dose, estrutura_alvo=None):
+    return _extrair_volume_por_coluna(filepath, alvo_dose, coluna="relativa", estrutura_alvo=estrutura_alvo)
+
+
+def extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy, estrutura_alvo=None):
+    """
+    Extrai o volume (cm³) da estrutura especificada que recebe uma dose absoluta
+    maior ou igual ao valor fornecido (em cGy). Suporta tanto 'Estrutura:' (PT-BR)
+    quanto 'Structure:' (EN).
+    """
+    if not estrutura_alvo:
+        return None
+
+    try:
+        _, tabela = _ler_bloco_estrutura(filepath, estrutura_alvo)
+    except Exception:
+        return None
+
+    # Se não encontrou dados para a estrutura alvo
+    if not len(tabela):
+        return None
+
+    # Encontra o primeiro volume com dose >= alvo
+    indices = np.flatnonzero(tabela[:, 0] >= alvo_dose_cgy)
+    return float(tabela[indices[0], 2]) if len(indices) else None
+
+
+def extrair_volumes_para_doses_absolutas(filepath, doses_cgy, estrutura_alvo=None):
+    """
+    Volumes (cm³) da estrutura que recebem pelo menos cada uma das doses absolutas (cGy), todos em uma
+    única busca sobre a tabela. None para doses acima da tabela ou estrutura não encontrada.
+    """
+    if not estrutura_alvo:
+        return [None] * len(doses_cgy)
+
+    try:
+        _, tabela = _ler_bloco_estrutura(filepath, estrutura_alvo)
+    except Exception:
+        return [None] * len(doses_cgy)
+
+    if not len(tabela):
+        return [None] * len(doses_cgy)
+    volumes = volumes_acima(tabela[:, 0], tabela[:, 2], doses_cgy)
+    return [None if np.isnan(v) else float(v) for v in volumes]
+
+
+def eixo_dose_biologica(filepath, estrutura_alvo, n_fracoes, alfa_beta=ALFA_BETA_PADRAO, grandeza="eqd2"):
+    """
+    Eixo de dose da tabela DVH da estrutura convertido para BED ou EQD2 [cGy] (array somente leitura).
+    Fica guardado junto aos blocos do arquivo por (estrutura, frações, α/β, grandeza).
+    """
+    arquivo = _blocos_arquivo(filepath)
+    chave = (estrutura_alvo.strip().lower(), n_fracoes, float(alfa_beta), grandeza)
+    eixo = arquivo["eixos"].get(chave)
+    if eixo is None:
+        _, tabela = _ler_bloco_estrutura(filepath, estrutura_alvo)
+        eixo = GRANDEZAS[grandeza](tabela[:, 0], n_fracoes, alfa_beta)
+        eixo.flags.writeable = False
+        arquivo["eixos"][chave] = eixo
+    return eixo
+
+
+def calcular_volumes_eqd2(filepath, estrutura_alvo, n_fracoes, alfa_beta=ALFA_BETA_PADRAO,
+                          referencias=REFERENCIAS_RADIONECROSE):
+    """
+    Volumes (cm³) da estrutura acima do EQD2 de cada referência (dose física [cGy], frações), com o
+    eixo de dose do plano convertido para EQD2 no seu próprio fracionamento. Os limiares de 1, 3 e 5
+    frações passam a ser comparáveis em qualquer plano.
+    """
+    if not estrutura_alvo or not n_fracoes:
+        return {}
+    _, tabela = _ler_bloco_estrutura(filepath, estrutura_alvo)
+    if not len(tabela):
+        return {}
+
+    doses = np.array([dose for dose, _ in referencias], dtype=float)
+    fracoes = np.array([n for _, n in referencias], dtype=float)
+    limiares = eqd2(doses, fracoes, alfa_beta)
+    volumes = volumes_acima(eixo_dose_biologica(filepath, estrutura_alvo, n_fracoes, alfa_beta), tabela[:, 2], limiares)
+    return {
+        rotulo_eqd2(dose, n, alfa_beta): None if np.isnan(volume) else float(volume)
+        for (dose, n), volume in zip(referencias, volumes)
+    }
+
+
+def _extrair_volume_por_coluna(filepath, alvo_dose, coluna="relativa", estrutura_alvo=None):
+    if estrutura_alvo is None:
+        estrutura_alvo = ESTRUTURAS_PADRAO["body"]
+    _, tabela = _ler_bloco_estrutura(filepath, estrutura_alvo)
+    if not len(tabela):
+        return None
+
+    doses = tabela[:, 0] if coluna == "absoluta" else tabela[:, 1]
+    volumes = tabela[:, 2]
+
+    # Dose exata; senão, a dose imediatamente acima do alvo
+    exatas = np.flatnonzero(doses == alvo_dose)
+    if len(exatas):
+        return float(volumes[exatas[0]])
+
+    acima = np.flatnonzero(doses > alvo_dose)
+    if not len(acima):
+        return None
+    return float(volumes[acima[np.argmin(doses[acima] - alvo_dose)]])
+
+
+# Nova função: extrair dose que cobre X% do volume do PTV
+# pct em 0-1 (ex.: 0.02 para 2%)
+def extrair_dose_cobrindo_pct_ptv(filepath, pct, volume_ptv, nome_ptv):
+    if volume_ptv is None:
+        return None
+
+    alvo_volume = pct * volume_ptv
+    _, tabela = _ler_bloco_estrutura(filepath, nome_ptv)  # linhas (dose_cgy, dose_rel, volume_cm3)
+    if not len(tabela):
+        return None
+    doses, volumes = tabela[:, 0], tabela[:, 2]
+
+    # Procurar a maior volume <= alvo_volume (imediatamente inferior)
+    candidatos = np.flatnonzero(volumes <= alvo_volume)
+    if len(candidatos):
+        # escolher o que tiver maior volume (mais próximo por baixo)
+        return float(doses[candidatos[np.argmax(volumes[candidatos])]])
+
+    # Se não houver volume <= alvo (ex.: alvo muito pequeno), escolher o menor volume disponível (maior dose)
+    return float(doses[np.argmin(volumes)])
+
+
+def extrair_dose_media_ptv(filepath, nome_ptv):
+    """Extrai a dose média [cGy] da estrutura PTV."""
+    return extrair_dado_numerico_por_estrutura(filepath, nome_ptv, chave="dose média [cgy]:")
+
+
+def extrair_std_ptv(filepath, nome_ptv):
+    """Extrai o desvio-padrão [cGy] (STD) da estrutura PTV."""
+    return extrair_dado_numerico_por_estrutura(filepath, nome_ptv, chave="std [cgy]:")
+
+def extrair_dose_media_iso50(filepath, nome_iso50):
+    """Extrai a dose média [cGy] da estrutura Dose 50[%]."""
+    return extrair_dado_numerico_por_estrutura(filepath, nome_iso50, chave="dose média [cgy]:")
+
+def calcular_v20gy_pulmao(filepath, nome_pulmao):
+    """
+    Calcula o percentual do volume do pulmão que recebe acima de 20 Gy (V20Gy)
+    e retorna também o volume absoluto (cm³), com alta precisão.
+    """
+
+    volume_total = None
+    volume_acima_20gy = None
+    linhas_dados, tabela = _ler_bloco_estrutura(filepath, nome_pulmao)
+
+    # Coleta volume total do pulmão (linhas antes da tabela de DVH)
+    for linha in linhas_dados:
+        if "volume [cm³]:" in linha.lower():
+            try:
+                volume_total = float(linha.split(":", 1)[-1].strip().replace(",", "."))
+                break
+            except ValueError:
+                pass
+
+    # Usa comparação numérica com tolerância para evitar erros de formatação
+    if len(tabela):
+        indices = np.flatnonzero(np.abs(tabela[:, 0] - 2000.0) < 0.05)  # tolerância de 0.05 cGy
+        if len(indices):
+            volume_acima_20gy = float(tabela[indices[0], 2])
+
+    if volume_total is not None and volume_acima_20gy is not None:
+        v20gy = (volume_acima_20gy / volume_total) * 100
+        return v20gy, volume_acima_20gy
+    else:
+        return None, None
+
+
+# bloco de código para o cálculo das métricas IC,IG,IH e Paddick e demais métricas pedidas
+
+def calcular_metricas_avancadas(dose_prescricao, dose_max_body, dose_max_ptv, dose_min_ptv,
+                                 volume_ptv, volume_overlap, volume_iso100, volume_iso50,
+                                 d2_ptv, d5_ptv, d95_ptv, d98_ptv,
+                                 dose_media_ptv=None, dose_std_ptv=None, dose_media_iso50=None):
+    metricas = {}
+
+    # Índice de Conformidade (CI1)
+    if volume_ptv and volume_iso100:
+        metricas['CI1 (isodose100/PTV)'] = volume_iso100 / volume_ptv
+    else:
+        metricas['CI1 (isodose100/PTV)'] = None
+
+    # CI2 = Overlap / isodose100
+    if volume_overlap is not None and volume_iso100:
+        metricas['CI2 (Overlap/isodose100)'] = volume_overlap / volume_iso100
+    else:
+        metricas['CI2 (Overlap/isodose100)'] = None
+
+    # CI3 = Overlap / PTV
+    if volume_overlap is not None and volume_ptv:
+        metricas['CI3 (Overlap/PTV)'] = volume_overlap / volume_ptv
+    else:
+        metricas['CI3 (Overlap/PTV)'] = None
+
+    # CI4 (Paddick) = Overlap² / (PTV * isodose100)
+    if volume_overlap is not None and volume_ptv and volume_iso100:
+        metricas['CI4 (Paddick)'] = (volume_overlap**2)/(volume_ptv*volume_iso100)
+    else:
+        metricas['CI4 (Paddick)'] = None
+
+    # Índices de Gradiente
+    if volume_iso50 and volume_iso100:
+        metricas['GI1 (isodose50/isodose100)'] = volume_iso50 / volume_iso100
+    else:
+        metricas['GI1 (isodose50/isodose100)'] = None
+
+    # Raios efetivos
+    try:
+        r_iso100 = ((3 * volume_iso100) / (4 * math.pi)) ** (1.0 / 3.0) if volume_iso100 else None
+        r_iso50 = ((3 * volume_iso50) / (4 * math.pi)) ** (1.0 / 3.0) if volume_iso50 else None
+
+        # GI2 = raio50 / raio100
+        if r_iso50 is not None and r_iso100 is not None:
+            metricas['GI2 (raio50/raio100)'] = r_iso50 / r_iso100
+        else:
+            metricas['GI2 (raio50/raio100)'] = None
+            
+    except Exception:
+        metricas['Raio efetivo isodose100 (cm)'] = None
+        metricas['Raio efetivo isodose50 (cm)'] = None
+        metricas['GI2 (raio50/raio100)'] = None
+
+    # GI3 = volume isodose50 / volume PTV
+    if volume_iso50 and volume_ptv:
+        metricas['GI3 (isodose50/PTV)'] = volume_iso50 / volume_ptv
+    else:
+        metricas['GI3 (isodose50/PTV)'] = None
+
+    # Índices de Homogeneidade
+    if dose_max_ptv is not None and dose_min_ptv is not None and dose_min_ptv != 0:
+        metricas['HI1 (Dmax_PTV/Dmin_PTV)'] = dose_max_ptv / dose_min_ptv
+    else:
+        metricas['HI1 (Dmax_PTV/Dmin_PTV)'] = None
+
+    if dose_max_ptv is not None and dose_prescricao is not None and dose_prescricao != 0:
+        metricas['HI2 (Dmax_PTV/D_prescricao)'] = dose_max_ptv / dose_prescricao
+    else:
+        metricas['HI2 (Dmax_PTV/D_prescricao)'] = None
+
+    # HI3 = (D2 - D98) / D_prescricao
+    if d2_ptv is not None and d98_ptv is not None and dose_prescricao is not None and dose_prescricao != 0:
+        metricas['HI3 ((D2-D98)/D_prescricao)'] = (d2_ptv - d98_ptv) / dose_prescricao
+    else:
+        metricas['HI3 ((D2-D98)/D_prescricao)'] = None
+
+    # HI4 = (D5 - D95) / D_prescricao
+    if d5_ptv is not None and d95_ptv is not None and dose_prescricao is not None and dose_prescricao != 0:
+        metricas['HI4 ((D5-D95)/D_prescricao)'] = (d5_ptv - d95_ptv) / dose_prescricao
+    else:
+        metricas['HI4 ((D5-D95)/D_prescricao)'] = None
+
+    # HI5 (S-index) = (STD_PTV / Dose_prescricao) * 100
+    # e Dose média PTV (%) = (Dose_média_PTV / Dose_prescricao) * 100
+    if dose_std_ptv is not None and dose_prescricao:
+        metricas['HI5 (S-índex)'] = (dose_std_ptv / dose_prescricao) * 100
+    else:
+        metricas['HI5 (S-índex)'] = None
+    
+    if dose_media_ptv is not None and dose_prescricao:
+        metricas['Dose média PTV (%)'] = (dose_media_ptv / dose_prescricao) * 100
+    else:
+        metricas['Dose média PTV (%)'] = None
+
+    # Índice de Eficiência Global (Gn)
+    if (
+        dose_media_ptv is not None and volume_ptv is not None
+        and dose_media_iso50 is not None and volume_iso50 is not None
+        and dose_media_iso50 != 0 and volume_iso50 != 0
+    ):
+        metricas['Gn (Dose integral[PTV]/Dose integral[V50%])'] = (
+            (dose_media_ptv * volume_ptv) / (dose_media_iso50 * volume_iso50)
+        )
+    else:
+        metricas['Gn (Dose integral[PTV]/Dose integral[V50%])'] = None
+    
+    return metricas
+
+
+# ------------------------- Validação do arquivo -------------------------
+
+def validar_formato_dvh(caminho_arquivo):
+    """Verifica se o DVH é cumulativo ou diferencial e se a tabela tem dose absoluta e volume absoluto."""
+    tipo_ok = False
+    diferencial = False
+    cabecalho_ok = False
+
+    try:
+        with open(caminho_arquivo, "r", encoding="utf-8") as f:
+            linhas = f.readlines()
+
+        # --- Verifica o campo "Tipo:"
+        for linha in linhas:
+            if linha.lower().startswith("tipo:"):
+                if "histograma de dose volume cumulativo" in linha.lower():
+                    tipo_ok = True
+                elif "histograma de dose volume diferencial" in linha.lower():
+                    tipo_ok = diferencial = True
+                break  # encontrou a linha "Tipo:"
+
+        # --- Verifica o cabeçalho do DVH
+        for linha in linhas:
+            if "Dose" in linha and "Volume" in linha:
+                texto = linha.strip().lower()
+                if diferencial:
+                    cabecalho_ok = texto in CABECALHOS_TABELA_DIFERENCIAL
+                elif texto == CABECALHO_TABELA_DVH:
+                    cabecalho_ok = True
+                break
+
+    except Exception:
+        return False
+
+    return tipo_ok and cabecalho_ok
+
+
+# ------------------------- Análise completa de um plano -------------------------
+
+def montar_volumes(tipo_tratamento, coletas, n_fracoes=None):
+    """Monta o dicionário de doses e volumes no formato das colunas da planilha."""
+    volumes = {
+        "Dose de prescrição (cGy)": coletas["dose_prescricao"],
+        "Dose máxima Body (cGy)": coletas["dose_max_body"],
+        "Dose máxima PTV (cGy)": coletas["dose_max_ptv"],
+        "Dose mínima PTV (cGy)": coletas["dose_min_ptv"],
+        "Dose média PTV (cGy)": coletas["dose_media_ptv"],
+        "STD PTV (cGy)": coletas["dose_std_ptv"],
+        "D2% do PTV (cGy)": coletas["d2_ptv"],
+        "D5% do PTV (cGy)": coletas["d5_ptv"],
+        "D95% do PTV (cGy)": coletas["d95_ptv"],
+        "D98% do PTV (cGy)": coletas["d98_ptv"],
+        "Dose média Isodose 50% (cGy)": coletas["dose_media_iso50"],
+        "Volume PTV (cm³)": coletas["volume_ptv"],
+        "Volume Overlap (cm³)": coletas["volume_overlap"],
+        "Volume Isodose 100% (cm³)": coletas["volume_iso100"],
+        "Volume Isodose 50% (cm³)": coletas["volume_iso50"],
+    }
+
+    # Adiciona volumes específicos conforme tipo de tratamento
+    if tipo_tratamento == "SRS (Radiocirurgia)":
+        volumes.update({
+            "Volume >10 Gy (cm³)": coletas["volume_10gy"],
+            "Volume >12 Gy (cm³)": coletas["volume_12gy"],
+            "Volume >18 Gy (cm³)": coletas["volume_18gy"],
+            "Volume >20 Gy (cm³)": coletas["volume_20gy"],
+            "Volume >24 Gy (cm³)": coletas["volume_24gy"],
+            "Volume >30 Gy (cm³)": coletas["volume_30gy"],
+            "Fracionamento": n_fracoes,
+        })
+
+    elif tipo_tratamento == "SBRT de Pulmão":
+        volumes.update({
+            "Volume Pulmões Soma (cm³)": coletas["volume_pulmao"],
+            "Volume Pulmões Soma >20 Gy (cm³)": coletas["volume_pulmao_20gy"],
+            "V20Gy Pulmões Soma (%)": coletas["v20gy_pulmao"],
+        })
+
+    return volumes
+
+
+def analisar_dvh(caminho_arquivo, tipo_tratamento, estruturas=None, n_fracoes=None, alfa_beta=ALFA_BETA_PADRAO):
+    """
+    Executa todas as coletas e métricas de um arquivo DVH já validado. As estruturas são
+    informadas como {"ptv", "body", "overlap", "iso50", "pulmao", "encefalo"} -> nome no DVH;
+    as ausentes usam ESTRUTURAS_PADRAO. Cada nome é procurado pelo índice de dvh_estruturas.py e
+    'estruturas' no retorno traz os nomes encontrados no arquivo. Retorna os dados do paciente, os
+    valores coletados ('coletas'), as métricas ('metricas'), as métricas calculadas das curvas
+    ('metricas_curvas'), os volumes no formato da planilha ('volumes') e, no SRS, os volumes acima
+    dos limiares de radionecrose em EQD2 com o α/β informado ('volumes_eqd2').
+    """
+    if tipo_tratamento not in TIPOS_TRATAMENTO:
+        raise ValueError(f"Tipo de tratamento desconhecido: {tipo_tratamento}")
+    alfa_beta = validar_alfa_beta(alfa_beta)
+
+    estruturas = {**ESTRUTURAS_PADRAO, **(estruturas or {})}
+    # Nomes informados -> nomes como estão no arquivo (outra grafia, acentos ou aliases da instituição)
+    estruturas = resolver_estruturas(indice_estruturas(caminho_arquivo), tipo_tratamento, estruturas)
+    nome_ptv = estruturas["ptv"]
+    nome_body = estruturas["body"]
+    nome_pulmao = estruturas["pulmao"] if tipo_tratamento == "SBRT de Pulmão" else None
+    estrutura_dose = estruturas["encefalo"] if tipo_tratamento == "SRS (Radiocirurgia)" else nome_body
+
+    nome_paciente, id_paciente = extrair_dados_paciente(caminho_arquivo)
+
+    # Coletas
+    coletas = {
+        "dose_prescricao": extrair_dose_prescricao(caminho_arquivo),
+        "dose_max_body": extrair_dose_max_body(caminho_arquivo, nome_body),
+        "dose_max_ptv": extrair_dose_max_ptv(caminho_arquivo, nome_ptv),
+        "dose_min_ptv": extrair_dose_min_ptv(caminho_arquivo, nome_ptv),
+        "dose_media_ptv": extrair_dose_media_ptv(caminho_arquivo, nome_ptv),
+        "dose_std_ptv": extrair_std_ptv(caminho_arquivo, nome_ptv),
+        "dose_media_iso50": extrair_dose_media_iso50(caminho_arquivo, estruturas["iso50"]),
+        "volume_ptv": extrair_volume_ptv(caminho_arquivo, nome_ptv),
+        "volume_overlap": extrair_volume_overlap(caminho_arquivo, estruturas["overlap"]),
+        "volume_iso100": extrair_volume_dose_100(caminho_arquivo, nome_body),
+        "volume_iso50": extrair_volume_dose_50(caminho_arquivo, nome_body),
+    }
+
+    # Volumes acima dos limiares de radionecrose, todos em uma busca sobre a tabela da estrutura
+    volumes_limiares = extrair_volumes_para_doses_absolutas(
+        caminho_arquivo, [gy * 100.0 for gy in LIMIARES_RADIONECROSE_GY], estrutura_dose
+    )
+    coletas.update({f"volume_{gy}gy": volume for gy, volume in zip(LIMIARES_RADIONECROSE_GY, volumes_limiares)})
+
+    # Doses que cobrem X% do PTV (em cGy)
+    for rotulo, pct in (("d2_ptv", 0.02), ("d5_ptv", 0.05), ("d95_ptv", 0.95), ("d98_ptv", 0.98)):
+        coletas[rotulo] = extrair_dose_cobrindo_pct_ptv(caminho_arquivo, pct, coletas["volume_ptv"], nome_ptv)
+
+    # --- V20Gy do Pulmão (somente para SBRT de Pulmão) ---
+    if nome_pulmao:
+        coletas["v20gy_pulmao"], coletas["volume_pulmao_20gy"] = calcular_v20gy_pulmao(caminho_arquivo, nome_pulmao)
+        coletas["volume_pulmao"] = extrair_volume_por_estrutura(caminho_arquivo, nome_pulmao)
+    else:
+        coletas["v20gy_pulmao"], coletas["volume_pulmao_20gy"], coletas["volume_pulmao"] = None, None, None
+
+    # Métricas principais (estendidas)
+    metricas = calcular_metricas_avancadas(
+        coletas["dose_prescricao"], coletas["dose_max_body"], coletas["dose_max_ptv"], coletas["dose_min_ptv"],
+        coletas["volume_ptv"], coletas["volume_overlap"], coletas["volume_iso100"], coletas["volume_iso50"],
+        coletas["d2_ptv"], coletas["d5_ptv"], coletas["d95_ptv"], coletas["d98_ptv"],
+        coletas["dose_media_ptv"], coletas["dose_std_ptv"], coletas["dose_media_iso50"]
+    )
+
+    # Métricas tiradas diretamente das curvas cumulativas já lidas (sem estruturas auxiliares)
+    metricas_curvas = calcular_metricas_curvas(
+        _ler_bloco_estrutura(caminho_arquivo, nome_ptv)[1], _ler_bloco_estrutura(caminho_arquivo, nome_body)[1]
+    )
+
+    return {
+        "nome_paciente": nome_paciente,
+        "id_paciente": id_paciente,
+        "tipo_tratamento": tipo_tratamento,
+        "n_fracoes": n_fracoes,
+        "estruturas": estruturas,
+        "coletas": coletas,
+        "metricas": metricas,
+        "metricas_curvas": metricas_curvas,
+        "volumes": montar_volumes(tipo_tratamento, coletas, n_fracoes),
+        "alfa_beta": alfa_beta,
+        "volumes_eqd2": calcular_volumes_eqd2(caminho_arquivo, estrutura_dose, n_fracoes, alfa_beta)
+        if tipo_tratamento == "SRS (Radiocirurgia)" else {},
+    }
+
+
+# ------------------------- Cache de planos analisados -------------------------
+
+def hash_conteudo(conteudo):
+    """Hash SHA-256 do conteúdo (bytes) de um arquivo DVH."""
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+class CachePlanos:
+    """Cache LRU, seguro entre threads, dos resultados de análise indexados pelo hash do arquivo e pelos parâmetros."""
+
+    def __init__(self, capacidade=128):
+        self.capacidade = capacidade
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave):
+        with self._trava:
+            if chave not in self._itens:
+                return None
+            self._itens.move_to_end(chave)
+            return self._itens[chave]
+
+    def guardar(self, chave, valor):
+        with self._trava:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+
+_cache_planos = CachePlanos()
+_cache_blocos = CachePlanos(capacidade=4)  # blocos por estrutura e índice de nomes dos últimos arquivos lidos
+
+
+def analisar_conteudo_dvh(conteudo, tipo_tratamento, estruturas=None, n_fracoes=None, alfa_beta=ALFA_BETA_PADRAO,
+                          cache=_cache_planos):
+    """
+    Analisa um DVH recebido em memória (bytes). Arquivos já analisados com os mesmos parâmetros
+    são servidos do cache; o dicionário retornado é compartilhado e não deve ser alterado.
+    Levanta FormatoDVHInvalido se o arquivo não estiver no formato esperado.
+    """
+    estruturas = {**ESTRUTURAS_PADRAO, **(estruturas or {})}
+    alfa_beta = validar_alfa_beta(alfa_beta)
+    chave = (hash_conteudo(conteudo), tipo_tratamento, tuple(sorted(estruturas.items())), n_fracoes, alfa_beta)
+    resultado = cache.obter(chave)
+    if resultado is not None:
+        return resultado
+
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(conteudo)
+        caminho = tmp.name
+    try:
+        if not validar_formato_dvh(caminho):
+            raise FormatoDVHInvalido(
+                "O formato do DVH está incorreto: exporte o DVH cumulativo (ou diferencial) com dose absoluta e volume absoluto."
+            )
+        resultado = analisar_dvh(caminho, tipo_tratamento, estruturas, n_fracoes, alfa_beta)
+    finally:
+        os.unlink(caminho)
+
+    cache.guardar(chave, resultado)
+    return resultado
@@ -0,0 +1,285 @@
+import json
+import math
+import numbers
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+from gspread.utils import a1_to_rowcol
+
+from dvh_resultados import CAMINHO_BANCO, conectar
+
+# ------------------------- Índice de envios à planilha -------------------------
+# bloco de código para evitar que o mesmo plano seja adicionado mais de uma vez à planilha
+
+
+class IndiceEnvios:
+    """
+    Índice local (SQLite) dos planos já enviados à planilha. A chave é o hash do arquivo DVH,
+    o ID do paciente e o tipo de tratamento (aba); o valor é a linha em que o plano foi gravado.
+    """
+
+    def __init__(self, caminho_banco=CAMINHO_BANCO):
+        self.caminho_banco = caminho_banco
+        with conectar(caminho_banco) as conexao:
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS envios ("
+                " hash TEXT, id_paciente TEXT, tipo_tratamento TEXT, linha INTEGER, enviado_em TEXT,"
+                " PRIMARY KEY (hash, id_paciente, tipo_tratamento))"
+            )
+
+    def obter_linha(self, hash_arquivo, id_paciente, tipo_tratamento):
+        """Retorna a linha da planilha em que o plano foi gravado, ou None se ainda não foi enviado."""
+        with conectar(self.caminho_banco) as conexao:
+            linha = conexao.execute(
+                "SELECT linha FROM envios WHERE hash = ? AND id_paciente = ? AND tipo_tratamento = ?",
+                (hash_arquivo, id_paciente, tipo_tratamento),
+            ).fetchone()
+        return linha[0] if linha else None
+
+    def registrar(self, hash_arquivo, id_paciente, tipo_tratamento, linha):
+        with conectar(self.caminho_banco) as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO envios VALUES (?, ?, ?, ?, ?)",
+                (hash_arquivo, id_paciente, tipo_tratamento, linha, datetime.now().isoformat(timespec="seconds")),
+            )
+
+
+def linha_da_resposta(resposta):
+    """Extrai o número da linha gravada da resposta de append_row (ex.: "'SRS'!A12:AF12" -> 12)."""
+    intervalo = resposta["updates"]["updatedRange"]
+    inicio = intervalo.rsplit("!", 1)[-1].split(":")[0]
+    return a1_to_rowcol(inicio)[0]
+
+
+# ------------------------- Espelho local da planilha -------------------------
+# bloco de código para consultar o histórico (e o cabeçalho) de cada aba sem ler a planilha inteira:
+# cada sincronização busca somente as linhas adicionadas depois da última linha espelhada
+
+
+def texto_celula(valor):
+    """
+    Texto de uma célula no espelho. As linhas lidas da planilha (valores sem formatação) e as
+    gravadas pela própria aplicação passam por aqui, para ficarem iguais: números com todas as casas
+    e ponto decimal (inteiros sem ".0", como a API os devolve), vazio para None.
+    """
+    if valor is None:
+        return ""
+    if isinstance(valor, numbers.Real) and not isinstance(valor, bool):
+        numero = float(valor)
+        if math.isfinite(numero) and numero.is_integer():
+            return str(int(numero))
+        return repr(numero)
+    return str(valor)
+
+
+class EspelhoPlanilha:
+    """
+    Cópia local (SQLite) das abas da planilha. Para cada aba guarda o cabeçalho, a versão do
+    cabeçalho (incrementada quando ele muda), a última linha sincronizada e as linhas em si.
+    """
+
+    def __init__(self, caminho_banco=CAMINHO_BANCO):
+        self.caminho_banco = caminho_banco
+        with conectar(caminho_banco) as conexao:
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS espelho_abas ("
+                " aba TEXT PRIMARY KEY, cabecalho TEXT, versao_cabecalho INTEGER,"
+                " ultima_linha INTEGER, sincronizado_em TEXT)"
+            )
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS espelho_linhas ("
+                " aba TEXT, linha INTEGER, valores TEXT, PRIMARY KEY (aba, linha))"
+            )
+
+    def estado(self, aba):
+        """Cabeçalho, versão do cabeçalho, última linha sincronizada e data da sincronização (ou None)."""
+        with conectar(self.caminho_banco) as conexao:
+            linha = conexao.execute(
+                "SELECT cabecalho, versao_cabecalho, ultima_linha, sincronizado_em FROM espelho_abas WHERE aba = ?",
+                (aba,),
+            ).fetchone()
+        if linha is None:
+            return None
+        return {
+            "cabecalho": json.loads(linha[0]),
+            "versao_cabecalho": linha[1],
+            "ultima_linha": linha[2],
+            "sincronizado_em": datetime.fromisoformat(linha[3]),
+        }
+
+    def cabecalho(self, aba):
+        estado = self.estado(aba)
+        return estado["cabecalho"] if estado else None
+
+    def desatualizado(self, aba, validade=timedelta(minutes=10)):
+        """True se a aba nunca foi sincronizada ou se a última sincronização é mais antiga que a validade."""
+        estado = self.estado(aba)
+        return estado is None or datetime.now() - estado["sincronizado_em"] > validade
+
+    def _salvar_estado(self, conexao, aba, cabecalho, versao, ultima_linha):
+        conexao.execute(
+            "INSERT OR REPLACE INTO espelho_abas VALUES (?, ?, ?, ?, ?)",
+            (aba, json.dumps(cabecalho, ensure_ascii=False), versao, ultima_linha,
+             datetime.now().isoformat(timespec="seconds")),
+        )
+
+    def sincronizar(self, ws, completo=False):
+        """
+        Busca, em uma única leitura, o cabeçalho e as linhas abaixo da última linha espelhada
+        (valores sem a formatação da planilha, com datas como texto). Se o cabeçalho mudou de ordem
+        (colunas movidas ou apagadas), a aba é espelhada de novo por inteiro. Retorna o número de
+        linhas novas.
+        """
+        anterior = self.estado(ws.title)
+        estado = None if completo else anterior
+        inicio = estado["ultima_linha"] + 1 if estado else 2
+        intervalos = ["1:1"] + ([f"{inicio}:{ws.row_count}"] if inicio <= ws.row_count else [])
+        resposta = ws.batch_get(
+            intervalos, value_render_option="UNFORMATTED_VALUE", date_time_render_option="FORMATTED_STRING"
+        )
+        cabecalho = [texto_celula(v) for v in resposta[0][0]] if resposta and resposta[0] else []
+        novas = [[texto_celula(v) for v in linha] for linha in resposta[1]] if len(resposta) > 1 else []
+
+        if estado and cabecalho[:len(estado["cabecalho"])] != estado["cabecalho"]:
+            return self.sincronizar(ws, completo=True)
+
+        if anterior is None:
+            versao = 1
+        else:
+            versao = anterior["versao_cabecalho"] + (cabecalho != anterior["cabecalho"])
+
+        with conectar(self.caminho_banco) as conexao:
+            if completo:
+                conexao.execute("DELETE FROM espelho_linhas WHERE aba = ?", (ws.title,))
+            conexao.executemany(
+                "INSERT OR REPLACE INTO espelho_linhas VALUES (?, ?, ?)",
+                [(ws.title, inicio + i, json.dumps(valores, ensure_ascii=False))
+                 for i, valores in enumerate(novas) if any(valores)],
+            )
+            ultima_linha = inicio + len(novas) - 1 if novas else (estado["ultima_linha"] if estado else 1)
+            self._salvar_estado(conexao, ws.title, cabecalho, versao, ultima_linha)
+        return len(novas)
+
+    def registrar_cabecalho(self, aba, cabecalho):
+        """Atualiza o cabeçalho espelhado após a própria aplicação alterá-lo na planilha."""
+        estado = self.estado(aba)
+        if estado is None or estado["cabecalho"] == cabecalho:
+            return
+        with conectar(self.caminho_banco) as conexao:
+            self._salvar_estado(conexao, aba, cabecalho, estado["versao_cabecalho"] + 1, estado["ultima_linha"])
+
+    def registrar_linha(self, aba, linha, valores):
+        """
+        Grava no espelho uma linha escrita pela aplicação. Uma linha logo abaixo da última espelhada
+        avança o espelho; uma linha mais abaixo (outra pessoa gravou no meio tempo) fica para a
+        próxima sincronização.
+        """
+        estado = self.estado(aba)
+        if estado is None or linha > estado["ultima_linha"] + 1:
+            return
+        with conectar(self.caminho_banco) as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO espelho_linhas VALUES (?, ?, ?)",
+                (aba, linha, json.dumps([texto_celula(v) for v in valores], ensure_ascii=False)),
+            )
+            if linha == estado["ultima_linha"] + 1:
+                conexao.execute(
+                    "UPDATE espelho_abas SET ultima_linha = ? WHERE aba = ?", (linha, aba)
+                )
+
+    def tabela(self, aba, apos_linha=0, ate_linha=None):
+        """
+        Linhas espelhadas da aba como DataFrame de textos (colunas = cabeçalho), indexado pela linha.
+        Com apos_linha, somente as linhas abaixo dela (para quem acompanha o espelho aos poucos);
+        com ate_linha, somente até ela.
+        """
+        estado = self.estado(aba)
+        if estado is None:
+            return pd.DataFrame()
+        with conectar(self.caminho_banco) as conexao:
+            linhas = conexao.execute(
+                "SELECT linha, valores FROM espelho_linhas WHERE aba = ? AND linha > ? AND linha <= ? ORDER BY linha",
+                (aba, apos_linha, estado["ultima_linha"] if ate_linha is None else ate_linha),
+            ).fetchall()
+
+        cabecalho = estado["cabecalho"]
+        valores = []
+        for _, texto in linhas:
+            linha = json.loads(texto)[:len(cabecalho)]
+            valores.append(linha + [""] * (len(cabecalho) - len(linha)))
+        return pd.DataFrame(valores, columns=cabecalho, index=[numero for numero, _ in linhas])
+
+
+# ------------------------- Gravação de um plano -------------------------
+# bloco de código com a escrita de uma linha na aba, separado da página para poder ser testado
+# contra a planilha em memória (dvh_planilha_falsa.py)
+
+# As sessões atendidas pelo mesmo processo gravam uma de cada vez: duas gravações simultâneas na aba
+# vazia criariam o cabeçalho duas vezes (e na aba com colunas novas, as colunas duas vezes)
+_TRAVA_GRAVACAO = threading.Lock()
+
+
+def gravar_plano(ws, dados, espelho=None, linha_existente=None):
+    """
+    Grava o plano ({coluna: valor}) na aba, na ordem do cabeçalho (lido do espelho local, se houver),
+    acrescentando ao final as colunas que faltarem. Com linha_existente (plano já enviado), essa
+    linha é substituída se ainda for do mesmo paciente; senão, o plano vai para uma linha nova.
+    Retorna (situação, linha gravada), com situação "cabecalho" (aba vazia: cabeçalho criado),
+    "substituida" ou "nova".
+    """
+    with _TRAVA_GRAVACAO:
+        aba = ws.title
+
+        # Lê o cabeçalho atual (primeira linha) do espelho local; a planilha só é consultada
+        # (cabeçalho e linhas novas, em uma leitura) quando o espelho está desatualizado
+        if espelho is not None:
+            if espelho.desatualizado(aba):
+                espelho.sincronizar(ws)
+            cabecalho = espelho.cabecalho(aba)
+        else:
+            cabecalho = ws.row_values(1)
+
+        # Se a planilha estiver vazia (sem cabeçalho), escreve o cabeçalho e os valores
+        if not cabecalho:
+            ws.insert_row(list(dados.keys()), index=1)
+            ws.insert_row(list(dados.values()), index=2)
+            if espelho is not None:
+                espelho.registrar_cabecalho(aba, list(dados.keys()))
+                espelho.registrar_linha(aba, 2, list(dados.values()))
+            return "cabecalho", 2
+
+        # Garante que todas as novas métricas apareçam no cabeçalho (em novas colunas se necessário)
+        novos_campos = [campo for campo in dados.keys() if campo not in cabecalho]
+        if novos_campos and espelho is not None:
+            # Antes de mudar a estrutura da aba, o cabeçalho é conferido na planilha: outra pessoa pode
+            # ter incluído ou movido colunas depois da última sincronização do espelho
+            espelho.sincronizar(ws)
+            cabecalho = espelho.cabecalho(aba)
+            novos_campos = [campo for campo in dados.keys() if campo not in cabecalho]
+        if novos_campos:
+            # Uma coluna por campo novo, com o nome do campo na primeira linha
+            ws.insert_cols([[campo] for campo in novos_campos], col=len(cabecalho) + 1)
+            cabecalho = cabecalho + novos_campos
+            if espelho is not None:
+                espelho.registrar_cabecalho(aba, cabecalho)
+
+        # Cria uma lista de valores na ordem correta do cabeçalho
+        valores_linha = [dados.get(c, "") for c in cabecalho]
+
+        # Plano duplicado: substitui a linha registrada, se ela ainda for do mesmo paciente
+        # (linhas podem ter sido apagadas ou reordenadas manualmente na planilha)
+        situacao = None
+        if linha_existente and "ID do Paciente" in cabecalho:
+            coluna_id = cabecalho.index("ID do Paciente") + 1
+            if ws.cell(linha_existente, coluna_id).value == str(dados.get("ID do Paciente")):
+                ws.update(values=[valores_linha], range_name=f"A{linha_existente}")
+                situacao, linha = "substituida", linha_existente
+
+        # Adiciona a nova linha de valores (abaixo das existentes)
+        if situacao is None:
+            situacao, linha = "nova", linha_da_resposta(ws.append_row(valores_linha))
+
+        if espelho is not None:
+            espelho.registrar_linha(aba, linha, valores_linha)
+        return situacao, linha
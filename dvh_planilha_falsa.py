@@ -0,0 +1,175 @@
+import threading
+
+import gspread
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol, rowcol_to_a1
+
+# ------------------------- Planilha falsa (testes) -------------------------
+# bloco de código que imita, em memória, a parte da API do gspread usada pela aplicação, para
+# testar a gravação e o espelho local sem acessar o Google Sheets. Cada aba conta as chamadas
+# recebidas (leituras e escritas), como a cota da API.
+
+
+class CelulaFalsa:
+    def __init__(self, valor):
+        self.value = valor
+
+
+def _bruto(valor):
+    """Valor guardado na célula: números continuam números (gravação RAW do gspread), None vira vazio."""
+    return "" if valor is None else valor
+
+
+def _formatado(valor, renderizacao=None):
+    """
+    Valor da célula como a API devolve. Sem formato (UNFORMATTED_VALUE), o próprio valor; formatado
+    (padrão), texto como em uma planilha em português com números de duas casas.
+    """
+    if renderizacao == "UNFORMATTED_VALUE" or isinstance(valor, str):
+        return valor
+    if isinstance(valor, float):
+        return f"{valor:.2f}".replace(".", ",")
+    return str(valor)
+
+
+class AbaFalsa:
+    def __init__(self, titulo, linhas=100, colunas=100):
+        self.title = titulo
+        self.row_count = linhas
+        self.col_count = colunas
+        self.linhas = []
+        self.chamadas = {}
+        self._trava = threading.RLock()
+
+    def _contar(self, metodo):
+        self.chamadas[metodo] = self.chamadas.get(metodo, 0) + 1
+
+    def _garantir(self, n_linhas):
+        while len(self.linhas) < n_linhas:
+            self.linhas.append([])
+        self.row_count = max(self.row_count, n_linhas)
+
+    def _intervalo(self, intervalo, renderizacao=None):
+        """Linhas de um intervalo A1 (valores como a API devolve), sem as linhas e colunas vazias do final."""
+        grade = a1_range_to_grid_range(intervalo.rsplit("!", 1)[-1])
+        inicio, fim = grade.get("startRowIndex", 0), grade.get("endRowIndex", len(self.linhas))
+        col_inicio, col_fim = grade.get("startColumnIndex", 0), grade.get("endColumnIndex")
+        valores = [[_formatado(v, renderizacao) for v in linha[col_inicio:col_fim]] for linha in self.linhas[inicio:fim]]
+        for linha in valores:
+            while linha and linha[-1] == "":
+                linha.pop()
+        while valores and not valores[-1]:
+            valores.pop()
+        return valores
+
+    # Leituras
+    def row_values(self, linha):
+        with self._trava:
+            self._contar("row_values")
+            return self._intervalo(f"{linha}:{linha}")[0] if linha <= len(self.linhas) else []
+
+    def cell(self, linha, coluna):
+        with self._trava:
+            self._contar("cell")
+            valores = self.linhas[linha - 1] if linha <= len(self.linhas) else []
+            return CelulaFalsa(_formatado(valores[coluna - 1]) if coluna <= len(valores) else None)
+
+    def get(self, intervalo):
+        with self._trava:
+            self._contar("get")
+            return self._intervalo(intervalo)
+
+    def batch_get(self, intervalos, value_render_option=None, date_time_render_option=None):
+        with self._trava:
+            self._contar("batch_get")
+            return [self._intervalo(intervalo, value_render_option) for intervalo in intervalos]
+
+    def get_all_values(self):
+        with self._trava:
+            self._contar("get_all_values")
+            return self._intervalo(f"1:{max(len(self.linhas), 1)}")
+
+    # Escritas
+    def insert_row(self, valores, index=1):
+        with self._trava:
+            self._contar("insert_row")
+            self._garantir(index - 1)
+            self.linhas.insert(index - 1, [_bruto(v) for v in valores])
+            self.row_count += 1
+
+    def insert_cols(self, colunas, col=1):
+        with self._trava:
+            self._contar("insert_cols")
+            for i, linha in enumerate(self.linhas):
+                while len(linha) < col - 1:
+                    linha.append("")
+                for coluna in reversed(colunas):
+                    linha.insert(col - 1, _bruto(coluna[i]) if i < len(coluna) else "")
+            self.col_count += len(colunas)
+
+    def update_cell(self, linha, coluna, valor):
+        with self._trava:
+            self._contar("update_cell")
+            self._garantir(linha)
+            valores = self.linhas[linha - 1]
+            while len(valores) < coluna:
+                valores.append("")
+            valores[coluna - 1] = _bruto(valor)
+
+    def update(self, values=None, range_name=None):
+        with self._trava:
+            self._contar("update")
+            linha, coluna = a1_to_rowcol(range_name.rsplit("!", 1)[-1].split(":")[0])
+            for i, valores in enumerate(values):
+                self._garantir(linha + i)
+                atual = self.linhas[linha + i - 1]
+                while len(atual) < coluna - 1 + len(valores):
+                    atual.append("")
+                atual[coluna - 1:coluna - 1 + len(valores)] = [_bruto(v) for v in valores]
+
+    def append_row(self, valores):
+        with self._trava:
+            self._contar("append_row")
+            # Como na API, a linha entra abaixo da última linha com dados
+            self.linhas = self._intervalo(f"1:{max(len(self.linhas), 1)}", "UNFORMATTED_VALUE")
+            self.linhas.append([_bruto(v) for v in valores])
+            n = len(self.linhas)
+            self.row_count = max(self.row_count, n)
+            return {"updates": {"updatedRange": f"'{self.title}'!A{n}:{rowcol_to_a1(n, len(valores))}"}}
+
+
+class PlanilhaFalsa:
+    def __init__(self):
+        self.abas = {}
+        self._trava = threading.Lock()
+
+    def worksheet(self, titulo):
+        with self._trava:
+            if titulo not in self.abas:
+                raise gspread.WorksheetNotFound(titulo)
+            return self.abas[titulo]
+
+    def worksheets(self):
+        return list(self.abas.values())
+
+    def add_worksheet(self, title, rows=100, cols=100):
+        with self._trava:
+            self.abas[title] = AbaFalsa(title, int(rows), int(cols))
+            return self.abas[title]
+
+
+class ClienteFalso:
+    """Substitui o cliente do gspread: open_by_key retorna sempre a mesma planilha em memória por chave."""
+
+    def __init__(self):
+        self.planilhas = {}
+        self._trava = threading.Lock()
+
+    def open_by_key(self, chave):
+        with self._trava:
+            return self.planilhas.setdefault(chave, PlanilhaFalsa())
+
+
+# Cliente único por processo: as sessões da aplicação atendidas pelo mesmo processo (no teste de carga,
+# as threads de um nível) gravam na mesma planilha em memória, como acontece com a planilha real;
+# processos diferentes têm planilhas separadas
+CLIENTE_PROCESSO = ClienteFalso()
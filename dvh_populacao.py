@@ -0,0 +1,213 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from dvh_curvas import ler_curvas_dvh, volume_relativo
+from dvh_estruturas import TABELA_ALIASES, IndiceEstruturas, aliases_do_papel
+
+# ------------------------- Estatística populacional de DVH -------------------------
+# bloco de código para agregação de curvas DVH de uma coorte de planos, um plano por vez
+
+PERCENTIS = (5, 25, 50, 75, 95)
+
+# Estruturas agregadas por padrão: papel na coorte -> nome da estrutura no DVH
+ESTRUTURAS_POPULACAO = {"PTV": "PTV", "Encefalo": "Encefalo"}
+
+# Grade de dose padrão [cGy]
+DOSE_MAX_PADRAO, PASSO_PADRAO = 6000.0, 10.0
+
+
+def grade_de_dose(dose_max_cgy, passo_cgy):
+    """Pontos da grade de dose comum da coorte, de 0 até dose_max_cgy [cGy]."""
+    return np.arange(0.0, dose_max_cgy + passo_cgy / 2, passo_cgy)
+
+
+class BandasPopulacionais:
+    """
+    Acumula as curvas DVH cumulativas (volume em % da estrutura) de vários planos do mesmo
+    tipo de tratamento em uma grade de dose comum. Para cada ponto da grade mantém a média e
+    a variância (Welford) e um histograma de volumes com n_classes faixas, usado para estimar
+    os percentis. A memória depende apenas da grade e de n_classes, não do tamanho da coorte.
+    """
+
+    def __init__(self, tipo_tratamento, dose_max_cgy=DOSE_MAX_PADRAO, passo_cgy=PASSO_PADRAO, n_classes=200):
+        self.tipo_tratamento = tipo_tratamento
+        self.grade = grade_de_dose(dose_max_cgy, passo_cgy)
+        self.n_classes = n_classes
+        self.estado = {}  # papel -> {"n", "media", "m2", "histograma"}
+
+    def _estado_papel(self, papel):
+        if papel not in self.estado:
+            self.estado[papel] = {
+                "n": 0,
+                "media": np.zeros(len(self.grade)),
+                "m2": np.zeros(len(self.grade)),
+                "histograma": np.zeros((len(self.grade), self.n_classes), dtype=np.uint32),
+            }
+        return self.estado[papel]
+
+    def adicionar_curva(self, papel, curva):
+        """Projeta uma curva (array N x 3 de dvh_curvas) na grade e atualiza as estatísticas."""
+        volume = np.interp(self.grade, curva[:, 0], volume_relativo(curva), right=0.0)
+        volume = np.clip(volume, 0.0, 100.0)
+        est = self._estado_papel(papel)
+
+        # Média e variância acumuladas (algoritmo de Welford)
+        est["n"] += 1
+        delta = volume - est["media"]
+        est["media"] += delta / est["n"]
+        est["m2"] += delta * (volume - est["media"])
+
+        # Histograma de volumes em cada ponto da grade
+        classes = np.minimum((volume / 100.0 * self.n_classes).astype(int), self.n_classes - 1)
+        est["histograma"][np.arange(len(self.grade)), classes] += 1
+
+    def adicionar_arquivo(self, caminho_arquivo, estruturas=None):
+        """
+        Lê um arquivo DVH e adiciona as estruturas {papel: nome} encontradas (com outra grafia ou
+        pelos aliases do tipo de tratamento, ver dvh_estruturas.py). Retorna os papéis adicionados.
+        """
+        estruturas = estruturas or ESTRUTURAS_POPULACAO
+        curvas = ler_curvas_dvh(caminho_arquivo)
+        indice = IndiceEstruturas(curvas)
+        adicionados = []
+        for papel, nome in estruturas.items():
+            encontrado = indice.resolver(nome, aliases_do_papel(TABELA_ALIASES, self.tipo_tratamento, papel.lower()))
+            curva = curvas.get(encontrado) if encontrado else None
+            if curva is not None and len(curva):
+                self.adicionar_curva(papel, curva)
+                adicionados.append(papel)
+        return adicionados
+
+    def percentis(self, papel, percentis=PERCENTIS):
+        """Estima os percentis de volume [%] em cada ponto da grade a partir do histograma."""
+        est = self.estado[papel]
+        histograma = est["histograma"]
+        acumulado = np.cumsum(histograma, axis=1)
+        linhas = np.arange(len(self.grade))
+        resultado = {}
+        for p in percentis:
+            alvo = p / 100.0 * est["n"]
+            classe = np.argmax(acumulado >= alvo, axis=1)
+            anterior = acumulado[linhas, classe] - histograma[linhas, classe]
+            # Interpolação linear dentro da classe
+            fracao = (alvo - anterior) / np.maximum(histograma[linhas, classe], 1)
+            resultado[p] = (classe + fracao) / self.n_classes * 100.0
+        return resultado
+
+    def tabela(self):
+        """Retorna as bandas de todos os papéis em formato longo (uma linha por ponto da grade)."""
+        tabelas = []
+        for papel, est in self.estado.items():
+            if est["n"] == 0:
+                continue
+            desvio = np.sqrt(est["m2"] / (est["n"] - 1)) if est["n"] > 1 else np.zeros(len(self.grade))
+            dados = {
+                "tipo_tratamento": self.tipo_tratamento,
+                "estrutura": papel,
+                "dose_cgy": self.grade,
+                "n": est["n"],
+                "media": est["media"],
+                "desvio": desvio,
+            }
+            for p, valores in self.percentis(papel).items():
+                dados[f"p{p}"] = valores
+            tabelas.append(pd.DataFrame(dados))
+
+        if not tabelas:
+            return pd.DataFrame()
+        return pd.concat(tabelas, ignore_index=True)
+
+    def exportar_csv(self, caminho_saida):
+        self.tabela().to_csv(caminho_saida, index=False)
+
+    def salvar_estado(self, caminho_estado):
+        """Salva o estado acumulado (.npz) para continuar a agregação em outra execução."""
+        arrays = {
+            "tipo_tratamento": np.array(self.tipo_tratamento),
+            "grade": self.grade,
+            "n_classes": np.array(self.n_classes),
+            "papeis": np.array(list(self.estado.keys())),
+        }
+        for i, est in enumerate(self.estado.values()):
+            arrays[f"n_{i}"] = np.array(est["n"])
+            arrays[f"media_{i}"] = est["media"]
+            arrays[f"m2_{i}"] = est["m2"]
+            arrays[f"histograma_{i}"] = est["histograma"]
+        with open(caminho_estado, "wb") as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def carregar_estado(cls, caminho_estado):
+        with np.load(caminho_estado) as dados:
+            bandas = cls(str(dados["tipo_tratamento"]), n_classes=int(dados["n_classes"]))
+            bandas.grade = dados["grade"]
+            for i, papel in enumerate(dados["papeis"]):
+                bandas.estado[str(papel)] = {
+                    "n": int(dados[f"n_{i}"]),
+                    "media": dados[f"media_{i}"],
+                    "m2": dados[f"m2_{i}"],
+                    "histograma": dados[f"histograma_{i}"],
+                }
+        return bandas
+
+
+# ------------------------- Linha de comando -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Bandas populacionais de DVH (média e percentis) de uma coorte de planos.")
+    parser.add_argument("arquivos", nargs="+", help="Arquivos .txt de DVH tabulado (cumulativo)")
+    parser.add_argument("--tipo", default="SRS (Radiocirurgia)", help="Tipo de tratamento da coorte")
+    parser.add_argument("--ptv", default=ESTRUTURAS_POPULACAO["PTV"], help="Nome da estrutura de PTV")
+    parser.add_argument("--encefalo", default=ESTRUTURAS_POPULACAO["Encefalo"], help="Nome da estrutura de Encéfalo")
+    parser.add_argument("--dose-max", type=float, help=f"Dose máxima da grade [cGy] (padrão: {DOSE_MAX_PADRAO:.0f}, ou a do estado)")
+    parser.add_argument("--passo", type=float, help=f"Passo da grade de dose [cGy] (padrão: {PASSO_PADRAO:.0f}, ou o do estado)")
+    parser.add_argument("--estado", help="Arquivo .npz do estado acumulado (carregado se existir e atualizado ao final)")
+    parser.add_argument("--saida", default="bandas_dvh.csv", help="Arquivo .csv com as bandas")
+    args = parser.parse_args()
+
+    if args.estado and os.path.exists(args.estado):
+        bandas = BandasPopulacionais.carregar_estado(args.estado)
+        if bandas.tipo_tratamento != args.tipo:
+            parser.error(f"O estado salvo pertence ao tipo de tratamento '{bandas.tipo_tratamento}'.")
+        # A grade do estado não muda: uma grade pedida diferente dela é um erro, não é ignorada
+        if args.dose_max is not None or args.passo is not None:
+            passo_estado = float(bandas.grade[1] - bandas.grade[0]) if len(bandas.grade) > 1 else 0.0
+            pedida = grade_de_dose(
+                args.dose_max if args.dose_max is not None else float(bandas.grade[-1]),
+                args.passo if args.passo is not None else passo_estado,
+            )
+            if pedida.shape != bandas.grade.shape or not np.allclose(pedida, bandas.grade):
+                parser.error(
+                    f"O estado salvo usa a grade de 0 a {bandas.grade[-1]:g} cGy com passo de {passo_estado:g} cGy; "
+                    "omita --dose-max/--passo ou use outro arquivo de estado."
+                )
+    else:
+        bandas = BandasPopulacionais(
+            args.tipo,
+            dose_max_cgy=DOSE_MAX_PADRAO if args.dose_max is None else args.dose_max,
+            passo_cgy=PASSO_PADRAO if args.passo is None else args.passo,
+        )
+
+    estruturas = {"PTV": args.ptv, "Encefalo": args.encefalo}
+    for caminho in args.arquivos:
+        try:
+            adicionados = bandas.adicionar_arquivo(caminho, estruturas)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"❌ {caminho}: {e}")
+            continue
+        if adicionados:
+            print(f"✅ {caminho}: {', '.join(adicionados)}")
+        else:
+            print(f"⚠️ {caminho}: nenhuma estrutura encontrada")
+
+    bandas.exportar_csv(args.saida)
+    if args.estado:
+        bandas.salvar_estado(args.estado)
+    print(f"📊 Bandas salvas em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
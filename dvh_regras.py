@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dvh_motor import TIPOS_TRATAMENTO
+
+# ------------------------- Protocolo de tolerâncias -------------------------
+# bloco de código para conferir as métricas de um plano (ou de uma coorte inteira) contra os
+# níveis de tolerância e de ação do protocolo da instituição
+
+# Códigos do resultado de cada regra
+OK, ALERTA, FALHA, SEM_DADO, NAO_SE_APLICA = 0, 1, 2, -1, -2
+ROTULOS_RESULTADO = {OK: "✅", ALERTA: "⚠️", FALHA: "❌", SEM_DADO: "—", NAO_SE_APLICA: ""}
+
+# Regras de exemplo. "limite" indica se a métrica deve ficar abaixo ("max") ou acima ("min") dos
+# níveis; entre a tolerância e a ação o resultado é alerta e além da ação é falha. "fracoes" vazio
+# vale para qualquer fracionamento. As métricas usam os nomes das colunas da planilha.
+REGRAS_PADRAO = [
+    {"tipo_tratamento": "SRS (Radiocirurgia)", "metrica": "CI4 (Paddick)", "limite": "min", "tolerancia": 0.85, "acao": 0.7},
+    {"tipo_tratamento": "SRS (Radiocirurgia)", "metrica": "GI1 (isodose50/isodose100)", "limite": "max", "tolerancia": 4.0, "acao": 5.0},
+    {"tipo_tratamento": "SRS (Radiocirurgia)", "fracoes": [1], "metrica": "Volume >12 Gy (cm³)", "limite": "max", "tolerancia": 10.0, "acao": 15.0},
+    {"tipo_tratamento": "SRS (Radiocirurgia)", "fracoes": [3], "metrica": "Volume >20 Gy (cm³)", "limite": "max", "tolerancia": 20.0, "acao": 30.0},
+    {"tipo_tratamento": "SRS (Radiocirurgia)", "fracoes": [5], "metrica": "Volume >24 Gy (cm³)", "limite": "max", "tolerancia": 20.0, "acao": 30.0},
+    {"tipo_tratamento": "SBRT de Pulmão", "metrica": "CI1 (isodose100/PTV)", "limite": "max", "tolerancia": 1.2, "acao": 1.5},
+    {"tipo_tratamento": "SBRT de Pulmão", "metrica": "V20Gy Pulmões Soma (%)", "limite": "max", "tolerancia": 10.0, "acao": 15.0},
+    {"tipo_tratamento": "SBRT de Próstata", "metrica": "CI1 (isodose100/PTV)", "limite": "max", "tolerancia": 1.2, "acao": 1.5},
+]
+
+# Protocolo da instituição (JSON com uma lista no formato de REGRAS_PADRAO), no lugar das regras de exemplo
+CAMINHO_PROTOCOLO = os.environ.get(
+    "DVH_PROTOCOLO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "protocolo.json")
+)
+
+
+def numeros_da_coluna(coluna):
+    """Converte uma coluna (números ou textos da planilha, com vírgula ou ponto decimal) em floats."""
+    if pd.api.types.is_numeric_dtype(coluna):
+        return coluna.to_numpy(dtype=float)
+    texto = coluna.astype(str).str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(texto, errors="coerce").to_numpy(dtype=float)
+
+
+class ProtocoloRegras:
+    """
+    Regras compiladas uma vez em arrays (uma posição por regra), avaliadas de uma só vez para todos
+    os planos de uma tabela: linhas = planos, colunas = métricas com os nomes da planilha, mais as
+    colunas 'tipo_tratamento' e 'Fracionamento' (ou o tipo informado para a tabela inteira).
+    """
+
+    def __init__(self, regras):
+        for regra in regras:
+            if regra["tipo_tratamento"] not in TIPOS_TRATAMENTO:
+                raise ValueError(f"Tipo de tratamento desconhecido na regra: {regra['tipo_tratamento']}")
+            if regra["limite"] not in ("max", "min"):
+                raise ValueError(f"Limite deve ser 'max' ou 'min': {regra}")
+            if (regra["acao"] - regra["tolerancia"]) * (1 if regra["limite"] == "max" else -1) < 0:
+                raise ValueError(f"Nível de ação mais restrito que o de tolerância: {regra}")
+
+        self.regras = list(regras)
+        self.metricas = list(dict.fromkeys(regra["metrica"] for regra in self.regras))
+        self.rotulos = [self.rotulo(regra) for regra in self.regras]
+        # A mesma regra em tipos de tratamento diferentes vira colunas distintas da matriz
+        repetidos = {r for r in self.rotulos if self.rotulos.count(r) > 1}
+        self.rotulos = [
+            f"{rotulo} ({regra['tipo_tratamento']})" if rotulo in repetidos else rotulo
+            for rotulo, regra in zip(self.rotulos, self.regras)
+        ]
+        if len(set(self.rotulos)) != len(self.rotulos):
+            raise ValueError("Há regras repetidas no protocolo.")
+
+        # Com o sinal, todas as regras ficam no sentido "valor <= nível"
+        self._coluna = np.array([self.metricas.index(regra["metrica"]) for regra in self.regras], dtype=int)
+        self._sinal = np.array([1.0 if regra["limite"] == "max" else -1.0 for regra in self.regras])
+        self._tolerancia = self._sinal * np.array([regra["tolerancia"] for regra in self.regras], dtype=float)
+        self._acao = self._sinal * np.array([regra["acao"] for regra in self.regras], dtype=float)
+        self._tipos = np.array([regra["tipo_tratamento"] for regra in self.regras], dtype=object)
+        self._fracoes = [tuple(regra.get("fracoes") or ()) for regra in self.regras]
+
+    @staticmethod
+    def rotulo(regra):
+        sentido = "≤" if regra["limite"] == "max" else "≥"
+        fracoes = f" [{'/'.join(str(f) for f in regra['fracoes'])} fx]" if regra.get("fracoes") else ""
+        return f"{regra['metrica']} {sentido} {regra['tolerancia']:g}{fracoes}"
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_PROTOCOLO):
+        """Usa o protocolo da instituição, se existir; senão, as regras de exemplo."""
+        if caminho and os.path.exists(caminho):
+            with open(caminho, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        return cls(REGRAS_PADRAO)
+
+    def avaliar(self, tabela, tipo_tratamento=None):
+        """
+        Retorna a matriz de resultados (DataFrame int8, mesmo índice da tabela, uma coluna por regra)
+        com OK, ALERTA, FALHA, SEM_DADO ou NAO_SE_APLICA.
+        """
+        n = len(tabela)
+        if "tipo_tratamento" in tabela:
+            tipos = tabela["tipo_tratamento"].to_numpy(dtype=object)
+        else:
+            tipos = np.full(n, tipo_tratamento, dtype=object)
+        fracoes = numeros_da_coluna(tabela["Fracionamento"]) if "Fracionamento" in tabela else np.full(n, np.nan)
+
+        valores = np.full((n, len(self.metricas)), np.nan)
+        for j, metrica in enumerate(self.metricas):
+            if metrica in tabela:
+                valores[:, j] = numeros_da_coluna(tabela[metrica])
+
+        # Planos x regras
+        x = valores[:, self._coluna] * self._sinal
+        codigos = np.where(x <= self._tolerancia, OK, np.where(x <= self._acao, ALERTA, FALHA)).astype(np.int8)
+        codigos[np.isnan(x)] = SEM_DADO
+
+        aplica = tipos[:, None] == self._tipos[None, :]
+        for k, fracoes_regra in enumerate(self._fracoes):
+            if fracoes_regra:
+                aplica[:, k] &= np.isin(fracoes, fracoes_regra)
+        codigos[~aplica] = NAO_SE_APLICA
+
+        return pd.DataFrame(codigos, index=tabela.index, columns=self.rotulos)
+
+    def avaliar_plano(self, resultado):
+        """Avalia um resultado de dvh_motor.analisar_dvh; retorna uma linha por regra aplicável."""
+        valores = {**resultado["metricas"], **resultado["volumes"], "Fracionamento": resultado.get("n_fracoes")}
+        tabela = pd.DataFrame([{**valores, "tipo_tratamento": resultado["tipo_tratamento"]}])
+        codigos = self.avaliar(tabela).iloc[0]
+
+        linhas = []
+        for regra, rotulo, codigo in zip(self.regras, self.rotulos, codigos):
+            if codigo == NAO_SE_APLICA:
+                continue
+            linhas.append({
+                "Regra": rotulo,
+                "Valor": valores.get(regra["metrica"]),
+                "Tolerância": regra["tolerancia"],
+                "Ação": regra["acao"],
+                "Resultado": ROTULOS_RESULTADO[int(codigo)],
+            })
+        return pd.DataFrame(linhas, columns=["Regra", "Valor", "Tolerância", "Ação", "Resultado"])
+
+
+def resumir(codigos):
+    """
+    Pior resultado de cada plano (FALHA > ALERTA > OK) e contagem de planos por regra. Um plano sem
+    nenhuma regra avaliada fica com SEM_DADO (alguma regra se aplica, mas falta a métrica) ou
+    NAO_SE_APLICA (nenhuma regra para o seu tipo e fracionamento).
+    """
+    sem_avaliacao = np.where((codigos == SEM_DADO).any(axis=1), SEM_DADO, NAO_SE_APLICA)
+    pior = codigos.where(codigos >= OK).max(axis=1).fillna(pd.Series(sem_avaliacao, index=codigos.index))
+    pior = pior.astype(np.int8)
+    contagem = pd.DataFrame({
+        "ok": (codigos == OK).sum(),
+        "alerta": (codigos == ALERTA).sum(),
+        "falha": (codigos == FALHA).sum(),
+        "sem dado": (codigos == SEM_DADO).sum(),
+    })
+    return pior, contagem
+
+
+# ------------------------- Linha de comando -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Confere planos já registrados (CSV exportado da planilha) contra o protocolo.")
+    parser.add_argument("tabela", help="CSV com uma linha por plano e as colunas da planilha")
+    parser.add_argument("--tipo", choices=TIPOS_TRATAMENTO, help="Tipo de tratamento (se o CSV não tiver a coluna tipo_tratamento)")
+    parser.add_argument("--protocolo", default=CAMINHO_PROTOCOLO, help="Arquivo JSON com as regras")
+    parser.add_argument("--saida", help="CSV de saída com a matriz de resultados")
+    args = parser.parse_args()
+
+    tabela = pd.read_csv(args.tabela, dtype=str)
+    if "tipo_tratamento" not in tabela and not args.tipo:
+        parser.error("Informe --tipo ou inclua a coluna tipo_tratamento no CSV.")
+
+    protocolo = ProtocoloRegras.carregar(args.protocolo)
+    codigos = protocolo.avaliar(tabela, args.tipo)
+    pior, contagem = resumir(codigos)
+
+    print(f"📋 {len(tabela)} planos, {len(protocolo.regras)} regras")
+    print(contagem[contagem.drop(columns="sem dado").sum(axis=1) > 0].to_string())
+    print(f"\n✅ {int((pior == OK).sum())}   ⚠️ {int((pior == ALERTA).sum())}   ❌ {int((pior == FALHA).sum())}")
+
+    if args.saida:
+        aplicaveis = (codigos != NAO_SE_APLICA).any()
+        matriz = codigos.loc[:, aplicaveis].map(ROTULOS_RESULTADO.get)
+        identificacao = [c for c in ("Nome do Paciente", "ID do Paciente", "Data/Hora") if c in tabela]
+        pd.concat([tabela[identificacao], matriz], axis=1).to_csv(args.saida, index=False)
+        print(f"💾 Matriz salva em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
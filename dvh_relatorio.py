@@ -0,0 +1,348 @@
+import argparse
+import hashlib
+import html
+import os
+import string
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from dvh_motor import (
+    BLOCOS_METRICAS,
+    ESTRUTURAS_PADRAO,
+    LIMIARES_POR_FRACIONAMENTO,
+    LIMIARES_RADIONECROSE_GY,
+    TIPOS_TRATAMENTO,
+    VALORES_IDEAIS,
+    FormatoDVHInvalido,
+    analisar_dvh,
+    validar_formato_dvh,
+)
+
+# ------------------------- Relatório de QA -------------------------
+# bloco de código para o documento de conferência de cada plano (HTML e PDF): identificação do
+# paciente, blocos de índices com os valores ideais e volumes de radionecrose ou V20Gy
+
+
+def montar_secoes(resultado):
+    """
+    Conteúdo do relatório, comum ao HTML e ao PDF: lista de (título, linhas), cada linha com
+    (rótulo, valor formatado, valor ideal ou "").
+    """
+    coletas = resultado["coletas"]
+    metricas = resultado["metricas"]
+    tipo_tratamento = resultado["tipo_tratamento"]
+    n_fracoes = resultado.get("n_fracoes")
+
+    def numero(valor, formato, unidade=""):
+        return "não calculado" if valor is None else f"{valor:{formato}}{unidade}"
+
+    secoes = [("Identificação", [
+        ("Paciente", resultado["nome_paciente"], ""),
+        ("ID do paciente", resultado["id_paciente"], ""),
+        ("Tipo de tratamento", tipo_tratamento, ""),
+        ("Fracionamento", f"{n_fracoes} fração(ões)" if n_fracoes else "—", ""),
+        ("Dose de prescrição", numero(coletas["dose_prescricao"], ".0f", " cGy"), ""),
+        ("Volume do PTV", numero(coletas["volume_ptv"], ".2f", " cm³"), ""),
+    ])]
+
+    for bloco_nome, lista_metricas in BLOCOS_METRICAS.items():
+        linhas = []
+        for nome in lista_metricas:
+            formato = ".3f" if nome == "HI5 (S-índex)" else ".4f"
+            unidade = "%" if nome == "HI5 (S-índex)" else ""
+            ideal = VALORES_IDEAIS.get(nome)
+            linhas.append((nome, numero(metricas.get(nome), formato, unidade), "" if ideal is None else str(ideal)))
+        secoes.append((bloco_nome.replace("🔹", "").strip(), linhas))
+
+    if tipo_tratamento == "SRS (Radiocirurgia)":
+        limiares = LIMIARES_POR_FRACIONAMENTO.get(n_fracoes, LIMIARES_RADIONECROSE_GY)
+        linhas = [
+            (f"Volume de Dose > {gy} Gy", numero(coletas[f"volume_{gy}gy"], ".2f", " cm³"), "")
+            for gy in limiares
+        ]
+        for nome, volume in (resultado.get("volumes_eqd2") or {}).items():
+            linhas.append((nome.replace(" (cm³)", ""), numero(volume, ".2f", " cm³"), ""))
+        secoes.append(("Volumes de Dose associados ao desenvolvimento de radionecrose", linhas))
+
+    elif tipo_tratamento == "SBRT de Pulmão":
+        secoes.append(("Pulmão recebendo acima de 20 Gy (V20Gy)", [
+            ("Volume dos pulmões", numero(coletas["volume_pulmao"], ".2f", " cm³"), ""),
+            ("Volume acima de 20 Gy", numero(coletas["volume_pulmao_20gy"], ".2f", " cm³"), ""),
+            ("V20Gy do pulmão", numero(coletas["v20gy_pulmao"], ".2f", "%"), ""),
+        ]))
+
+    return secoes
+
+
+# ------------------------- HTML -------------------------
+# Os modelos (e a folha de estilo, já embutida no modelo da página) são compilados uma vez por
+# processo, na importação; cada relatório só faz as substituições
+
+ESTILO = """
+body { font-family: Helvetica, Arial, sans-serif; font-size: 13px; color: #222; margin: 32px; }
+h1 { font-size: 20px; margin-bottom: 2px; }
+h2 { font-size: 15px; margin: 22px 0 6px; border-bottom: 1px solid #999; }
+p.gerado { color: #666; margin-top: 0; }
+table { border-collapse: collapse; width: 100%; }
+th { text-align: left; font-weight: normal; width: 55%; }
+th, td { padding: 3px 6px; border-bottom: 1px solid #e5e5e5; }
+td.ideal { color: #666; }
+.assinatura { margin-top: 40px; }
+"""
+
+_MODELO_PAGINA = string.Template(string.Template("""<!DOCTYPE html>
+<html lang="pt-BR">
+<head><meta charset="utf-8"><title>$$titulo</title><style>$estilo</style></head>
+<body>
+<h1>Relatório de QA do plano</h1>
+<p class="gerado">$$gerado</p>
+$$secoes
+<p class="assinatura">Conferido por: ______________________________ &nbsp; Data: ____/____/________</p>
+</body>
+</html>
+""").substitute(estilo=ESTILO))
+_MODELO_SECAO = string.Template("<h2>$titulo</h2>\n<table>\n<tr><th></th><td><b>Valor</b></td><td class=\"ideal\"><b>Ideal</b></td></tr>\n$linhas</table>\n")
+_MODELO_LINHA = string.Template("<tr><th>$rotulo</th><td>$valor</td><td class=\"ideal\">$ideal</td></tr>\n")
+
+
+def relatorio_html(resultado, gerado_em=None):
+    """Relatório de um resultado de dvh_motor.analisar_dvh como página HTML (texto)."""
+    secoes = []
+    for titulo, linhas in montar_secoes(resultado):
+        conteudo = "".join(
+            _MODELO_LINHA.substitute(rotulo=html.escape(rotulo), valor=html.escape(str(valor)), ideal=html.escape(ideal))
+            for rotulo, valor, ideal in linhas
+        )
+        secoes.append(_MODELO_SECAO.substitute(titulo=html.escape(titulo), linhas=conteudo))
+    gerado_em = gerado_em or datetime.now()
+    return _MODELO_PAGINA.substitute(
+        titulo=html.escape(f"QA - {resultado['nome_paciente']} ({resultado['id_paciente']})"),
+        gerado=f"Gerado em {gerado_em:%d/%m/%Y %H:%M}",
+        secoes="".join(secoes),
+    )
+
+
+# ------------------------- PDF -------------------------
+# bloco de código de um gerador de PDF mínimo (somente texto, fontes padrão do PDF), sem
+# dependências além da biblioteca padrão
+
+LARGURA_PAGINA, ALTURA_PAGINA = 595, 842  # A4 em pontos
+MARGEM = 50
+COLUNA_VALOR, COLUNA_IDEAL = 360, 480
+
+# Fontes padrão (não embutidas) com a codificação do Windows, que cobre os acentos, "³" e "·"
+_FONTES_PDF = [
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+]
+# Símbolos fora da WinAnsiEncoding
+_SUBSTITUICOES_PDF = {"≤": "<=", "≥": ">=", "≡": "=", "—": "-", "∩": "n"}
+
+
+def _texto_pdf(texto):
+    for original, troca in _SUBSTITUICOES_PDF.items():
+        texto = texto.replace(original, troca)
+    dados = texto.encode("cp1252", errors="ignore")  # emojis ficam de fora
+    return dados.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def escrever_pdf(paginas):
+    """
+    Monta um PDF a partir de páginas de comandos de texto (x, y, negrito, tamanho, texto), com
+    coordenadas em pontos a partir do canto inferior esquerdo. Retorna os bytes do arquivo.
+    """
+    objetos = [None, None, *_FONTES_PDF]  # 1 catálogo, 2 páginas, 3 e 4 fontes
+    ids_paginas = []
+    for comandos in paginas:
+        fluxo = b"".join(
+            b"BT /F%d %d Tf %.1f %.1f Td (%s) Tj ET\n" % (2 if negrito else 1, tamanho, x, y, _texto_pdf(texto))
+            for x, y, negrito, tamanho, texto in comandos
+        )
+        objetos.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(fluxo), fluxo))
+        objetos.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+            % (LARGURA_PAGINA, ALTURA_PAGINA, len(objetos))
+        )
+        ids_paginas.append(len(objetos))
+    objetos[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objetos[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % i for i in ids_paginas), len(ids_paginas)
+    )
+
+    saida = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    posicoes = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posicoes.append(len(saida))
+        saida += b"%d 0 obj\n%s\nendobj\n" % (numero, objeto)
+    inicio_xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    saida += b"".join(b"%010d 00000 n \n" % posicao for posicao in posicoes)
+    saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    return bytes(saida)
+
+
+def relatorio_pdf(resultado, gerado_em=None):
+    """Relatório de um resultado de dvh_motor.analisar_dvh como PDF (bytes), com quebra de página."""
+    paginas = [[]]
+    y = ALTURA_PAGINA - MARGEM
+
+    def escrever(x, negrito, tamanho, texto):
+        paginas[-1].append((x, y, negrito, tamanho, texto))
+
+    def avancar(altura):
+        nonlocal y
+        y -= altura
+        if y < MARGEM:
+            paginas.append([])
+            y = ALTURA_PAGINA - MARGEM - altura
+
+    gerado_em = gerado_em or datetime.now()
+    escrever(MARGEM, True, 16, "Relatório de QA do plano")
+    avancar(16)
+    escrever(MARGEM, False, 9, f"Gerado em {gerado_em:%d/%m/%Y %H:%M}")
+
+    for titulo, linhas in montar_secoes(resultado):
+        avancar(26)
+        escrever(MARGEM, True, 12, titulo)
+        escrever(COLUNA_VALOR, True, 9, "Valor")
+        escrever(COLUNA_IDEAL, True, 9, "Ideal")
+        avancar(4)
+        for rotulo, valor, ideal in linhas:
+            avancar(14)
+            escrever(MARGEM, False, 10, rotulo)
+            escrever(COLUNA_VALOR, False, 10, str(valor))
+            escrever(COLUNA_IDEAL, False, 10, ideal)
+
+    avancar(40)
+    escrever(MARGEM, False, 10, "Conferido por: ______________________________    Data: ____/____/________")
+    return escrever_pdf(paginas)
+
+
+# ------------------------- Geração em lote -------------------------
+
+def gerar_relatorio(caminho_arquivo, tipo_tratamento, estruturas=None, n_fracoes=None,
+                    formatos=("html", "pdf"), pasta_saida=None, nome_base=None):
+    """
+    Analisa um arquivo DVH e grava o relatório nos formatos pedidos como "<nome_base>_qa.<formato>"
+    (padrão: o nome do arquivo sem a extensão); retorna os caminhos gravados.
+    """
+    if not validar_formato_dvh(caminho_arquivo):
+        raise FormatoDVHInvalido(
+            "O formato do DVH está incorreto: exporte o DVH cumulativo (ou diferencial) com dose absoluta e volume absoluto."
+        )
+    resultado = analisar_dvh(caminho_arquivo, tipo_tratamento, estruturas, n_fracoes)
+
+    nome_base = nome_base or os.path.splitext(os.path.basename(caminho_arquivo))[0]
+    pasta_saida = pasta_saida or os.path.dirname(os.path.abspath(caminho_arquivo))
+    gerado_em = datetime.now()
+    gravados = []
+    for formato in formatos:
+        caminho_saida = os.path.join(pasta_saida, f"{nome_base}_qa.{formato}")
+        if formato == "html":
+            with open(caminho_saida, "w", encoding="utf-8") as f:
+                f.write(relatorio_html(resultado, gerado_em))
+        else:
+            with open(caminho_saida, "wb") as f:
+                f.write(relatorio_pdf(resultado, gerado_em))
+        gravados.append(caminho_saida)
+    return gravados
+
+
+def _gerar_no_processo(tarefa):
+    """Executada nos processos do lote: os erros de um arquivo não interrompem os demais."""
+    try:
+        return tarefa[0], gerar_relatorio(*tarefa), None
+    except (OSError, UnicodeDecodeError, FormatoDVHInvalido) as e:
+        return tarefa[0], [], str(e)
+    except Exception as e:
+        # Falha inesperada na análise de um plano (ex.: tabela incompleta) também fica só no resultado dele
+        return tarefa[0], [], f"{type(e).__name__}: {e}"
+
+
+def nomes_de_saida(caminhos, pasta_saida=None):
+    """
+    Nome base do relatório de cada arquivo. Arquivos diferentes com o mesmo nome sem extensão que
+    iriam para a mesma pasta (ex.: "plano.txt" de duas pastas com --saida) recebem um sufixo com o
+    hash do caminho completo, para que um relatório não sobrescreva o outro.
+    """
+    def destino(caminho):
+        absoluto = os.path.normcase(os.path.abspath(caminho))
+        pasta = os.path.normcase(os.path.abspath(pasta_saida)) if pasta_saida else os.path.dirname(absoluto)
+        return absoluto, pasta, os.path.splitext(os.path.basename(caminho))[0]
+
+    grupos = {}
+    for caminho in caminhos:
+        absoluto, pasta, nome = destino(caminho)
+        grupos.setdefault((pasta, os.path.normcase(nome)), set()).add(absoluto)
+
+    nomes = []
+    for caminho in caminhos:
+        absoluto, pasta, nome = destino(caminho)
+        if len(grupos[(pasta, os.path.normcase(nome))]) > 1:
+            nome = f"{nome}_{hashlib.sha1(absoluto.encode('utf-8')).hexdigest()[:8]}"
+        nomes.append(nome)
+    return nomes
+
+
+def gerar_lote(caminhos, tipo_tratamento, estruturas=None, n_fracoes=None, formatos=("html", "pdf"),
+               pasta_saida=None, processos=None):
+    """
+    Gera os relatórios de vários arquivos em processos paralelos (cada processo importa o módulo
+    e compila os modelos uma única vez). Produz (arquivo, caminhos gravados, erro) na ordem dos arquivos;
+    os nomes dos relatórios vêm de nomes_de_saida.
+    """
+    caminhos = list(caminhos)
+    tarefas = [
+        (caminho, tipo_tratamento, estruturas, n_fracoes, tuple(formatos), pasta_saida, nome_base)
+        for caminho, nome_base in zip(caminhos, nomes_de_saida(caminhos, pasta_saida))
+    ]
+    processos = processos or os.cpu_count() or 1
+    if processos == 1 or len(tarefas) < 2:
+        yield from map(_gerar_no_processo, tarefas)
+        return
+
+    # Vários arquivos por envio ao processo, para que a troca de mensagens não domine arquivos pequenos
+    lote = max(1, len(tarefas) // (4 * processos))
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        yield from executor.map(_gerar_no_processo, tarefas, chunksize=lote)
+
+
+# ------------------------- Linha de comando -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera os relatórios de QA (HTML e PDF) de um ou vários DVHs.")
+    parser.add_argument("arquivos", nargs="+", help="Arquivos .txt de DVH tabulado")
+    parser.add_argument("--tipo", default=TIPOS_TRATAMENTO[0], choices=TIPOS_TRATAMENTO)
+    parser.add_argument("--fracoes", type=int, choices=[1, 3, 5], help="Número de frações (SRS)")
+    for chave, nome in ESTRUTURAS_PADRAO.items():
+        parser.add_argument(f"--{chave}", default=nome, help=f"Nome da estrutura ({nome})")
+    parser.add_argument("--formato", nargs="+", choices=["html", "pdf"], default=["html", "pdf"])
+    parser.add_argument("--saida", help="Pasta dos relatórios (padrão: a pasta de cada arquivo)")
+    parser.add_argument("--processos", type=int, help="Número de processos (padrão: um por CPU)")
+    args = parser.parse_args()
+
+    if args.saida:
+        os.makedirs(args.saida, exist_ok=True)
+    # O número de frações só é usado no SRS; o padrão da página é 1
+    n_fracoes = (args.fracoes or 1) if args.tipo == "SRS (Radiocirurgia)" else None
+
+    inicio = datetime.now()
+    gerados = falhas = 0
+    for caminho, gravados, erro in gerar_lote(
+        args.arquivos, args.tipo,
+        estruturas={chave: getattr(args, chave) for chave in ESTRUTURAS_PADRAO},
+        n_fracoes=n_fracoes, formatos=args.formato, pasta_saida=args.saida, processos=args.processos,
+    ):
+        if erro:
+            falhas += 1
+            print(f"❌ {caminho}: {erro}")
+        else:
+            gerados += 1
+            print(f"✅ {caminho}: {', '.join(gravados)}")
+
+    segundos = (datetime.now() - inicio).total_seconds()
+    print(f"📄 {gerados} relatórios gerados, {falhas} com erro, em {segundos:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from dvh_biologico import ALFA_BETA_PADRAO, validar_alfa_beta
+from dvh_estruturas import IMPRESSAO_ALIASES
+from dvh_motor import ESTRUTURAS_PADRAO, VERSAO_ANALISE
+
+# ------------------------- Armazenamento local de resultados -------------------------
+# bloco de código para guardar, em um banco SQLite local, as análises feitas fora da página
+# (monitor de pasta), para que a página encontre o resultado pronto ao receber o mesmo arquivo
+
+PASTA_DADOS = os.environ.get(
+    "DVH_PASTA_DADOS", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".dvh_dados")
+)
+CAMINHO_BANCO = os.environ.get("DVH_BANCO", os.path.join(PASTA_DADOS, "resultados.sqlite3"))
+
+
+def chave_parametros(tipo_tratamento, estruturas, n_fracoes=None, alfa_beta=ALFA_BETA_PADRAO):
+    """
+    Texto que identifica os parâmetros de uma análise (tipo, nomes das estruturas, frações e α/β
+    dos volumes em EQD2), junto com a versão do cálculo e a tabela de aliases em uso: resultados
+    guardados por outra versão do motor, com outros aliases ou outro α/β deixam de ser encontrados
+    e são refeitos.
+    As estruturas que o tipo de tratamento não usa (pulmão fora do SBRT de Pulmão, encéfalo
+    fora do SRS) ficam de fora, para que não diferenciem análises iguais.
+    """
+    estruturas = {**ESTRUTURAS_PADRAO, **(estruturas or {})}
+    if tipo_tratamento != "SBRT de Pulmão":
+        estruturas.pop("pulmao")
+    if tipo_tratamento != "SRS (Radiocirurgia)":
+        estruturas.pop("encefalo")
+    return json.dumps(
+        {
+            "tipo_tratamento": tipo_tratamento, "estruturas": estruturas, "n_fracoes": n_fracoes,
+            "alfa_beta": validar_alfa_beta(alfa_beta),
+            "versao": VERSAO_ANALISE, "aliases": IMPRESSAO_ALIASES,
+        },
+        sort_keys=True, ensure_ascii=False,
+    )
+
+
+@contextmanager
+def conectar(caminho_banco=CAMINHO_BANCO):
+    """
+    Abre o banco local (criando a pasta se necessário) em modo WAL, que permite leitura durante
+    a escrita. A transação é confirmada ao final do bloco e a conexão é fechada.
+    """
+    pasta = os.path.dirname(os.path.abspath(caminho_banco))
+    os.makedirs(pasta, exist_ok=True)
+    conexao = sqlite3.connect(caminho_banco, timeout=30)
+    try:
+        conexao.execute("PRAGMA journal_mode=WAL")
+        with conexao:
+            yield conexao
+    finally:
+        conexao.close()
+
+
+class ArmazemResultados:
+    """Resultados de análise indexados pelo hash do arquivo e índice dos arquivos já processados."""
+
+    def __init__(self, caminho_banco=CAMINHO_BANCO):
+        self.caminho_banco = caminho_banco
+        with conectar(caminho_banco) as conexao:
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS arquivos_processados ("
+                " hash TEXT PRIMARY KEY, caminho TEXT, status TEXT, processado_em TEXT)"
+            )
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS resultados ("
+                " hash TEXT, parametros TEXT, resultado TEXT, criado_em TEXT,"
+                " PRIMARY KEY (hash, parametros))"
+            )
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS falhas_formato ("
+                " caminho TEXT, parametros TEXT, tamanho INTEGER, mtime_ns INTEGER, registrado_em TEXT,"
+                " PRIMARY KEY (caminho, parametros))"
+            )
+
+    def ja_processado(self, hash_arquivo, parametros):
+        """
+        Se o arquivo já foi analisado com sucesso com estes parâmetros. Análises que terminaram em
+        erro não contam: o arquivo é analisado de novo no próximo evento ou ao reiniciar o monitor
+        (os arquivos com formato inválido ficam em falha_registrada).
+        """
+        with conectar(self.caminho_banco) as conexao:
+            linha = conexao.execute(
+                "SELECT 1 FROM resultados WHERE hash = ? AND parametros = ?", (hash_arquivo, parametros)
+            ).fetchone()
+        return linha is not None
+
+    def marcar_processado(self, hash_arquivo, caminho_arquivo, status):
+        with conectar(self.caminho_banco) as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO arquivos_processados VALUES (?, ?, ?, ?)",
+                (hash_arquivo, caminho_arquivo, status, datetime.now().isoformat(timespec="seconds")),
+            )
+
+    def registrar_falha(self, caminho_arquivo, parametros, tamanho, mtime_ns):
+        """Registra que o arquivo, com este tamanho e data de modificação, não tem o formato de DVH esperado."""
+        with conectar(self.caminho_banco) as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO falhas_formato VALUES (?, ?, ?, ?, ?)",
+                (caminho_arquivo, parametros, tamanho, mtime_ns, datetime.now().isoformat(timespec="seconds")),
+            )
+
+    def falha_registrada(self, caminho_arquivo, parametros, tamanho, mtime_ns):
+        """
+        Se o arquivo já foi recusado por formato inválido e não mudou desde então (mesmo tamanho e
+        data de modificação), para que não seja lido de novo a cada reinício ou verificação.
+        """
+        with conectar(self.caminho_banco) as conexao:
+            linha = conexao.execute(
+                "SELECT 1 FROM falhas_formato WHERE caminho = ? AND parametros = ? AND tamanho = ? AND mtime_ns = ?",
+                (caminho_arquivo, parametros, tamanho, mtime_ns),
+            ).fetchone()
+        return linha is not None
+
+    def guardar_resultado(self, hash_arquivo, parametros, resultado):
+        with conectar(self.caminho_banco) as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?)",
+                (hash_arquivo, parametros, json.dumps(resultado, ensure_ascii=False),
+                 datetime.now().isoformat(timespec="seconds")),
+            )
+
+    def obter_resultado(self, hash_arquivo, parametros):
+        """Retorna o resultado já calculado para o arquivo e parâmetros, ou None."""
+        with conectar(self.caminho_banco) as conexao:
+            linha = conexao.execute(
+                "SELECT resultado FROM resultados WHERE hash = ? AND parametros = ?",
+                (hash_arquivo, parametros),
+            ).fetchone()
+        return json.loads(linha[0]) if linha else None
@@ -0,0 +1,276 @@
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, quote, urlparse
+from urllib.request import Request, urlopen
+
+from dvh_motor import ESTRUTURAS_PADRAO, FormatoDVHInvalido, analisar_conteudo_dvh
+
+# ------------------------- Serviço HTTP local de análise -------------------------
+# bloco de código para análise de DVH sem navegador (ex.: integração com o sistema de registro e verificação)
+
+HOST = "127.0.0.1"  # o serviço atende somente a máquina local
+PORTA_PADRAO = 8765
+TAMANHO_MAXIMO_ARQUIVO = 50 * 1024 * 1024  # bytes
+
+
+class FilaCheia(Exception):
+    """Todos os trabalhadores estão ocupados e a fila de espera está cheia."""
+
+
+class FilaAnalise:
+    """Pool limitado de trabalhadores com fila de espera de tamanho fixo."""
+
+    def __init__(self, trabalhadores=4, tamanho_fila=16):
+        self.trabalhadores = trabalhadores
+        self.tamanho_fila = tamanho_fila
+        self._executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="analise-dvh")
+        self._vagas = threading.BoundedSemaphore(trabalhadores + tamanho_fila)
+        self._trava = threading.Lock()
+        self.pendentes = 0
+
+    def _liberar(self, _futuro):
+        with self._trava:
+            self.pendentes -= 1
+        self._vagas.release()
+
+    def executar(self, funcao, *args):
+        """Executa a função no pool e aguarda o resultado; levanta FilaCheia se não houver vaga."""
+        if not self._vagas.acquire(blocking=False):
+            raise FilaCheia()
+        with self._trava:
+            self.pendentes += 1
+        futuro = self._executor.submit(funcao, *args)
+        futuro.add_done_callback(self._liberar)
+        return futuro.result()
+
+    def encerrar(self):
+        self._executor.shutdown(wait=True)
+
+
+def _tamanho_do_corpo(cabecalhos):
+    """Tamanho do corpo pelo Content-Length (None se ausente); ValueError se não for um inteiro >= 0."""
+    texto = cabecalhos.get("Content-Length")
+    if texto is None:
+        return None
+    texto = texto.strip()
+    if not (texto.isascii() and texto.isdigit()):
+        raise ValueError("Content-Length inválido.")
+    return int(texto)
+
+
+def _numero_fracoes(valor):
+    """Número de frações do pedido (inteiro >= 1, em número ou texto), ou None se não informado."""
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, str) and valor.strip().isascii() and valor.strip().isdigit():
+        valor = int(valor)
+    elif isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    if not isinstance(valor, int) or isinstance(valor, bool) or valor < 1:
+        raise ValueError("O número de frações (n_fracoes) deve ser um inteiro maior ou igual a 1.")
+    return valor
+
+
+def _ler_pedido(cabecalhos, corpo, consulta):
+    """
+    Interpreta o pedido de análise. Aceita JSON {"dvh", "tipo_tratamento", "estruturas", "n_fracoes"}
+    ou o arquivo DVH bruto no corpo, com os parâmetros na URL (?tipo_tratamento=...&ptv=...).
+    """
+    if cabecalhos.get("Content-Type", "").startswith("application/json"):
+        pedido = json.loads(corpo.decode("utf-8"))
+        if not isinstance(pedido, dict):
+            raise ValueError("O corpo JSON deve ser um objeto.")
+        if not isinstance(pedido.get("dvh", ""), str):
+            raise ValueError("O campo dvh deve conter o texto do arquivo DVH.")
+        conteudo = pedido.get("dvh", "").encode("utf-8")
+        tipo_tratamento = pedido.get("tipo_tratamento")
+        estruturas = pedido.get("estruturas") or {}
+        n_fracoes = pedido.get("n_fracoes")
+    else:
+        parametros = {chave: valores[0] for chave, valores in parse_qs(consulta).items()}
+        conteudo = corpo
+        tipo_tratamento = parametros.get("tipo_tratamento")
+        estruturas = {chave: parametros[chave] for chave in ESTRUTURAS_PADRAO if chave in parametros}
+        n_fracoes = parametros.get("n_fracoes")
+
+    if not conteudo:
+        raise ValueError("Arquivo DVH ausente.")
+    if not tipo_tratamento or not isinstance(tipo_tratamento, str):
+        raise ValueError("Informe o tipo de tratamento (tipo_tratamento).")
+    if not isinstance(estruturas, dict) or any(chave not in ESTRUTURAS_PADRAO for chave in estruturas):
+        raise ValueError(f"Estruturas devem ser um objeto com as chaves {sorted(ESTRUTURAS_PADRAO)}.")
+    n_fracoes = _numero_fracoes(n_fracoes)
+
+    return conteudo, tipo_tratamento, estruturas, n_fracoes
+
+
+class ManipuladorAnalise(BaseHTTPRequestHandler):
+    """POST /analisar retorna as métricas em JSON; GET /saude retorna o estado da fila."""
+
+    fila = None
+    detalhado = False
+
+    def _responder(self, status, dados):
+        corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/saude":
+            self._responder(404, {"erro": "Caminho não encontrado."})
+            return
+        self._responder(200, {
+            "status": "ok",
+            "trabalhadores": self.fila.trabalhadores,
+            "tamanho_fila": self.fila.tamanho_fila,
+            "pendentes": self.fila.pendentes,
+        })
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/analisar":
+            self._responder(404, {"erro": "Caminho não encontrado."})
+            return
+
+        try:
+            tamanho = _tamanho_do_corpo(self.headers)
+        except ValueError as e:
+            self._responder(400, {"erro": str(e)})
+            return
+        if tamanho is None:
+            self._responder(411, {"erro": "Informe o tamanho do corpo (Content-Length)."})
+            return
+        if tamanho > TAMANHO_MAXIMO_ARQUIVO:
+            self._responder(413, {"erro": "Arquivo DVH muito grande."})
+            return
+        corpo = self.rfile.read(tamanho)
+
+        try:
+            conteudo, tipo_tratamento, estruturas, n_fracoes = _ler_pedido(self.headers, corpo, url.query)
+            resultado = self.fila.executar(analisar_conteudo_dvh, conteudo, tipo_tratamento, estruturas, n_fracoes)
+        except FilaCheia:
+            self._responder(503, {"erro": "Serviço ocupado, tente novamente."})
+            return
+        except (FormatoDVHInvalido, ValueError, UnicodeDecodeError) as e:
+            self._responder(400, {"erro": str(e)})
+            return
+        except Exception as e:
+            self._responder(500, {"erro": f"Erro ao analisar o DVH: {e}"})
+            return
+
+        self._responder(200, resultado)
+
+    def log_message(self, formato, *args):
+        if self.detalhado:
+            super().log_message(formato, *args)
+
+
+def criar_servidor(porta=PORTA_PADRAO, trabalhadores=4, tamanho_fila=16, detalhado=False):
+    """Cria o servidor HTTP em 127.0.0.1 com o seu próprio pool de análise."""
+    manipulador = type("Manipulador", (ManipuladorAnalise,), {
+        "fila": FilaAnalise(trabalhadores, tamanho_fila),
+        "detalhado": detalhado,
+    })
+    return ThreadingHTTPServer((HOST, porta), manipulador)
+
+
+# ------------------------- Cliente de teste de carga -------------------------
+
+def testar_carga(url, conteudo, tipo_tratamento, requisicoes=100, concorrencia=8, variar=False):
+    """
+    Envia requisições concorrentes ao serviço e retorna latências (ms), vazão e contagem por status.
+    Com variar=True cada requisição recebe um arquivo diferente, o que evita o cache de planos.
+    """
+    endereco = f"{url.rstrip('/')}/analisar?tipo_tratamento={quote(tipo_tratamento)}"
+
+    def enviar(i):
+        corpo = conteudo + f"\nComentário: carga {i}\n".encode("utf-8") if variar else conteudo
+        pedido = Request(endereco, data=corpo, headers={"Content-Type": "text/plain; charset=utf-8"})
+        inicio = time.perf_counter()
+        try:
+            with urlopen(pedido) as resposta:
+                resposta.read()
+                status = resposta.status
+        except HTTPError as e:
+            status = e.code
+        return status, (time.perf_counter() - inicio) * 1000.0
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        respostas = list(executor.map(enviar, range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+
+    latencias = sorted(latencia for status, latencia in respostas if status == 200)
+    por_status = {}
+    for status, _ in respostas:
+        por_status[status] = por_status.get(status, 0) + 1
+
+    def percentil(p):
+        if not latencias:
+            return None
+        return latencias[min(len(latencias) - 1, int(round(p / 100.0 * (len(latencias) - 1))))]
+
+    return {
+        "requisicoes": requisicoes,
+        "por_status": por_status,
+        "duracao_s": duracao,
+        "vazao_rps": requisicoes / duracao if duracao else None,
+        "p50_ms": percentil(50),
+        "p95_ms": percentil(95),
+        "p99_ms": percentil(99),
+    }
+
+
+# ------------------------- Linha de comando -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de análise de DVH.")
+    subcomandos = parser.add_subparsers(dest="comando")
+
+    servir = subcomandos.add_parser("servir", help="Inicia o serviço em 127.0.0.1")
+    servir.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    servir.add_argument("--trabalhadores", type=int, default=4, help="Análises simultâneas")
+    servir.add_argument("--fila", type=int, default=16, help="Pedidos em espera além dos trabalhadores")
+    servir.add_argument("--detalhado", action="store_true", help="Registra cada requisição no terminal")
+
+    carga = subcomandos.add_parser("carga", help="Teste de carga contra um serviço em execução")
+    carga.add_argument("arquivo", help="Arquivo .txt de DVH enviado em todas as requisições")
+    carga.add_argument("--url", default=f"http://{HOST}:{PORTA_PADRAO}")
+    carga.add_argument("--tipo", default="SRS (Radiocirurgia)")
+    carga.add_argument("--requisicoes", type=int, default=100)
+    carga.add_argument("--concorrencia", type=int, default=8)
+    carga.add_argument("--variar", action="store_true", help="Envia um arquivo diferente por requisição (sem cache)")
+
+    args = parser.parse_args()
+
+    if args.comando == "carga":
+        with open(args.arquivo, "rb") as f:
+            conteudo = f.read()
+        relatorio = testar_carga(args.url, conteudo, args.tipo, args.requisicoes, args.concorrencia, args.variar)
+        print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+        return
+
+    if args.comando is None:
+        args = parser.parse_args(["servir"])
+
+    servidor = criar_servidor(args.porta, args.trabalhadores, args.fila, args.detalhado)
+    print(f"🩺 Serviço de análise de DVH em http://{HOST}:{args.porta} (POST /analisar, GET /saude)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.RequestHandlerClass.fila.encerrar()
+
+
+if __name__ == "__main__":
+    main()
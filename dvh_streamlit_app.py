@@ -1,564 +1,74 @@
 import streamlit as st
 import tempfile
-import math
+import functools
+import io
+import os
+import altair as alt
+import pandas as pd
 import gspread
 from google.oauth2.service_account import Credentials
 
-# ------------------------- Integração com Google Sheets -------------------------
-try:
-    SCOPES = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive"
-    ]
-    creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=SCOPES)
-    gc = gspread.authorize(creds)
-    SHEET_ID = st.secrets["SHEET"]["id"]
-except Exception as e:
-    st.error(f"❌ Erro ao conectar ao Google Sheets: {e}")
-    gc = None
-    SHEET_ID = None
-
-# ------------------------- Funções auxiliares -------------------------
-# bloco de código para coleta de dados
-
-def extrair_dados_paciente(caminho_arquivo):
-    """Lê as duas primeiras linhas do arquivo DVH e retorna apenas o conteúdo após ':'."""
-    try:
-        with open(caminho_arquivo, "r", encoding="utf-8") as f:
-            linhas = f.readlines()
-
-            # Extrai e limpa o nome do paciente
-            if len(linhas) > 0:
-                nome_paciente = linhas[0].strip()
-                if ":" in nome_paciente:
-                    nome_paciente = nome_paciente.split(":", 1)[1].strip()
-            else:
-                nome_paciente = "Nome não encontrado"
-
-            # Extrai e limpa o ID do paciente
-            if len(linhas) > 1:
-                id_paciente = linhas[1].strip()
-                if ":" in id_paciente:
-                    id_paciente = id_paciente.split(":", 1)[1].strip()
-            else:
-                id_paciente = "ID não encontrado"
-
-        return nome_paciente, id_paciente
-
-    except Exception:
-        return "Nome não encontrado", "ID não encontrado"
-
-def extrair_volume_dose_100(filepath):
-    return extrair_volume_para_dose_relativa(filepath, alvo_dose=100.0)
-
-def extrair_volume_dose_50(filepath):
-    return extrair_volume_para_dose_relativa(filepath, alvo_dose=50.0)
-
-def extrair_volume_dose_10gy(filepath, estrutura_alvo):
-    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=1000.0, estrutura_alvo=estrutura_alvo)
-
-def extrair_volume_dose_12gy(filepath, estrutura_alvo):
-    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=1200.0, estrutura_alvo=estrutura_alvo)
-
-def extrair_volume_dose_18gy(filepath, estrutura_alvo):
-    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=1800.0, estrutura_alvo=estrutura_alvo)
-
-def extrair_volume_dose_20gy(filepath, estrutura_alvo):
-    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=2000.0, estrutura_alvo=estrutura_alvo)
-
-def extrair_volume_dose_24gy(filepath, estrutura_alvo):
-    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=2400.0, estrutura_alvo=estrutura_alvo)
-
-def extrair_volume_dose_30gy(filepath, estrutura_alvo):
-    return extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy=3000.0, estrutura_alvo=estrutura_alvo)
-
-def extrair_volume_ptv(filepath):
-    return extrair_volume_por_estrutura(filepath, estrutura_alvo=nome_ptv.strip().lower())
-
-def extrair_volume_overlap(filepath):
-    return extrair_volume_por_estrutura(filepath, estrutura_alvo=nome_overlap.strip().lower())
-
-def extrair_dose_max_body(filepath):
-    return extrair_dado_numerico_por_estrutura(filepath, estrutura_alvo=nome_body.strip().lower(), chave="dose máx")
-
-# Novas funções para PTV (mín/máx)
-def extrair_dose_max_ptv(filepath):
-    return extrair_dado_numerico_por_estrutura(filepath, estrutura_alvo=nome_ptv.strip().lower(), chave="dose máx")
-
-def extrair_dose_min_ptv(filepath):
-    return extrair_dado_numerico_por_estrutura(filepath, estrutura_alvo=nome_ptv.strip().lower(), chave="dose mín")
-
-
-def extrair_dose_prescricao(filepath):
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            if linha.lower().strip().startswith("dose total"):
-                try:
-                    valor = linha.split(":", 1)[-1].strip().replace(',', '.')
-                    return float(valor)
-                except ValueError:
-                    return None
-    return None
-
-
-def extrair_volume_por_estrutura(filepath, estrutura_alvo):
-    """
-    Extrai o volume da estrutura alvo (PTV, BODY, etc.) a partir da primeira linha da tabela DVH,
-    logo abaixo do cabeçalho 'Volume da estrutura [cm³]'.
-    """
-    coletando_dados = False
-    dentro_da_tabela = False
-
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            linha_limpa = linha.strip()
-
-            # Detecta início da estrutura
-            if linha_limpa.lower().startswith("estrutura:") or linha_limpa.lower().startswith("structure:"):
-                nome_estrutura = linha_limpa.split(":", 1)[-1].strip().lower()
-                coletando_dados = (nome_estrutura == estrutura_alvo.strip().lower())
-                dentro_da_tabela = False
-                continue
-
-            if not coletando_dados:
-                continue
-
-            # Detecta o início da tabela
-            if "Dose relativa [%]" in linha and "Volume da estrutura" in linha:
-                dentro_da_tabela = True
-                continue
-
-            # Primeira linha útil da tabela
-            if dentro_da_tabela:
-                partes = linha_limpa.split()
-                if len(partes) == 3:
-                    try:
-                        volume = float(partes[2].replace(',', '.'))
-                        return volume
-                    except ValueError:
-                        return None
-
-    return None
-
-
-def extrair_dado_numerico_por_estrutura(filepath, estrutura_alvo, chave):
-    coletando_dados = False
-
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            linha_limpa = linha.strip().lower()
-
-            if linha_limpa.startswith("estrutura:"):
-                nome_estrutura = linha_limpa.split(":", 1)[-1].strip().lower()
-                coletando_dados = (nome_estrutura == estrutura_alvo.strip().lower())
-                continue
-
-            if not coletando_dados:
-                continue
-
-            if linha_limpa.startswith(chave.lower()):
-                try:
-                    valor_str = linha.split(":", 1)[-1].strip().replace(',', '.')
-                    return float(valor_str)
-                except ValueError:
-                    continue
-
-    return None
-
-
-def extrair_volume_para_dose_relativa(filepath, alvo_dose):
-    return _extrair_volume_por_coluna(filepath, alvo_dose, coluna="relativa")
-
-
-def extrair_volume_para_dose_absoluta(filepath, alvo_dose_cgy, estrutura_alvo=None):
-    """
-    Extrai o volume (cm³) da estrutura especificada que recebe uma dose absoluta
-    maior ou igual ao valor fornecido (em cGy). Suporta tanto 'Estrutura:' (PT-BR)
-    quanto 'Structure:' (EN).
-    """
-    try:
-        with open(filepath, "r", encoding="utf-8") as file:
-            linhas = file.readlines()
-
-        estrutura_atual = None
-        dose_dvh = []
-        volume_dvh = []
-
-        for linha in linhas:
-            linha_stripped = linha.strip()
-            if not linha_stripped:
-                continue
-
-            # Detecta início de nova estrutura (suporta português e inglês)
-            low = linha_stripped.lower()
-            if low.startswith("estrutura:") or low.startswith("structure:"):
-                # pega o nome após os dois pontos e normaliza
-                estrutura_atual = linha_stripped.split(":", 1)[1].strip().lower()
-                continue
-
-            # Se estivermos dentro da estrutura alvo (comparação normalizada)
-            if estrutura_alvo and estrutura_atual == estrutura_alvo.strip().lower():
-                try:
-                    partes = linha_stripped.split()
-                    # Em muitos DVHs a coluna de volume é a última coluna; usamos a última
-                    if len(partes) >= 2:
-                        dose = float(partes[0].replace(",", "."))
-                        volume = float(partes[-1].replace(",", "."))
-                        dose_dvh.append(dose)
-                        volume_dvh.append(volume)
-                except ValueError:
-                    continue
-
-        # Se não encontrou dados para a estrutura alvo
-        if not dose_dvh:
-            return None
-
-        # Encontra o primeiro volume com dose >= alvo
-        for i, d in enumerate(dose_dvh):
-            if d >= alvo_dose_cgy:
-                return volume_dvh[i]
-
-        return None
-
-    except Exception:
-        return None
-
-
-def _extrair_volume_por_coluna(filepath, alvo_dose, coluna="relativa", estrutura_alvo=None):
-    if estrutura_alvo is None:
-        estrutura_alvo = nome_body.lower()
-    coletando_dados = False
-    dentro_da_tabela = False
-    melhor_aproximacao = None
-    menor_diferenca = float('inf')
-
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            linha_limpa = linha.strip()
-
-            if linha_limpa.lower().startswith("estrutura:") or linha_limpa.lower().startswith("structure:"):
-                nome_estrutura = linha_limpa.split(":", 1)[-1].strip().lower()
-                coletando_dados = (nome_estrutura == estrutura_alvo)
-                dentro_da_tabela = False
-                continue
-
-            if not coletando_dados:
-                continue
-
-            if "Dose relativa [%]" in linha and "Volume da estrutura" in linha:
-                dentro_da_tabela = True
-                continue
-
-            if not dentro_da_tabela:
-                continue
-
-            partes = linha_limpa.split()
-            if len(partes) != 3:
-                continue
-
-            try:
-                dose = float(partes[0].replace(',', '.')) if coluna == "absoluta" else float(partes[1].replace(',', '.'))
-                volume = float(partes[2].replace(',', '.'))
-            except ValueError:
-                continue
-
-            if dose == alvo_dose:
-                return volume
-
-            if dose > alvo_dose:
-                diferenca = dose - alvo_dose
-                if diferenca < menor_diferenca:
-                    menor_diferenca = diferenca
-                    melhor_aproximacao = volume
-
-    return melhor_aproximacao
-
-
-# Nova função: extrair dose que cobre X% do volume do PTV
-# pct em 0-1 (ex.: 0.02 para 2%)
-def extrair_dose_cobrindo_pct_ptv(filepath, pct, volume_ptv):
-    if volume_ptv is None:
-        return None
-
-    alvo_volume = pct * volume_ptv
-    coletando_dados = False
-    dentro_da_tabela = False
-    rows = []  # tuplas (dose_cgy, volume_cm3)
-
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            linha_limpa = linha.strip()
-
-            if linha_limpa.lower().startswith("estrutura:"):
-                nome_estrutura = linha_limpa.split(":", 1)[-1].strip().lower()
-                coletando_dados = (nome_estrutura == nome_ptv.strip().lower())
-                dentro_da_tabela = False
-                continue
-
-            if not coletando_dados:
-                continue
-
-            if "Dose relativa [%]" in linha and "Volume da estrutura" in linha:
-                dentro_da_tabela = True
-                continue
-
-            if not dentro_da_tabela:
-                continue
-
-            partes = linha_limpa.split()
-            if len(partes) != 3:
-                continue
-
-            try:
-                dose_cgy = float(partes[0].replace(',', '.'))
-                volumen = float(partes[2].replace(',', '.'))
-            except ValueError:
-                continue
-
-            rows.append((dose_cgy, volumen))
-
-    if not rows:
-        return None
-
-    # Procurar a maior volume <= alvo_volume (imediatamente inferior)
-    candidatos = [r for r in rows if r[1] <= alvo_volume]
-    if candidatos:
-        # escolher o que tiver maior volume (mais próximo por baixo)
-        candidato = max(candidatos, key=lambda x: x[1])
-        return candidato[0]
-
-    # Se não houver volume <= alvo (ex.: alvo muito pequeno), escolher o menor volume disponível (maior dose)
-    menor = min(rows, key=lambda x: x[1])
-    return menor[0]
-
-
-def extrair_dose_media_ptv(filepath):
-    """Extrai a dose média [cGy] da estrutura PTV."""
-    coletando_dados = False
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            linha_limpa = linha.strip().lower()
-            if linha_limpa.startswith("estrutura:"):
-                nome = linha_limpa.split(":", 1)[-1].strip()
-                coletando_dados = (nome.lower() == nome_ptv.strip().lower())
-                continue
-            if coletando_dados and linha_limpa.startswith("dose média [cgy]:"):
-                try:
-                    valor = linha.split(":", 1)[-1].strip().replace(",", ".")
-                    return float(valor)
-                except ValueError:
-                    return None
-    return None
-
-
-def extrair_std_ptv(filepath):
-    """Extrai o desvio-padrão [cGy] (STD) da estrutura PTV."""
-    coletando_dados = False
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            linha_limpa = linha.strip().lower()
-            if linha_limpa.startswith("estrutura:"):
-                nome = linha_limpa.split(":", 1)[-1].strip()
-                coletando_dados = (nome.lower() == nome_ptv.strip().lower())
-                continue
-            if coletando_dados and linha_limpa.startswith("std [cgy]:"):
-                try:
-                    valor = linha.split(":", 1)[-1].strip().replace(",", ".")
-                    return float(valor)
-                except ValueError:
-                    return None
-    return None
-
-def extrair_dose_media_iso50(filepath):
-    """Extrai a dose média [cGy] da estrutura Dose 50[%]."""
-    coletando_dados = False
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            linha_limpa = linha.strip().lower()
-            if linha_limpa.startswith("estrutura:"):
-                nome = linha_limpa.split(":", 1)[-1].strip()
-                coletando_dados = (nome.lower() == nome_iso50.strip().lower())
-                continue
-            if coletando_dados and linha_limpa.startswith("dose média [cgy]:"):
-                try:
-                    valor = linha.split(":", 1)[-1].strip().replace(",", ".")
-                    return float(valor)
-                except ValueError:
-                    return None
-    return None
-
-def calcular_v20gy_pulmao(filepath, nome_pulmao):
-    """
-    Calcula o percentual do volume do pulmão que recebe acima de 20 Gy (V20Gy)
-    e retorna também o volume absoluto (cm³), com alta precisão.
-    """
-
-    volume_total = None
-    volume_acima_20gy = None
-    coletando_dados = False
-    dentro_tabela = False
-
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for linha in file:
-            linha_limpa = linha.strip()
-
-            # Detecta início do bloco da estrutura Pulmão
-            if linha_limpa.lower().startswith("estrutura:"):
-                nome = linha_limpa.split(":", 1)[-1].strip().lower()
-                coletando_dados = (nome == nome_pulmao.strip().lower())
-                dentro_tabela = False
-                continue
-
-            if not coletando_dados:
-                continue
-
-            # Detecta início da tabela de DVH
-            if "Dose relativa [%]" in linha and "Volume da estrutura" in linha:
-                dentro_tabela = True
-                continue
-
-            if not dentro_tabela:
-                # Coleta volume total do pulmão
-                if "volume [cm³]:" in linha_limpa.lower() and volume_total is None:
-                    try:
-                        valor = linha.split(":", 1)[-1].strip().replace(",", ".")
-                        volume_total = float(valor)
-                    except ValueError:
-                        pass
-                continue
-
-            # Tenta ler linhas de dados da tabela (dose, dose relativa, volume)
-            partes = linha_limpa.split()
-            if len(partes) < 3:
-                continue
-
-            try:
-                dose_cgy = float(partes[0].replace(",", "."))
-                volume = float(partes[2].replace(",", "."))
-            except ValueError:
-                continue
-
-            # Usa comparação numérica com tolerância para evitar erros de formatação
-            if abs(dose_cgy - 2000.0) < 0.05:  # tolerância de 0.05 cGy
-                volume_acima_20gy = volume
-                break  # encontramos a linha exata, não precisamos continuar
-
-    if volume_total is not None and volume_acima_20gy is not None:
-        v20gy = (volume_acima_20gy / volume_total) * 100
-        return v20gy, volume_acima_20gy
-    else:
-        return None, None
-
-
-# bloco de código para o cálculo das métricas IC,IG,IH e Paddick e demais métricas pedidas
-
-def calcular_metricas_avancadas(dose_prescricao, dose_max_body, dose_max_ptv, dose_min_ptv,
-                                 volume_ptv, volume_overlap, volume_iso100, volume_iso50,
-                                 d2_ptv, d5_ptv, d95_ptv, d98_ptv,
-                                 dose_media_ptv=None, dose_std_ptv=None, dose_media_iso50=None):
-    metricas = {}
-
-    # Índice de Conformidade (CI1)
-    if volume_ptv and volume_iso100:
-        metricas['CI1 (isodose100/PTV)'] = volume_iso100 / volume_ptv
-    else:
-        metricas['CI1 (isodose100/PTV)'] = None
-
-    # CI2 = Overlap / isodose100
-    if volume_overlap is not None and volume_iso100:
-        metricas['CI2 (Overlap/isodose100)'] = volume_overlap / volume_iso100
-    else:
-        metricas['CI2 (Overlap/isodose100)'] = None
-
-    # CI3 = Overlap / PTV
-    if volume_overlap is not None and volume_ptv:
-        metricas['CI3 (Overlap/PTV)'] = volume_overlap / volume_ptv
-    else:
-        metricas['CI3 (Overlap/PTV)'] = None
-
-    # CI4 (Paddick) = Overlap² / (PTV * isodose100)
-    if volume_overlap is not None and volume_ptv and volume_iso100:
-        metricas['CI4 (Paddick)'] = (volume_overlap**2)/(volume_ptv*volume_iso100)
-    else:
-        metricas['CI4 (Paddick)'] = None
-
-    # Índices de Gradiente
-    if volume_iso50 and volume_iso100:
-        metricas['GI1 (isodose50/isodose100)'] = volume_iso50 / volume_iso100
-    else:
-        metricas['GI1 (isodose50/isodose100)'] = None
+from dvh_curvas import reduzir_curva_lttb, volume_relativo
+from dvh_historico import HistoricoMetricas
+from dvh_motor import (
+    BLOCOS_METRICAS,
+    TIPOS_TRATAMENTO,
+    VALORES_IDEAIS,
+    analisar_dvh,
+    extrair_dados_paciente,
+    hash_conteudo,
+    tabela_dvh,
+    validar_formato_dvh,
+)
+from dvh_planilha import EspelhoPlanilha, IndiceEnvios, gravar_plano
+from dvh_regras import ProtocoloRegras
+from dvh_relatorio import relatorio_html, relatorio_pdf
+from dvh_resultados import CAMINHO_BANCO, ArmazemResultados, chave_parametros
 
-    # Raios efetivos
+# ------------------------- Integração com Google Sheets -------------------------
+if os.environ.get("DVH_PLANILHA_FALSA"):
+    # Planilha em memória (dvh_planilha_falsa.py) com a chave informada, para testes sem o Google Sheets
+    from dvh_planilha_falsa import CLIENTE_PROCESSO as gc
+    SHEET_ID = os.environ["DVH_PLANILHA_FALSA"]
+else:
     try:
-        r_iso100 = ((3 * volume_iso100) / (4 * math.pi)) ** (1.0 / 3.0) if volume_iso100 else None
-        r_iso50 = ((3 * volume_iso50) / (4 * math.pi)) ** (1.0 / 3.0) if volume_iso50 else None
-
-        # GI2 = raio50 / raio100
-        if r_iso50 is not None and r_iso100 is not None:
-            metricas['GI2 (raio50/raio100)'] = r_iso50 / r_iso100
-        else:
-            metricas['GI2 (raio50/raio100)'] = None
-            
-    except Exception:
-        metricas['Raio efetivo isodose100 (cm)'] = None
-        metricas['Raio efetivo isodose50 (cm)'] = None
-        metricas['GI2 (raio50/raio100)'] = None
-
-    # GI3 = volume isodose50 / volume PTV
-    if volume_iso50 and volume_ptv:
-        metricas['GI3 (isodose50/PTV)'] = volume_iso50 / volume_ptv
-    else:
-        metricas['GI3 (isodose50/PTV)'] = None
+        SCOPES = [
+            "https://www.googleapis.com/auth/spreadsheets",
+            "https://www.googleapis.com/auth/drive"
+        ]
+        creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=SCOPES)
+        gc = gspread.authorize(creds)
+        SHEET_ID = st.secrets["SHEET"]["id"]
+    except Exception as e:
+        st.error(f"❌ Erro ao conectar ao Google Sheets: {e}")
+        gc = None
+        SHEET_ID = None
 
-    # Índices de Homogeneidade
-    if dose_max_ptv is not None and dose_min_ptv is not None and dose_min_ptv != 0:
-        metricas['HI1 (Dmax_PTV/Dmin_PTV)'] = dose_max_ptv / dose_min_ptv
-    else:
-        metricas['HI1 (Dmax_PTV/Dmin_PTV)'] = None
+@st.cache_resource(show_spinner=False)
+def carregar_indice_envios():
+    """Índice local dos envios, criado uma vez por processo e compartilhado entre as sessões."""
+    return IndiceEnvios()
 
-    if dose_max_ptv is not None and dose_prescricao is not None and dose_prescricao != 0:
-        metricas['HI2 (Dmax_PTV/D_prescricao)'] = dose_max_ptv / dose_prescricao
-    else:
-        metricas['HI2 (Dmax_PTV/D_prescricao)'] = None
 
-    # HI3 = (D2 - D98) / D_prescricao
-    if d2_ptv is not None and d98_ptv is not None and dose_prescricao is not None and dose_prescricao != 0:
-        metricas['HI3 ((D2-D98)/D_prescricao)'] = (d2_ptv - d98_ptv) / dose_prescricao
-    else:
-        metricas['HI3 ((D2-D98)/D_prescricao)'] = None
+@st.cache_resource(show_spinner=False)
+def carregar_espelho():
+    """Espelho local da planilha, criado uma vez por processo e compartilhado entre as sessões."""
+    return EspelhoPlanilha()
 
-    # HI4 = (D5 - D95) / D_prescricao
-    if d5_ptv is not None and d95_ptv is not None and dose_prescricao is not None and dose_prescricao != 0:
-        metricas['HI4 ((D5-D95)/D_prescricao)'] = (d5_ptv - d95_ptv) / dose_prescricao
-    else:
-        metricas['HI4 ((D5-D95)/D_prescricao)'] = None
 
-    # HI5 (S-index) = (STD_PTV / Dose_prescricao) * 100
-    # e Dose média PTV (%) = (Dose_média_PTV / Dose_prescricao) * 100
-    if dose_std_ptv is not None and dose_prescricao:
-        metricas['HI5 (S-índex)'] = (dose_std_ptv / dose_prescricao) * 100
-    else:
-        metricas['HI5 (S-índex)'] = None
-    
-    if dose_media_ptv is not None and dose_prescricao:
-        metricas['Dose média PTV (%)'] = (dose_media_ptv / dose_prescricao) * 100
-    else:
-        metricas['Dose média PTV (%)'] = None
-
-    # Índice de Eficiência Global (Gn)
-    if (
-        dose_media_ptv is not None and volume_ptv is not None
-        and dose_media_iso50 is not None and volume_iso50 is not None
-        and dose_media_iso50 != 0 and volume_iso50 != 0
-    ):
-        metricas['Gn (Dose integral[PTV]/Dose integral[V50%])'] = (
-            (dose_media_ptv * volume_ptv) / (dose_media_iso50 * volume_iso50)
-        )
-    else:
-        metricas['Gn (Dose integral[PTV]/Dose integral[V50%])'] = None
-    
-    return metricas
+# Índice local dos planos já enviados (evita linhas duplicadas na planilha)
+try:
+    indice_envios = carregar_indice_envios()
+except Exception as e:
+    st.warning(f"⚠️ Índice de envios indisponível, planos duplicados não serão detectados: {e}")
+    indice_envios = None
 
+# Espelho local das abas da planilha (cabeçalho e histórico sem ler a planilha inteira)
+try:
+    espelho_planilha = carregar_espelho()
+except Exception as e:
+    st.warning(f"⚠️ Espelho local da planilha indisponível: {e}")
+    espelho_planilha = None
 
 def imprimir_metricas(metricas):
     print("\n📈 Métricas Calculadas:")
@@ -615,11 +125,27 @@ def imprimir_metricas_por_fracao(n_fracoes, volume_10gy=None, volume_12gy=None,
     else:
         print("❗ Número de frações inválido. Use 1, 3 ou 5.")
 
-def salvar_em_planilha(tipo_tratamento, metricas, volumes, nome_paciente, id_paciente):
-    """Salva métricas e volumes na aba correspondente no Google Sheets no formato horizontal."""
+def salvar_em_planilha(tipo_tratamento, metricas, volumes, nome_paciente, id_paciente,
+                       hash_arquivo=None, substituir_duplicado=False):
+    """
+    Salva métricas e volumes na aba correspondente no Google Sheets no formato horizontal.
+    Se o mesmo arquivo (hash) do mesmo paciente já foi enviado à aba, a linha existente é
+    substituída (substituir_duplicado=True) ou o envio é ignorado. Retorna True se gravou.
+    """
     if gc is None or SHEET_ID is None:
         st.warning("⚠️ Conexão com Google Sheets não configurada corretamente.")
-        return
+        return False
+
+    # Consulta o índice local antes de qualquer chamada à API do Google Sheets
+    linha_existente = None
+    if indice_envios is not None and hash_arquivo:
+        linha_existente = indice_envios.obter_linha(hash_arquivo, id_paciente, tipo_tratamento)
+        if linha_existente and not substituir_duplicado:
+            st.info(
+                f"ℹ️ Este plano já foi adicionado à aba '{tipo_tratamento}' (linha {linha_existente}). "
+                "Nenhuma linha nova foi criada."
+            )
+            return False
 
     try:
         sh = gc.open_by_key(SHEET_ID)
@@ -640,33 +166,275 @@ def salvar_em_planilha(tipo_tratamento, metricas, volumes, nome_paciente, id_pac
             **volumes
         }
 
-        # Lê o cabeçalho atual (primeira linha)
-        cabecalho = ws.row_values(1)
+        # Cabeçalho pelo espelho local, colunas novas e substituição do duplicado (dvh_planilha.py)
+        situacao, linha = gravar_plano(ws, dados, espelho_planilha, linha_existente)
+        if indice_envios is not None and hash_arquivo:
+            indice_envios.registrar(hash_arquivo, id_paciente, tipo_tratamento, linha)
+        if situacao == "substituida" and espelho_planilha is not None:
+            # A linha reescrita troca de valores também no histórico dos percentis
+            carregar_historico().atualizar_linha(tipo_tratamento, linha)
 
-        # Se a planilha estiver vazia (sem cabeçalho), escreve o cabeçalho e os valores
-        if not cabecalho:
-            ws.insert_row(list(dados.keys()), index=1)
-            ws.insert_row(list(dados.values()), index=2)
+        if situacao == "cabecalho":
             st.success(f"✅ Dados enviados à aba '{tipo_tratamento}' com sucesso (novo cabeçalho criado)!")
-            return
+        elif situacao == "substituida":
+            st.success(f"✅ Linha {linha} da aba '{tipo_tratamento}' substituída com sucesso!")
+        else:
+            st.success(f"✅ Dados adicionados à aba '{tipo_tratamento}' com sucesso!")
+        return True
 
-        # Garante que todas as novas métricas apareçam no cabeçalho (em novas colunas se necessário)
-        novos_campos = [campo for campo in dados.keys() if campo not in cabecalho]
-        if novos_campos:
-            ws.insert_cols([novos_campos], col=len(cabecalho) + 1)
-            for i, campo in enumerate(novos_campos):
-                ws.update_cell(1, len(cabecalho) + i + 1, campo)
-            cabecalho += novos_campos  # Atualiza cabeçalho em memória
+    except Exception as e:
+        st.error(f"❌ Erro ao salvar na planilha: {e}")
+        return False
 
-        # Cria uma lista de valores na ordem correta do cabeçalho
-        valores_linha = [dados.get(c, "") for c in cabecalho]
 
-        # Adiciona a nova linha de valores (abaixo das existentes)
-        ws.append_row(valores_linha)
-        st.success(f"✅ Dados adicionados à aba '{tipo_tratamento}' com sucesso!")
+# ------------------------- Curvas DVH (gráfico) -------------------------
 
-    except Exception as e:
-        st.error(f"❌ Erro ao salvar na planilha: {e}")
+# Número máximo de pontos por curva enviados ao navegador
+PONTOS_GRAFICO = 400
+
+@st.cache_data(show_spinner=False)
+def montar_dados_grafico(hash_arquivo, _caminho, nomes_estruturas, n_pontos=PONTOS_GRAFICO):
+    """
+    Monta a tabela do gráfico com as curvas já reduzidas por LTTB (volume em % do total). As curvas
+    são as tabelas que o dvh_motor.py já decodificou para a análise, sem reler o arquivo; o cache é
+    indexado pelo hash do arquivo (o caminho do temporário fica fora da chave).
+    """
+    tabelas = []
+    for nome in nomes_estruturas:
+        curva = tabela_dvh(_caminho, nome)
+        if len(curva) == 0:
+            continue
+        dose, volume = reduzir_curva_lttb(curva[:, 0], volume_relativo(curva), n_pontos)
+        tabelas.append(pd.DataFrame({"Estrutura": nome, "Dose [cGy]": dose, "Volume [%]": volume}))
+
+    if not tabelas:
+        return None
+    return pd.concat(tabelas, ignore_index=True)
+
+
+@st.cache_data(show_spinner=False)
+def carregar_bandas(conteudo):
+    """Lê o .csv de bandas populacionais exportado por dvh_populacao.py."""
+    return pd.read_csv(io.BytesIO(conteudo))
+
+
+def montar_camadas_bandas(bandas, tipo_tratamento, nomes_por_papel):
+    """Monta as faixas p5-p95 e p25-p75 e a mediana da coorte para sobrepor às curvas do plano."""
+    bandas = bandas[bandas["tipo_tratamento"] == tipo_tratamento]
+    bandas = bandas[bandas["estrutura"].isin(list(nomes_por_papel))]
+    if bandas.empty:
+        return None
+
+    bandas = bandas.assign(
+        Estrutura=bandas["estrutura"].map(nomes_por_papel),
+        **{"Dose [cGy]": bandas["dose_cgy"]},
+    )
+    base = alt.Chart(bandas).encode(x=alt.X("Dose [cGy]:Q"), color=alt.Color("Estrutura:N"))
+    faixa_externa = base.mark_area(opacity=0.12).encode(y="p5:Q", y2="p95:Q")
+    faixa_interna = base.mark_area(opacity=0.25).encode(y="p25:Q", y2="p75:Q")
+    mediana = base.mark_line(strokeDash=[4, 4]).encode(y="p50:Q")
+    return faixa_externa + faixa_interna + mediana
+
+
+# ------------------------- Protocolo de tolerâncias -------------------------
+
+@st.cache_resource(show_spinner=False)
+def carregar_protocolo():
+    """Compila as regras do protocolo uma vez por processo (ver dvh_regras.py)."""
+    return ProtocoloRegras.carregar()
+
+
+# ------------------------- Histórico institucional -------------------------
+
+@st.cache_resource(show_spinner=False)
+def carregar_historico():
+    """Arrays ordenados das métricas já registradas, compartilhados entre as sessões (ver dvh_historico.py)."""
+    return HistoricoMetricas(carregar_espelho())
+
+
+def atualizar_historico(tipo_tratamento):
+    """Sincroniza o espelho da aba (se desatualizado) e incorpora as linhas novas ao histórico."""
+    if espelho_planilha is None:
+        return None
+    if gc is not None and SHEET_ID is not None and espelho_planilha.desatualizado(tipo_tratamento):
+        try:
+            espelho_planilha.sincronizar(gc.open_by_key(SHEET_ID).worksheet(tipo_tratamento))
+        except Exception:
+            pass  # sem conexão ou aba ainda inexistente: usa o que já está no espelho
+    historico = carregar_historico()
+    historico.atualizar(tipo_tratamento)
+    return historico
+
+
+def descrever_percentil(historico, tipo_tratamento, n_fracoes, metrica, valor, linha_propria=None):
+    """
+    Texto com o percentil do valor entre os planos anteriores (vazio sem histórico suficiente).
+    A linha em que o próprio plano já foi gravado (linha_propria) fica fora da comparação.
+    """
+    if historico is None:
+        return ""
+    posicao = historico.percentil(tipo_tratamento, n_fracoes, metrica, valor, linha_propria)
+    if posicao is None:
+        return ""
+    percentil, n_planos = posicao
+    return f" · percentil {percentil:.0f} entre {n_planos} planos anteriores"
+
+
+# ------------------------- Análise do arquivo enviado -------------------------
+# bloco de código que guarda na sessão o arquivo enviado e as análises já feitas: cada valor é
+# calculado uma vez por arquivo e parâmetros, e não a cada interação com a página
+
+def preparar_arquivo(conteudo):
+    """
+    Grava o arquivo enviado em um temporário, valida o formato e lê os dados do paciente, uma vez
+    por arquivo. O mesmo caminho é mantido enquanto o arquivo não muda, então a leitura dos blocos
+    do DVH (cache do dvh_motor.py) também é reaproveitada entre as análises.
+    """
+    hash_arquivo = hash_conteudo(conteudo)
+    arquivo = st.session_state.get("arquivo_dvh")
+    if arquivo is not None and arquivo["hash"] == hash_arquivo:
+        return arquivo
+
+    # Arquivo novo: descarta o temporário e as análises do anterior
+    if arquivo is not None and os.path.exists(arquivo["caminho"]):
+        os.unlink(arquivo["caminho"])
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(conteudo)
+    arquivo = {
+        "hash": hash_arquivo,
+        "caminho": tmp.name,
+        "formato_ok": validar_formato_dvh(tmp.name),
+        "paciente": extrair_dados_paciente(tmp.name),
+        "analises": {},  # chave_parametros -> resultado
+    }
+    st.session_state.arquivo_dvh = arquivo
+    return arquivo
+
+
+def analisar_arquivo(arquivo, tipo_tratamento, estruturas, n_fracoes):
+    """Resultado da análise do arquivo com os parâmetros informados, calculado só na primeira vez."""
+    chave = chave_parametros(tipo_tratamento, estruturas, n_fracoes)
+    resultado = arquivo["analises"].get(chave)
+    if resultado is None:
+        # Se o monitor de pasta (dvh_monitor.py) já analisou este arquivo, usa o resultado pronto
+        if os.path.exists(CAMINHO_BANCO):
+            resultado = ArmazemResultados(CAMINHO_BANCO).obter_resultado(arquivo["hash"], chave)
+        if resultado is None:
+            resultado = analisar_dvh(arquivo["caminho"], tipo_tratamento, estruturas, n_fracoes)
+        arquivo["analises"][chave] = resultado
+    return resultado
+
+
+# ------------------------- Seções com reexecução parcial -------------------------
+# bloco de código das seções cujos widgets só mudam a apresentação: cada uma é um fragmento, e
+# interagir com ela reexecuta apenas a própria seção sobre o resultado já guardado
+
+@st.fragment
+def secao_dados_coletados(tipo_tratamento, coletas):
+    if not st.checkbox("Deseja ver todos os dados coletados?"):
+        return
+    st.subheader("📊 Resumo dos volumes e doses utilizados")
+
+    def mostrar_volume(rotulo, valor):
+        if valor is not None:
+            st.write(f"🔹 {rotulo}: {valor:.2f} cm³")
+        else:
+            st.write(f"🔹 {rotulo}: não encontrado")
+
+    def mostrar_valor(rotulo, valor):
+        if valor is not None:
+            st.write(f"🔹 {rotulo}: {valor:.2f} cGy")
+        else:
+            st.write(f"🔹 {rotulo}: não encontrado")
+
+    mostrar_valor("Dose de prescrição", coletas["dose_prescricao"])
+    mostrar_valor("Dose máxima na estrutura Body (cGy)", coletas["dose_max_body"])
+    mostrar_valor("Dose máxima no PTV (cGy)", coletas["dose_max_ptv"])
+    mostrar_valor("Dose mínima no PTV (cGy)", coletas["dose_min_ptv"])
+    mostrar_valor("Dose média no PTV (cGy)", coletas["dose_media_ptv"])
+    mostrar_valor("Desvio-padrão no PTV (cGy)", coletas["dose_std_ptv"])
+    mostrar_valor("Dose que cobre 2% do PTV (cGy)", coletas["d2_ptv"])
+    mostrar_valor("Dose que cobre 5% do PTV (cGy)", coletas["d5_ptv"])
+    mostrar_valor("Dose que cobre 95% do PTV (cGy)", coletas["d95_ptv"])
+    mostrar_valor("Dose que cobre 98% do PTV (cGy)", coletas["d98_ptv"])
+    mostrar_valor("Dose média na estrutura de isodose de 50% (cGy)", coletas["dose_media_iso50"])
+    mostrar_volume("Volume do PTV", coletas["volume_ptv"])
+    mostrar_volume("Volume da interseção (PTV ∩ 100%)", coletas["volume_overlap"])
+    mostrar_volume("Volume da isodose de 100%", coletas["volume_iso100"])
+    mostrar_volume("Volume da isodose de 50%", coletas["volume_iso50"])
+
+    if tipo_tratamento == "SRS (Radiocirurgia)":
+        mostrar_volume("Volume do Encéfalo com dose acima de 10 Gy", coletas["volume_10gy"])
+        mostrar_volume("Volume do Encéfalo com dose acima de 12 Gy", coletas["volume_12gy"])
+        mostrar_volume("Volume do Encéfalo com dose acima de 18 Gy", coletas["volume_18gy"])
+        mostrar_volume("Volume do Encéfalo com dose acima de 20 Gy", coletas["volume_20gy"])
+        mostrar_volume("Volume do Encéfalo com dose acima de 24 Gy", coletas["volume_24gy"])
+        mostrar_volume("Volume do Encéfalo com dose acima de 30 Gy", coletas["volume_30gy"])
+
+    elif tipo_tratamento == "SBRT de Pulmão":
+        mostrar_volume("Volume do Pulmão", coletas["volume_pulmao"])
+        mostrar_volume("Volme do Pulmão recebendo acima de 20Gy", coletas["volume_pulmao_20gy"])
+
+
+@st.fragment
+def secao_planilha(tipo_tratamento, resultado, nome_paciente, id_paciente, hash_arquivo):
+    # ---------------------------------------------------------------
+    # 🔄 Função: enviar dados para a planilha Google Sheets
+    # ---------------------------------------------------------------
+    def enviar_para_planilha():
+        """Envia as métricas e volumes para o Google Sheets."""
+        try:
+            # Envia para a planilha
+            gravado = salvar_em_planilha(
+                tipo_tratamento, resultado["metricas"], resultado["volumes"], nome_paciente, id_paciente,
+                hash_arquivo=hash_arquivo,
+                substituir_duplicado=(st.session_state.acao_duplicado == "Substituir a linha existente"),
+            )
+
+            # ✅ Mostra mensagem de sucesso no placeholder correto
+            if gravado:
+                st.session_state.mensagem_sucesso_placeholder.success(
+                    f"✅ Dados adicionados à aba '{tipo_tratamento}' com sucesso!"
+                )
+
+        except Exception as e:
+            st.session_state.mensagem_sucesso_placeholder.error(f"❌ Erro ao enviar para planilha: {e}")
+
+    def pedir_envio():
+        """Callback da opção: marca o envio e reseta a opção do usuário."""
+        st.session_state.envio_pendente = st.session_state.salvar_opcao == "Sim"
+        # ✅ Reseta a opção de salvamento para "Não"
+        st.session_state.salvar_opcao = "Não"
+
+    # ---------------------------------------------------------------
+    # 🗳️ Interface: Pergunta ao usuário sobre salvar métricas
+    # ---------------------------------------------------------------
+    if "salvar_opcao" not in st.session_state:
+        st.session_state.salvar_opcao = "Não"
+
+    # Cria o placeholder onde a mensagem de sucesso aparecerá
+    st.session_state.mensagem_sucesso_placeholder = st.empty()
+
+    # O que fazer se este plano (mesmo arquivo e paciente) já estiver na planilha
+    st.radio(
+        "Se este plano já estiver na planilha:",
+        ["Ignorar (não duplicar)", "Substituir a linha existente"],
+        key="acao_duplicado",
+        horizontal=True,
+    )
+
+    # Widget de seleção com callback automático
+    st.radio(
+        "Deseja que as métricas calculadas sejam adicionadas à planilha?",
+        ["Não", "Sim"],
+        key="salvar_opcao",
+        on_change=pedir_envio,
+    )
+
+    # O envio é feito aqui, e não no callback: na reexecução do fragmento, o que um callback mostra
+    # iria para o topo da página em vez desta seção
+    if st.session_state.pop("envio_pendente", False):
+        enviar_para_planilha()
 
 
 # ------------------------- Interface Streamlit -------------------------
@@ -676,7 +444,7 @@ st.title("Análise de DVH - Radioterapia")
 st.sidebar.header("Configuração do Caso")
 tipo_tratamento = st.sidebar.selectbox(
     "Selecione o tipo de tratamento:",
-    ["SRS (Radiocirurgia)", "SBRT de Pulmão", "SBRT de Próstata"]
+    TIPOS_TRATAMENTO
 )
 
 st.write("### Nome das estruturas no DVH")
@@ -699,55 +467,27 @@ else:
 
 st.sidebar.header("Upload do Arquivo")
 uploaded_file = st.sidebar.file_uploader("Envie o arquivo .txt do DVH", type="txt")
+arquivo_bandas = st.sidebar.file_uploader("Bandas populacionais (opcional, .csv)", type="csv")
 
 if uploaded_file is not None:
-    # Salvar temporariamente o arquivo para leitura
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(uploaded_file.read())
-        caminho = tmp.name
-    # Extrai nome e ID do paciente (primeiras linhas do DVH)
-        nome_paciente, id_paciente = extrair_dados_paciente(caminho)
+    # Arquivo temporário, validação e dados do paciente uma vez por arquivo enviado (guardados na sessão)
+    conteudo_arquivo = uploaded_file.getvalue()
+    arquivo_dvh = preparar_arquivo(conteudo_arquivo)
+    nome_paciente, id_paciente = arquivo_dvh["paciente"]
 
     st.success("✅ Arquivo carregado com sucesso!")
 
         # ---------------------------------------------------------------
     #  🔍 VALIDAÇÃO DO FORMATO DO ARQUIVO DVH
     # ---------------------------------------------------------------
-    formato_ok = True
-    tipo_ok = False
-    cabecalho_ok = False
-
-    try:
-        with open(caminho, "r", encoding="utf-8") as f:
-            linhas = f.readlines()
-
-        # --- Verifica o campo "Tipo:"
-        for linha in linhas:
-            if linha.lower().startswith("tipo:"):
-                if "histograma de dose volume cumulativo" in linha.lower():
-                    tipo_ok = True
-                break  # encontrou a linha "Tipo:"
-
-        # --- Verifica o cabeçalho do DVH
-        for linha in linhas:
-            if "Dose" in linha and "Volume" in linha:
-                texto = linha.strip().lower()
-                if texto == "dose [cgy]   dose relativa [%] volume da estrutura [cm³]".lower():
-                    cabecalho_ok = True
-                break
-
-        # --- Resultado final da validação
-        formato_ok = tipo_ok and cabecalho_ok
-
-    except Exception:
-        formato_ok = False
+    formato_ok = arquivo_dvh["formato_ok"]
 
     # Se formato estiver incorreto, interrompe o app
     if not formato_ok:
         st.error(
             "❌ O formato do DVH está incorreto.\n\n"
             "Por favor, antes de exportar os dados tabulados do DVH, selecione:\n"
-            "- DVH cumulativo\n"
+            "- DVH cumulativo (ou diferencial)\n"
             "- Dose absoluta\n"
             "- Volume absoluto."
         )
@@ -760,90 +500,36 @@ if uploaded_file is not None:
     else:
         n_frações = None  # para SBRT não usamos isso
 
-    # Coletas
-    dose_prescricao = extrair_dose_prescricao(caminho)
-    dose_max_body = extrair_dose_max_body(caminho)
-    dose_max_ptv = extrair_dose_max_ptv(caminho)
-    dose_min_ptv = extrair_dose_min_ptv(caminho)
-    dose_media_ptv = extrair_dose_media_ptv(caminho)
-    dose_std_ptv = extrair_std_ptv(caminho)
-    dose_media_iso50 = extrair_dose_media_iso50(caminho)
-    volume_ptv = extrair_volume_ptv(caminho)
-    volume_overlap = extrair_volume_overlap(caminho)
-    volume_iso100 = extrair_volume_dose_100(caminho)
-    volume_iso50 = extrair_volume_dose_50(caminho)
-    estrutura_dose = nome_encefalo if tipo_tratamento == "SRS (Radiocirurgia)" else nome_body
-    volume_10gy = extrair_volume_dose_10gy(caminho, estrutura_dose)
-    volume_12gy = extrair_volume_dose_12gy(caminho, estrutura_dose)
-    volume_18gy = extrair_volume_dose_18gy(caminho, estrutura_dose)
-    volume_20gy = extrair_volume_dose_20gy(caminho, estrutura_dose)
-    volume_24gy = extrair_volume_dose_24gy(caminho, estrutura_dose)
-    volume_30gy = extrair_volume_dose_30gy(caminho, estrutura_dose)
-
-    # Doses que cobrem X% do PTV (em cGy)
-    d2_ptv = extrair_dose_cobrindo_pct_ptv(caminho, 0.02, volume_ptv)
-    d5_ptv = extrair_dose_cobrindo_pct_ptv(caminho, 0.05, volume_ptv)
-    d95_ptv = extrair_dose_cobrindo_pct_ptv(caminho, 0.95, volume_ptv)
-    d98_ptv = extrair_dose_cobrindo_pct_ptv(caminho, 0.98, volume_ptv)
-
-    # Métricas principais (estendidas)
-    metricas = calcular_metricas_avancadas(
-        dose_prescricao, dose_max_body, dose_max_ptv, dose_min_ptv,
-        volume_ptv, volume_overlap, volume_iso100, volume_iso50,
-        d2_ptv, d5_ptv, d95_ptv, d98_ptv,
-        dose_media_ptv, dose_std_ptv, dose_media_iso50
-    )
-
-    # --- Cálculo do V20Gy do Pulmão (somente para SBRT de Pulmão) ---
-    if tipo_tratamento == "SBRT de Pulmão" and nome_pulmao:
-        v20gy_pulmao, volume_pulmao_20gy = calcular_v20gy_pulmao(caminho, nome_pulmao)
-    else:
-        v20gy_pulmao, volume_pulmao_20gy = None, None
+    # Coletas e métricas (motor de análise em dvh_motor.py)
+    estruturas = {"ptv": nome_ptv, "body": nome_body, "overlap": nome_overlap, "iso50": nome_iso50}
+    if nome_pulmao:
+        estruturas["pulmao"] = nome_pulmao
+    if nome_encefalo:
+        estruturas["encefalo"] = nome_encefalo
+
+    # Análise feita uma vez por arquivo e parâmetros; as seções abaixo (e os fragmentos, que
+    # reexecutam sozinhos) apenas leem o resultado guardado na sessão
+    resultado = analisar_arquivo(arquivo_dvh, tipo_tratamento, estruturas, n_frações)
+    coletas = resultado["coletas"]
+    metricas = resultado["metricas"]
+
+    # Posição de cada métrica entre os planos já registrados do mesmo tipo e fracionamento
+    historico = atualizar_historico(tipo_tratamento)
+    # Plano já gravado na planilha: a sua própria linha não entra na comparação
+    linha_propria = None
+    if indice_envios is not None:
+        linha_propria = indice_envios.obter_linha(arquivo_dvh["hash"], id_paciente, tipo_tratamento)
+
+    def posicao(metrica, valor):
+        return descrever_percentil(
+            historico, tipo_tratamento, resultado["volumes"].get("Fracionamento"), metrica, valor, linha_propria
+        )
     
     # Impressão das métricas organizadas por blocos com valores ideais
     st.subheader("📈 Métricas Calculadas")
     
-    # Dicionário de valores ideais
-    valores_ideais = {
-        'CI1 (isodose100/PTV)': 1,
-        'CI2 (Overlap/isodose100)': 1,
-        'CI3 (Overlap/PTV)': 1,
-        'CI4 (Paddick)': 1,
-        'HI1 (Dmax_PTV/Dmin_PTV)': 1,
-        'HI2 (Dmax_PTV/D_prescricao)': 1,
-        'HI3 ((D2-D98)/D_prescricao)': 0,
-        'HI4 ((D5-D95)/D_prescricao)': 0,
-        'HI5 (S-índex)': 0,
-        'Gn (Dose integral[PTV]/Dose integral[V50%])': 1,
-    }
-    
-    # Blocos de índices
-    blocos = {
-        "🔹 Índices de Conformidade": [
-            'CI1 (isodose100/PTV)',
-            'CI2 (Overlap/isodose100)',
-            'CI3 (Overlap/PTV)',
-            'CI4 (Paddick)'
-        ],
-        "🔹 Índices de Homogeneidade": [
-            'HI1 (Dmax_PTV/Dmin_PTV)',
-            'HI2 (Dmax_PTV/D_prescricao)',
-            'HI3 ((D2-D98)/D_prescricao)',
-            'HI4 ((D5-D95)/D_prescricao)',
-            'HI5 (S-índex)'
-        ],
-        "🔹 Índices de Gradiente": [
-            'GI1 (isodose50/isodose100)',
-            'GI2 (raio50/raio100)',
-            'GI3 (isodose50/PTV)'
-        ],
-        "🔹 Índice de Eficiência Global": [
-            'Gn (Dose integral[PTV]/Dose integral[V50%])'
-        ]
-    }
-    
     # Impressão formatada
-    for bloco_nome, lista_metricas in blocos.items():
+    for bloco_nome, lista_metricas in BLOCOS_METRICAS.items():
         st.markdown(f"### {bloco_nome}")
         bloco_incompleto = False
     
@@ -853,14 +539,14 @@ if uploaded_file is not None:
                 if nome == 'HI5 (S-índex)':
                     dose_media_norm = metricas.get('Dose média PTV (%)')
                     if dose_media_norm is not None:
-                        st.write(f"• {nome}: {valor:.3f}%, associado a uma dose média de {dose_media_norm:.2f}%.")
+                        st.write(f"• {nome}: {valor:.3f}%, associado a uma dose média de {dose_media_norm:.2f}%.{posicao(nome, valor)}")
                     else:
-                        st.write(f"• {nome}: {valor:.3f}%")
+                        st.write(f"• {nome}: {valor:.3f}%{posicao(nome, valor)}")
                     continue
-                if nome in valores_ideais:
-                    st.markdown(f"• **{nome}:** {valor:.4f}  \nvalor ideal = {valores_ideais[nome]}")
+                if nome in VALORES_IDEAIS:
+                    st.markdown(f"• **{nome}:** {valor:.4f}{posicao(nome, valor)}  \nvalor ideal = {VALORES_IDEAIS[nome]}")
                 else:
-                    st.write(f"• {nome}: {valor:.4f}")
+                    st.write(f"• {nome}: {valor:.4f}{posicao(nome, valor)}")
             else:
                 st.write(f"• {nome}: não calculado (dados insuficientes)")
                 bloco_incompleto = True
@@ -868,154 +554,123 @@ if uploaded_file is not None:
         if bloco_incompleto:
             st.warning("⚠️ Verifique o nome das estruturas.")
 
+    # Métricas calculadas diretamente das curvas do PTV e do Body (não dependem das estruturas
+    # auxiliares de Overlap e Dose 50[%] nem das linhas "Dose média" do arquivo)
+    metricas_curvas = resultado.get("metricas_curvas")
+    if metricas_curvas:
+        st.markdown("### 🔹 Métricas a partir das curvas DVH")
+        for nome, valor in metricas_curvas.items():
+            if valor is not None:
+                st.write(f"• {nome}: {valor:.4f}")
+            else:
+                st.write(f"• {nome}: não calculado (dados insuficientes)")
+
     # Impressão por fração — apenas para SRS
     if tipo_tratamento == "SRS (Radiocirurgia)":   
         st.subheader("📦 Volumes de Dose associados ao desenvolvimento de radionecrose")
         
         if n_frações == 1:
             st.write("🔹 Fracionamento: 1 seção de tratamento")
-            st.write(f"   - Volume de Dose > 10 Gy: {volume_10gy:.2f} cm³" if volume_10gy else "   - Volume de Dose > 10 Gy: não encontrado")
-            st.write(f"   - Volume de Dose > 12 Gy: {volume_12gy:.2f} cm³" if volume_12gy else "   - Volume de Dose > 12 Gy: não encontrado")
+            st.write(f"   - Volume de Dose > 10 Gy: {coletas['volume_10gy']:.2f} cm³{posicao('Volume >10 Gy (cm³)', coletas['volume_10gy'])}" if coletas["volume_10gy"] else "   - Volume de Dose > 10 Gy: não encontrado")
+            st.write(f"   - Volume de Dose > 12 Gy: {coletas['volume_12gy']:.2f} cm³{posicao('Volume >12 Gy (cm³)', coletas['volume_12gy'])}" if coletas["volume_12gy"] else "   - Volume de Dose > 12 Gy: não encontrado")
     
         elif n_frações == 3:
             st.write("🔹 Fracionamento: 3 seções de tratamento")
-            st.write(f"   - Volume de Dose > 18 Gy: {volume_18gy:.2f} cm³" if volume_18gy else "   - Volume de Dose > 18 Gy: não encontrado")
-            st.write(f"   - Volume de Dose > 20 Gy: {volume_20gy:.2f} cm³" if volume_20gy else "   - Volume de Dose > 20 Gy: não encontrado")
+            st.write(f"   - Volume de Dose > 18 Gy: {coletas['volume_18gy']:.2f} cm³{posicao('Volume >18 Gy (cm³)', coletas['volume_18gy'])}" if coletas["volume_18gy"] else "   - Volume de Dose > 18 Gy: não encontrado")
+            st.write(f"   - Volume de Dose > 20 Gy: {coletas['volume_20gy']:.2f} cm³{posicao('Volume >20 Gy (cm³)', coletas['volume_20gy'])}" if coletas["volume_20gy"] else "   - Volume de Dose > 20 Gy: não encontrado")
     
         elif n_frações == 5:
             st.write("🔹 Fracionamento: 5 seções de tratamento")
-            st.write(f"   - Volume de Dose > 24 Gy: {volume_24gy:.2f} cm³" if volume_24gy else "   - Volume de Dose > 24 Gy: não encontrado")
-            st.write(f"   - Volume de Dose > 30 Gy: {volume_30gy:.2f} cm³" if volume_30gy else "   - Volume de Dose > 30 Gy: não encontrado")
+            st.write(f"   - Volume de Dose > 24 Gy: {coletas['volume_24gy']:.2f} cm³{posicao('Volume >24 Gy (cm³)', coletas['volume_24gy'])}" if coletas["volume_24gy"] else "   - Volume de Dose > 24 Gy: não encontrado")
+            st.write(f"   - Volume de Dose > 30 Gy: {coletas['volume_30gy']:.2f} cm³{posicao('Volume >30 Gy (cm³)', coletas['volume_30gy'])}" if coletas["volume_30gy"] else "   - Volume de Dose > 30 Gy: não encontrado")
+
+        # Os limiares de todos os fracionamentos em EQD2, comparáveis entre planos (dvh_biologico.py)
+        volumes_eqd2 = resultado.get("volumes_eqd2")
+        if volumes_eqd2:
+            st.write(f"🔹 Limiares em EQD2 (α/β = {resultado['alfa_beta']:g} Gy), comparáveis entre fracionamentos")
+            for nome, volume in volumes_eqd2.items():
+                st.write(f"   - {nome}: {volume:.2f}" if volume is not None else f"   - {nome}: não encontrado")
 
     # Bloco V20Gy do Pulmão (somente para SBRT de Pulmão)
     if tipo_tratamento == "SBRT de Pulmão":
         st.subheader("📦 Porcentagem do pulmão recebendo acima de 20Gy (V20Gy)")
-        if v20gy_pulmao is not None:
-            st.write(f"• V20Gy do Pulmão = {v20gy_pulmao:.2f}%")
+        if coletas["v20gy_pulmao"] is not None:
+            st.write(f"• V20Gy do Pulmão = {coletas['v20gy_pulmao']:.2f}%{posicao('V20Gy Pulmões Soma (%)', coletas['v20gy_pulmao'])}")
         else:
             st.write("• V20Gy do Pulmão = não calculado (dados insuficientes)")
-    
-    # Impressão opcional dos volumes
-    if st.checkbox("Deseja ver todos os dados coletados?"):
-        st.subheader("📊 Resumo dos volumes e doses utilizados")
 
-        def mostrar_volume(rotulo, valor):
-            if valor is not None:
-                st.write(f"🔹 {rotulo}: {valor:.2f} cm³")
-            else:
-                st.write(f"🔹 {rotulo}: não encontrado")
+    # Conferência com os níveis de tolerância e de ação do protocolo
+    try:
+        conferencia = carregar_protocolo().avaliar_plano(resultado)
+    except Exception as e:
+        st.warning(f"⚠️ Não foi possível carregar o protocolo de tolerâncias: {e}")
+        conferencia = None
+    if conferencia is not None and not conferencia.empty:
+        st.subheader("🩺 Conferência com o protocolo")
+        st.dataframe(conferencia, hide_index=True)
+        st.caption("✅ dentro da tolerância · ⚠️ entre tolerância e ação · ❌ além do nível de ação · — sem dado")
+
+    # Curvas DVH cumulativas das estruturas analisadas
+    st.subheader("📉 Curvas DVH cumulativas")
+    # Nomes como encontrados no arquivo (podem diferir da grafia informada acima)
+    nomes_arquivo = resultado["estruturas"]
+    estruturas_grafico = [nomes_arquivo["ptv"], nomes_arquivo["overlap"], nomes_arquivo["body"]]
+    if tipo_tratamento == "SRS (Radiocirurgia)":
+        estruturas_grafico.append(nomes_arquivo["encefalo"])
+    elif tipo_tratamento == "SBRT de Pulmão":
+        estruturas_grafico.append(nomes_arquivo["pulmao"])
 
-        def mostrar_valor(rotulo, valor):
-            if valor is not None:
-                st.write(f"🔹 {rotulo}: {valor:.2f} cGy")
-            else:
-                st.write(f"🔹 {rotulo}: não encontrado")
-
-        mostrar_valor("Dose de prescrição", dose_prescricao)
-        mostrar_valor("Dose máxima na estrutura Body (cGy)", dose_max_body)
-        mostrar_valor("Dose máxima no PTV (cGy)", dose_max_ptv)
-        mostrar_valor("Dose mínima no PTV (cGy)", dose_min_ptv)
-        mostrar_valor("Dose média no PTV (cGy)", dose_media_ptv)
-        mostrar_valor("Desvio-padrão no PTV (cGy)", dose_std_ptv)
-        mostrar_valor("Dose que cobre 2% do PTV (cGy)", d2_ptv)
-        mostrar_valor("Dose que cobre 5% do PTV (cGy)", d5_ptv)
-        mostrar_valor("Dose que cobre 95% do PTV (cGy)", d95_ptv)
-        mostrar_valor("Dose que cobre 98% do PTV (cGy)", d98_ptv)
-        mostrar_valor("Dose média na estrutura de isodose de 50% (cGy)", dose_media_iso50)
-        mostrar_volume("Volume do PTV", volume_ptv)
-        mostrar_volume("Volume da interseção (PTV ∩ 100%)", volume_overlap)
-        mostrar_volume("Volume da isodose de 100%", volume_iso100)
-        mostrar_volume("Volume da isodose de 50%", volume_iso50)
-        
-        if tipo_tratamento == "SRS (Radiocirurgia)":
-            mostrar_volume("Volume do Encéfalo com dose acima de 10 Gy", volume_10gy)
-            mostrar_volume("Volume do Encéfalo com dose acima de 12 Gy", volume_12gy)
-            mostrar_volume("Volume do Encéfalo com dose acima de 18 Gy", volume_18gy)
-            mostrar_volume("Volume do Encéfalo com dose acima de 20 Gy", volume_20gy)
-            mostrar_volume("Volume do Encéfalo com dose acima de 24 Gy", volume_24gy)
-            mostrar_volume("Volume do Encéfalo com dose acima de 30 Gy", volume_30gy)
-
-        elif tipo_tratamento == "SBRT de Pulmão":
-            volume_pulmao = extrair_volume_por_estrutura(caminho, nome_pulmao)
-            mostrar_volume("Volume do Pulmão", volume_pulmao)
-            mostrar_volume("Volme do Pulmão recebendo acima de 20Gy", volume_pulmao_20gy)
-            
+    dados_grafico = montar_dados_grafico(
+        arquivo_dvh["hash"], arquivo_dvh["caminho"], tuple(n for n in estruturas_grafico if n)
+    )
+    if dados_grafico is not None:
+        grafico = alt.Chart(dados_grafico).mark_line().encode(
+            x=alt.X("Dose [cGy]:Q"),
+            y=alt.Y("Volume [%]:Q"),
+            color=alt.Color("Estrutura:N"),
+            tooltip=["Estrutura", alt.Tooltip("Dose [cGy]:Q", format=".1f"), alt.Tooltip("Volume [%]:Q", format=".2f")],
+        )
 
-    # ---------------------------------------------------------------
-    # 🔄 Função: enviar dados para a planilha Google Sheets
-    # ---------------------------------------------------------------
-    def enviar_para_planilha():
-        """Envia as métricas e volumes para o Google Sheets e reseta a opção do usuário."""
-        try:
-            volumes_dict = {
-                "Dose de prescrição (cGy)": dose_prescricao,
-                "Dose máxima Body (cGy)": dose_max_body,
-                "Dose máxima PTV (cGy)": dose_max_ptv,
-                "Dose mínima PTV (cGy)": dose_min_ptv,
-                "Dose média PTV (cGy)": dose_media_ptv,
-                "STD PTV (cGy)": dose_std_ptv,
-                "D2% do PTV (cGy)": d2_ptv,
-                "D5% do PTV (cGy)": d5_ptv,
-                "D95% do PTV (cGy)": d95_ptv,
-                "D98% do PTV (cGy)": d98_ptv,
-                "Dose média Isodose 50% (cGy)": dose_media_iso50,
-                "Volume PTV (cm³)": volume_ptv,
-                "Volume Overlap (cm³)": volume_overlap,
-                "Volume Isodose 100% (cm³)": volume_iso100,
-                "Volume Isodose 50% (cm³)": volume_iso50,
-            }
-    
-            # Adiciona volumes específicos conforme tipo de tratamento
-            if tipo_tratamento == "SRS (Radiocirurgia)":
-                volumes_dict.update({
-                    "Volume >10 Gy (cm³)": volume_10gy,
-                    "Volume >12 Gy (cm³)": volume_12gy,
-                    "Volume >18 Gy (cm³)": volume_18gy,
-                    "Volume >20 Gy (cm³)": volume_20gy,
-                    "Volume >24 Gy (cm³)": volume_24gy,
-                    "Volume >30 Gy (cm³)": volume_30gy,
-                    "Fracionamento": n_frações,
-                })
-    
-            elif tipo_tratamento == "SBRT de Pulmão":
-                volume_pulmao = extrair_volume_por_estrutura(caminho, nome_pulmao)
-                volumes_dict.update({
-                    "Volume Pulmões Soma (cm³)": volume_pulmao,
-                    "Volume Pulmões Soma >20 Gy (cm³)": volume_pulmao_20gy,
-                    "V20Gy Pulmões Soma (%)": v20gy_pulmao,
-                })
-    
-            # Envia para a planilha
-            salvar_em_planilha(tipo_tratamento, metricas, volumes_dict, nome_paciente, id_paciente)
-    
-            # ✅ Mostra mensagem de sucesso no placeholder correto
-            st.session_state.mensagem_sucesso_placeholder.success(
-                f"✅ Dados adicionados à aba '{tipo_tratamento}' com sucesso!"
-            )
-    
-            # ✅ Reseta a opção de salvamento para "Não"
-            st.session_state.salvar_opcao = "Não"
-    
-        except Exception as e:
-            st.session_state.mensagem_sucesso_placeholder.error(f"❌ Erro ao enviar para planilha: {e}")
-    
-    
-    # ---------------------------------------------------------------
-    # 🗳️ Interface: Pergunta ao usuário sobre salvar métricas
-    # ---------------------------------------------------------------
-    if "salvar_opcao" not in st.session_state:
-        st.session_state.salvar_opcao = "Não"
-    
-    # Cria o placeholder onde a mensagem de sucesso aparecerá
-    st.session_state.mensagem_sucesso_placeholder = st.empty()
+        # Sobreposição das bandas populacionais (PTV e Encéfalo), se enviadas
+        if arquivo_bandas is not None:
+            nomes_por_papel = {"PTV": nomes_arquivo["ptv"]}
+            if nome_encefalo:
+                nomes_por_papel["Encefalo"] = nomes_arquivo["encefalo"]
+            try:
+                camadas_bandas = montar_camadas_bandas(
+                    carregar_bandas(arquivo_bandas.getvalue()), tipo_tratamento, nomes_por_papel
+                )
+                if camadas_bandas is None:
+                    st.info(f"Nenhuma banda populacional de '{tipo_tratamento}' encontrada no arquivo enviado.")
+            except (KeyError, ValueError) as e:
+                camadas_bandas = None
+                st.warning(f"⚠️ Arquivo de bandas populacionais inválido: {e}")
+            if camadas_bandas is not None:
+                grafico = camadas_bandas + grafico
+
+        st.altair_chart(grafico.interactive())
+    else:
+        st.warning("⚠️ Nenhuma curva encontrada. Verifique o nome das estruturas.")
     
-    # Widget de seleção com callback automático
-    st.radio(
-        "Deseja que as métricas calculadas sejam adicionadas à planilha?",
-        ["Não", "Sim"],
-        key="salvar_opcao",
-        on_change=enviar_para_planilha,
+    # Impressão opcional dos volumes (fragmento: marcar a opção não reexecuta a página)
+    secao_dados_coletados(tipo_tratamento, coletas)
+
+    # 📄 Relatório de QA do plano para download (dvh_relatorio.py)
+    st.subheader("📄 Relatório de QA")
+    nome_relatorio = "QA_" + ("".join(c for c in str(id_paciente) if c.isalnum()) or "plano")
+    coluna_html, coluna_pdf = st.columns(2)
+    # Os relatórios só são montados no clique (em outra thread), e não a cada reexecução da página
+    coluna_html.download_button(
+        "⬇️ Baixar relatório (HTML)", functools.partial(relatorio_html, resultado),
+        file_name=f"{nome_relatorio}.html", mime="text/html", on_click="ignore",
     )
+    coluna_pdf.download_button(
+        "⬇️ Baixar relatório (PDF)", functools.partial(relatorio_pdf, resultado),
+        file_name=f"{nome_relatorio}.pdf", mime="application/pdf", on_click="ignore",
+    )
+
+    # Envio à planilha (fragmento, como o resumo acima)
+    secao_planilha(tipo_tratamento, resultado, nome_paciente, id_paciente, arquivo_dvh["hash"])
 
     # 🔗 Exibe o link clicável para abrir a planilha
     if SHEET_ID:
@@ -1026,21 +681,21 @@ else:
     if tipo_tratamento == "SRS (Radiocirurgia)":
         st.info(
             "Por favor, selecione o tipo de tratamento na barra lateral. Em seguida, envie um arquivo .txt de DVH tabulado em Upload do Arquivo para iniciar a análise. "
-            "O DVH tabulado precisa ser de um gráfico cumulativo, com dose absoluta e volume absoluto. "
+            "O DVH tabulado precisa ser de um gráfico cumulativo (ou diferencial), com dose absoluta e volume absoluto. "
             "No caso de SRS, o DVH deve conter, no mínimo, as estruturas de Corpo, PTV, Interseção entre o PTV e a Isodose de Prescrição, Isodose de 50% e Encéfalo."
         )
 
     elif tipo_tratamento == "SBRT de Pulmão":
         st.info(
             "Por favor, selecione o tipo de tratamento na barra lateral. Em seguida, envie um arquivo .txt de DVH tabulado em Upload do Arquivo para iniciar a análise. "
-            "O DVH tabulado precisa ser de um gráfico cumulativo, com dose absoluta e volume absoluto. "
+            "O DVH tabulado precisa ser de um gráfico cumulativo (ou diferencial), com dose absoluta e volume absoluto. "
             "No caso de SBRT de Pulmão, o DVH deve conter, no mínimo, as estruturas de Corpo, PTV, Interseção entre o PTV e a Isodose de Prescrição, Isodose de 50% e Soma dos Pulmões excluindo o PTV."
         )
 
     elif tipo_tratamento == "SBRT de Próstata":
         st.info(
             "Por favor, selecione o tipo de tratamento na barra lateral. Em seguida, envie um arquivo .txt de DVH tabulado em Upload do Arquivo para iniciar a análise. "
-            "O DVH tabulado precisa ser de um gráfico cumulativo, com dose absoluta e volume absoluto. "
+            "O DVH tabulado precisa ser de um gráfico cumulativo (ou diferencial), com dose absoluta e volume absoluto. "
             "No caso de SBRT de Próstata, o DVH deve conter, no mínimo, as estruturas de Corpo, PTV, Interseção entre o PTV e a Isodose de Prescrição, Isodose de 50%."
         )
 
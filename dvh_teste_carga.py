@@ -0,0 +1,351 @@
+import argparse
+import contextlib
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# ------------------------- Teste de carga da aplicação -------------------------
+# bloco de código que simula várias pessoas usando a aplicação ao mesmo tempo: as sessões rodam a
+# página sem navegador (streamlit.testing) em threads de um único processo, como no servidor do
+# Streamlit, e por isso dividem os caches (st.cache_resource/st.cache_data), o cliente da planilha em
+# memória (dvh_planilha_falsa.py), o índice de envios, o espelho local e o GIL. Cada sessão envia um
+# DVH sintético diferente e grava na planilha. Mede latência por interação, vazão e memória do
+# processo para cada número de sessões simultâneas.
+
+CAMINHO_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dvh_streamlit_app.py")
+
+# Versão do Streamlit em que as partes internas usadas por runtime_compartilhado foram conferidas
+VERSAO_STREAMLIT_TESTADA = "1.66"
+
+# DVH sintético a partir de uma única distribuição de dose radial (esferas concêntricas), para que as
+# estruturas sejam coerentes entre si (Dmax do Body = Dmax do PTV, isodose de prescrição na borda do
+# PTV). Cada estrutura é uma casca (raio interno, raio externo) [cm]; os raios são sorteados por sessão.
+RAIOS_SINTETICOS = {
+    "Body": (0.0, (8.0, 10.0)),
+    "Encefalo": (0.0, (6.5, 7.5)),
+    "Pulmões - PTV": ("ptv", (5.0, 7.0)),
+}
+RAIO_PTV_SINTETICO = (0.5, 1.5)
+
+
+def _numero(valor, casas):
+    return f"{valor:.{casas}f}".replace(".", ",")
+
+
+def _volume_esfera(raio):
+    return 4.0 / 3.0 * np.pi * np.asarray(raio, dtype=float) ** 3
+
+
+def gerar_dvh_sintetico(semente, prescricao_cgy=2400.0, passo_cgy=10.0):
+    """
+    Texto de um DVH tabulado cumulativo no formato exportado pelo Eclipse. A dose cai com o raio,
+    D(r) = Dcentral / (1 + (r / r0)^n), e o volume de cada estrutura acima de uma dose é o da casca
+    dentro da esfera que recebe essa dose; o tamanho do PTV, a dose central, a queda e a cobertura
+    são sorteados a partir da semente (cada semente gera um plano e um paciente diferentes).
+    """
+    sorteio = np.random.default_rng(semente)
+    dose_central = prescricao_cgy * sorteio.uniform(1.2, 1.45)
+    expoente = sorteio.uniform(3.0, 5.0)
+    raio_ptv = sorteio.uniform(*RAIO_PTV_SINTETICO)
+    # Raio da isodose de prescrição em relação ao PTV (abaixo de 1: cobertura menor que 100%)
+    raio_prescricao = raio_ptv * sorteio.uniform(0.97, 1.05)
+    raio_escala = raio_prescricao / (dose_central / prescricao_cgy - 1.0) ** (1.0 / expoente)
+
+    def dose_no_raio(raio):
+        return dose_central / (1.0 + (raio / raio_escala) ** expoente)
+
+    def raio_da_dose(dose):
+        with np.errstate(divide="ignore"):
+            return raio_escala * np.clip(dose_central / dose - 1.0, 0.0, None) ** (1.0 / expoente)
+
+    cascas = {
+        nome: (raio_ptv if interno == "ptv" else interno, sorteio.uniform(*externo))
+        for nome, (interno, externo) in RAIOS_SINTETICOS.items()
+    }
+    cascas["PTV"] = (0.0, raio_ptv)
+    cascas["Overlap"] = (0.0, min(raio_ptv, raio_prescricao))
+    cascas["Dose 50[%]"] = (0.0, float(raio_da_dose(0.5 * prescricao_cgy)))
+
+    dose = np.arange(0.0, dose_central + passo_cgy, passo_cgy)
+    dose_relativa = dose / prescricao_cgy * 100.0
+    raio_dose = raio_da_dose(dose)
+
+    linhas = [
+        f"Nome do paciente: Carga, Sessão {semente}",
+        f"ID do paciente: CARGA{semente:06d}",
+        "Comentário              : DVHs para um plano",
+        "Data                    : 01/01/2025",
+        "Exportado por           : teste de carga",
+        "Tipo: Histograma de dose volume cumulativo",
+        "Descrição               : ",
+        "",
+        "Plano: P1",
+        "Curso: C1",
+        f"Dose total [cGy]: {_numero(prescricao_cgy, 1)}",
+        "% para a dose (%): 100,0",
+        "",
+    ]
+    for nome, (interno, externo) in cascas.items():
+        curva = _volume_esfera(np.clip(raio_dose, interno, externo)) - _volume_esfera(interno)
+        volume = curva[0]
+        dose_media = np.sum(curva[1:]) * passo_cgy / volume
+        linhas += [
+            f"Estrutura: {nome}",
+            "Curso: C1",
+            f"Volume [cm³]: {_numero(volume, 1)}",
+            "Cobertura de dose [%]: 100,0",
+            f"Dose mín [cGy]: {_numero(dose_no_raio(externo), 1)}",
+            f"Dose máx [cGy]: {_numero(dose_no_raio(interno), 1)}",
+            f"Dose média [cGy]: {_numero(dose_media, 1)}",
+            "Dose modal [cGy]: 0,0",
+            "Dose mediana [cGy]: 0,0",
+            "STD [cGy]: 0,0",
+            "",
+            "Dose [cGy]   Dose relativa [%] Volume da estrutura [cm³]",
+        ]
+        linhas += [
+            f"{_numero(d, 3):>11}{_numero(r, 1):>20}{_numero(v, 4):>17}"
+            for d, r, v in zip(dose, dose_relativa, curva)
+        ]
+        linhas.append("")
+    return ("\n".join(linhas) + "\n").encode("utf-8")
+
+
+def _percentil(valores, p):
+    """Percentil pelo posto mais próximo (o mesmo de dvh_servico.testar_carga)."""
+    if not valores:
+        return None
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100.0 * (len(valores) - 1))))]
+
+
+def _memoria_rss_mb():
+    """Memória residente atual do processo [MB] (Linux; None em outros sistemas)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _pico_rss_mb():
+    """Pico de memória residente do processo desde o início [MB] (ru_maxrss vem em kB no Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ------------------------- Sessões simuladas -------------------------
+
+@contextlib.contextmanager
+def runtime_compartilhado():
+    """
+    Um único runtime do Streamlit para todas as sessões do processo, como no servidor. O AppTest
+    instala um runtime próprio na variável global Runtime._instance a cada execução da página e a
+    apaga no fim, então uma sessão terminando derrubaria as outras que ainda estão rodando; aqui
+    Runtime.instance() passa a devolver sempre o mesmo runtime (arquivos de mídia e armazenamento do
+    st.cache_data divididos entre as sessões), e a opção global.appTest fica ligada durante todo o nível.
+    O código compilado da página também é um só, como no servidor: o AppTest compila a página de novo
+    a cada execução, e o ast.parse simultâneo em várias threads falha no Python 3.11.
+    """
+    from unittest.mock import MagicMock, patch
+
+    import streamlit
+
+    try:
+        from streamlit.components.v2.component_manager import BidiComponentManager
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+        from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+        from streamlit.runtime.media_file_manager import MediaFileManager
+        from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+        from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+        from streamlit.testing.v1 import app_test, local_script_runner
+        from streamlit.testing.v1.util import patch_config_options
+        faltando = [
+            nome for modulo, nome in (
+                (Runtime, "instance"), (Runtime, "exists"), (app_test, "ScriptCache"), (local_script_runner, "ScriptCache"),
+            ) if not hasattr(modulo, nome)
+        ]
+    except ImportError as e:
+        faltando = [str(e)]
+    if faltando:
+        raise RuntimeError(
+            f"O teste de carga usa partes internas do Streamlit que mudaram na versão {streamlit.__version__} "
+            f"(faltando: {', '.join(faltando)}). Ele foi conferido com o Streamlit {VERSAO_STREAMLIT_TESTADA}: "
+            f"instale essa versão (pip install \"streamlit=={VERSAO_STREAMLIT_TESTADA}.*\") para rodá-lo."
+        )
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    codigo_pagina = ScriptCache()
+
+    # As threads que abrem as sessões não são de script: o aviso de contexto ausente é esperado
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    with patch.object(Runtime, "instance", classmethod(lambda cls: runtime)), \
+            patch.object(Runtime, "exists", classmethod(lambda cls: True)), \
+            patch("streamlit.testing.v1.app_test.ScriptCache", lambda: codigo_pagina), \
+            patch("streamlit.testing.v1.local_script_runner.ScriptCache", lambda: codigo_pagina), \
+            patch_config_options({"global.appTest": True}):
+        yield runtime
+
+
+def simular_sessao(semente, tipo_tratamento, salvar=True, tempo_limite=120):
+    """
+    Percorre a página como uma pessoa faria: abre, escolhe o tipo de tratamento, envia o DVH,
+    abre o resumo dos dados coletados e (opcionalmente) grava na planilha. Retorna
+    {interação: latência [ms]} e a lista de erros da página.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    conteudo = gerar_dvh_sintetico(semente)
+    latencias = {}
+    erros = []
+
+    def medir(interacao, acao):
+        inicio = time.perf_counter()
+        acao()
+        latencias[interacao] = (time.perf_counter() - inicio) * 1000.0
+        erros.extend(f"{interacao}: {excecao.value}" for excecao in app.exception)
+
+    app = AppTest.from_file(CAMINHO_APP, default_timeout=tempo_limite)
+    medir("abrir", app.run)
+    medir("tipo", lambda: app.sidebar.selectbox[0].set_value(tipo_tratamento).run())
+    medir("upload", lambda: app.sidebar.file_uploader[0].set_value((f"carga_{semente}.txt", conteudo, "text/plain")).run())
+    if not erros:
+        medir("resumo", lambda: app.checkbox[0].check().run())
+        if salvar:
+            medir("planilha", lambda: app.radio(key="salvar_opcao").set_value("Sim").run())
+    return latencias, erros
+
+
+def _sessao_na_thread(semente, tipo_tratamento, salvar, barreira):
+    """Uma sessão por thread; todas as sessões do nível começam juntas."""
+    barreira.wait()
+    inicio = time.time()
+    try:
+        latencias, erros = simular_sessao(semente, tipo_tratamento, salvar)
+    except Exception as e:
+        latencias, erros = {}, [f"sessão: {type(e).__name__}: {e}"]
+    return latencias, erros, inicio, time.time()
+
+
+def aquecer(tipo_tratamento):
+    """Uma sessão fora da medida: importações, compilação e primeira execução da página no processo."""
+    with runtime_compartilhado():
+        simular_sessao(10**6, tipo_tratamento, salvar=False)
+
+
+def executar_nivel(n_sessoes, tipo_tratamento, semente_inicial=0, salvar=True, medir_memoria=True):
+    """
+    Roda n_sessoes simultâneas no processo e resume latências, vazão e memória do nível. A memória
+    é a do processo que atende todas as sessões: pico do tracemalloc durante o nível (acima do que
+    já estava alocado no início) e pico da memória residente (RSS) do processo.
+    """
+    barreira = threading.Barrier(n_sessoes)
+    if medir_memoria:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        alocado_inicio = tracemalloc.get_traced_memory()[0]
+    rss_inicio = _memoria_rss_mb()
+
+    with runtime_compartilhado(), ThreadPoolExecutor(max_workers=n_sessoes) as executor:
+        futuros = [
+            executor.submit(_sessao_na_thread, semente_inicial + i, tipo_tratamento, salvar, barreira)
+            for i in range(n_sessoes)
+        ]
+        sessoes = [futuro.result() for futuro in futuros]
+
+    pico = None
+    if medir_memoria:
+        pico = (tracemalloc.get_traced_memory()[1] - alocado_inicio) / 2**20
+        tracemalloc.stop()
+
+    duracao = max(fim for *_, fim in sessoes) - min(inicio for *_, inicio, _ in sessoes)
+    todas = [latencia for latencias, *_ in sessoes for latencia in latencias.values()]
+    uploads = [latencias["upload"] for latencias, *_ in sessoes if "upload" in latencias]
+    erros = [erro for _, erros_sessao, *_ in sessoes for erro in erros_sessao]
+    return {
+        "sessoes": n_sessoes,
+        "interacoes": len(todas),
+        "erros": len(erros),
+        "duracao_s": duracao,
+        "vazao_interacoes_s": len(todas) / duracao if duracao else None,
+        "vazao_planos_s": len(uploads) / duracao if duracao else None,
+        "p50_ms": _percentil(todas, 50),
+        "p95_ms": _percentil(todas, 95),
+        "p99_ms": _percentil(todas, 99),
+        "upload_p50_ms": _percentil(uploads, 50),
+        "upload_p95_ms": _percentil(uploads, 95),
+        "pico_memoria_mb": pico,
+        "memoria_por_sessao_mb": pico / n_sessoes if pico is not None else None,
+        "rss_inicio_mb": rss_inicio,
+        "rss_pico_mb": _pico_rss_mb(),
+        "exemplos_erros": erros[:3],
+    }
+
+
+# ------------------------- Linha de comando -------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da aplicação com sessões simultâneas simuladas.")
+    parser.add_argument("--sessoes", type=int, nargs="+", default=[1, 4, 8], help="Números de sessões simultâneas")
+    parser.add_argument("--tipo", default="SRS (Radiocirurgia)", help="Tipo de tratamento escolhido nas sessões")
+    parser.add_argument("--sem-planilha", action="store_true", help="Não gravar na planilha em memória")
+    parser.add_argument("--sem-memoria", action="store_true", help="Não medir memória (tracemalloc deixa tudo mais lento)")
+    parser.add_argument("--pasta-dados", help="Pasta do banco local (padrão: pasta temporária nova)")
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados de cada nível")
+    args = parser.parse_args()
+
+    # Antes da primeira execução da página: planilha em memória e banco local isolado do real
+    os.environ["DVH_PLANILHA_FALSA"] = os.environ.get("DVH_PLANILHA_FALSA") or "teste-de-carga"
+    os.environ["DVH_PASTA_DADOS"] = args.pasta_dados or tempfile.mkdtemp(prefix="dvh_carga_")
+
+    import streamlit
+
+    if not streamlit.__version__.startswith(VERSAO_STREAMLIT_TESTADA + "."):
+        print(
+            f"⚠️ Streamlit {streamlit.__version__}: o teste de carga foi conferido com o {VERSAO_STREAMLIT_TESTADA} "
+            "e usa partes internas dele; confira se as sessões rodam sem erros."
+        )
+    aquecer(args.tipo)
+    resultados = []
+    semente = 0
+    colunas = (
+        ("sessões", "sessoes", 8, "d"), ("p50 ms", "p50_ms", 9, ".0f"), ("p95 ms", "p95_ms", 9, ".0f"),
+        ("p99 ms", "p99_ms", 9, ".0f"), ("upload p95", "upload_p95_ms", 11, ".0f"), ("planos/s", "vazao_planos_s", 9, ".2f"),
+        ("pico MB", "pico_memoria_mb", 8, ".1f"), ("MB/sessão", "memoria_por_sessao_mb", 10, ".1f"),
+        ("RSS MB", "rss_pico_mb", 7, ".0f"), ("erros", "erros", 6, "d"),
+    )
+    print(" ".join(f"{titulo:>{largura}}" for titulo, _, largura, _ in colunas))
+    for n_sessoes in args.sessoes:
+        resultado = executar_nivel(
+            n_sessoes, args.tipo, semente, salvar=not args.sem_planilha, medir_memoria=not args.sem_memoria
+        )
+        semente += n_sessoes
+        resultados.append(resultado)
+        print(" ".join(
+            f"{resultado[chave]:>{largura}{formato}}" if resultado[chave] is not None else f"{'—':>{largura}}"
+            for _, chave, largura, formato in colunas
+        ))
+        for erro in resultado["exemplos_erros"]:
+            print(f"   ❌ {erro}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados salvos em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
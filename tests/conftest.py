@@ -0,0 +1,119 @@
+import math
+import os
+import sys
+
+import pytest
+
+# Os módulos da aplicação ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ------------------------- DVH sintético para os testes -------------------------
+# bloco de código que monta um DVH tabulado no formato exportado pelo Eclipse a partir de uma única
+# distribuição de dose radial (esferas concêntricas), para que as estruturas sejam coerentes entre si
+
+PRESCRICAO_CGY = 2400.0
+DOSE_CENTRAL_CGY = 1.3 * PRESCRICAO_CGY
+EXPOENTE_QUEDA = 4.0
+
+# Raio [cm] de cada estrutura; a isodose de 50% e o Overlap vêm da própria distribuição de dose
+RAIO_PTV = 1.06
+RAIOS_ESTRUTURAS = {"Body": 9.0, "PTV": RAIO_PTV, "Encefalo": 7.0}
+
+# A isodose de prescrição coincide com a borda do PTV
+RAIO_ESCALA = RAIO_PTV / (DOSE_CENTRAL_CGY / PRESCRICAO_CGY - 1.0) ** (1.0 / EXPOENTE_QUEDA)
+
+
+def dose_no_raio(raio):
+    return DOSE_CENTRAL_CGY / (1.0 + (raio / RAIO_ESCALA) ** EXPOENTE_QUEDA)
+
+
+def raio_da_dose(dose):
+    """Raio da esfera que recebe pelo menos a dose (infinito para dose nula)."""
+    if dose <= 0:
+        return math.inf
+    if dose >= DOSE_CENTRAL_CGY:
+        return 0.0
+    return RAIO_ESCALA * (DOSE_CENTRAL_CGY / dose - 1.0) ** (1.0 / EXPOENTE_QUEDA)
+
+
+def _volume_esfera(raio):
+    return 4.0 / 3.0 * math.pi * raio ** 3
+
+
+def raios_das_estruturas():
+    raios = dict(RAIOS_ESTRUTURAS)
+    raios["Overlap"] = min(RAIO_PTV, raio_da_dose(PRESCRICAO_CGY))
+    raios["Dose 50[%]"] = raio_da_dose(0.5 * PRESCRICAO_CGY)
+    return raios
+
+
+def exportar_dvh(decimal=",", fim_linha="\n", passo_cgy=10.0, linhas_extras=None, diferencial=False):
+    """
+    Texto do DVH cumulativo (ou diferencial, com volume por cGy). `linhas_extras` é
+    {estrutura: {posição na tabela: [linhas]}}, para inserir linhas malformadas no meio de uma tabela.
+    """
+    def numero(valor, casas):
+        return f"{valor:.{casas}f}".replace(".", decimal)
+
+    linhas_extras = linhas_extras or {}
+    n_pontos = int(DOSE_CENTRAL_CGY / passo_cgy) + 2
+    doses = [i * passo_cgy for i in range(n_pontos)]
+
+    linhas = [
+        "Nome do paciente: Teste, Sintético",
+        "ID do paciente: 000123",
+        "Comentário              : DVHs para um plano",
+        "Data                    : 01/01/2025",
+        "Exportado por           : testes",
+        f"Tipo: Histograma de dose volume {'diferencial' if diferencial else 'cumulativo'}",
+        "Descrição               : ",
+        "",
+        "Plano: P1",
+        "Curso: C1",
+        f"Dose total [cGy]: {numero(PRESCRICAO_CGY, 1)}",
+        f"% para a dose (%): {numero(100.0, 1)}",
+        "",
+    ]
+    for nome, raio in raios_das_estruturas().items():
+        volumes = [_volume_esfera(min(raio, raio_da_dose(dose))) for dose in doses]
+        dose_media = sum(volumes[1:]) * passo_cgy / volumes[0]
+        linhas += [
+            f"Estrutura: {nome}",
+            "Curso: C1",
+            f"Volume [cm³]: {numero(volumes[0], 1)}",
+            f"Cobertura de dose [%]: {numero(100.0, 1)}",
+            f"Dose mín [cGy]: {numero(dose_no_raio(raio), 1)}",
+            f"Dose máx [cGy]: {numero(DOSE_CENTRAL_CGY, 1)}",
+            f"Dose média [cGy]: {numero(dose_media, 1)}",
+            f"Dose modal [cGy]: {numero(0.0, 1)}",
+            f"Dose mediana [cGy]: {numero(0.0, 1)}",
+            f"STD [cGy]: {numero(0.0, 1)}",
+            "",
+            f"Dose [cGy]   Dose relativa [%] Volume da estrutura [{'cm³/cGy' if diferencial else 'cm³'}]",
+        ]
+        casas_volume = 4
+        if diferencial:
+            # Volume de cada bin por cGy; o último bin leva o que resta acima dele
+            volumes = [(v - proximo) / passo_cgy for v, proximo in zip(volumes, volumes[1:] + [0.0])]
+            casas_volume = 10
+        extras = linhas_extras.get(nome, {})
+        for i, (dose, volume) in enumerate(zip(doses, volumes)):
+            linhas += extras.get(i, [])
+            linhas.append(
+                f"{numero(dose, 3):>11}{numero(dose / PRESCRICAO_CGY * 100.0, 1):>20}{numero(volume, casas_volume):>17}"
+            )
+        linhas.append("")
+    return fim_linha.join(linhas) + fim_linha
+
+
+@pytest.fixture
+def gravar_dvh(tmp_path):
+    """Grava o texto de um DVH em um arquivo do teste (fins de linha preservados) e retorna o caminho."""
+    contador = iter(range(1000))
+
+    def gravar(texto):
+        caminho = tmp_path / f"dvh_{next(contador)}.txt"
+        caminho.write_bytes(texto.encode("utf-8"))
+        return str(caminho)
+
+    return gravar
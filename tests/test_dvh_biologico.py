@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from conftest import exportar_dvh
+from dvh_biologico import bed, eqd2, validar_alfa_beta, volumes_acima
+from dvh_motor import CachePlanos, analisar_conteudo_dvh, analisar_dvh, calcular_volumes_eqd2, tabela_dvh
+from dvh_resultados import chave_parametros
+
+SRS = "SRS (Radiocirurgia)"
+
+
+# ------------------------- BED/EQD2 -------------------------
+
+@pytest.mark.parametrize("dose_cgy, n_fracoes, alfa_beta, esperado_cgy", [
+    (1000.0, 1, 2.0, 3000.0),   # 10 Gy em 1 fx
+    (2400.0, 5, 2.0, 4080.0),   # 24 Gy em 5 fx
+    (1800.0, 3, 2.0, 3600.0),   # 18 Gy em 3 fx
+    (6000.0, 30, 3.0, 6000.0),  # 2 Gy por fração: EQD2 = dose física
+    (2000.0, 1, 10.0, 5000.0),  # 20 Gy em 1 fx, α/β = 10
+])
+def test_eqd2_valores_conhecidos(dose_cgy, n_fracoes, alfa_beta, esperado_cgy):
+    assert float(eqd2(dose_cgy, n_fracoes, alfa_beta)) == pytest.approx(esperado_cgy)
+
+
+def test_bed_valores_conhecidos():
+    assert float(bed(1000.0, 1, 2.0)) == pytest.approx(6000.0)
+    assert float(bed(2400.0, 5, 10.0)) == pytest.approx(3552.0)
+    np.testing.assert_allclose(bed([0.0, 1000.0], 1, 2.0), [0.0, 6000.0])
+
+
+@pytest.mark.parametrize("alfa_beta", [0, -2, "0", "abc", None, float("nan"), float("inf")])
+def test_alfa_beta_invalido(alfa_beta):
+    with pytest.raises(ValueError, match="α/β"):
+        validar_alfa_beta(alfa_beta)
+
+
+def test_analise_recusa_alfa_beta_invalido(gravar_dvh):
+    caminho = gravar_dvh(exportar_dvh())
+    with pytest.raises(ValueError, match="α/β"):
+        analisar_dvh(caminho, SRS, n_fracoes=1, alfa_beta=0)
+    with pytest.raises(ValueError, match="α/β"):
+        analisar_conteudo_dvh(exportar_dvh().encode("utf-8"), SRS, n_fracoes=1, alfa_beta=-1, cache=CachePlanos())
+
+
+# ------------------------- Volumes acima de um limiar -------------------------
+
+def test_volumes_acima_no_primeiro_ponto_com_dose_maior_ou_igual():
+    doses = np.array([0.0, 10.0, 20.0, 30.0])
+    volumes = np.array([5.0, 4.0, 3.0, 2.0])
+    # Em um ponto da grade, o próprio ponto; entre pontos, o seguinte
+    np.testing.assert_array_equal(volumes_acima(doses, volumes, [0.0, 10.0, 10.5, 20.0, 30.0]), [5.0, 4.0, 3.0, 3.0, 2.0])
+
+
+def test_volumes_acima_da_dose_maxima_sao_nan():
+    resultado = volumes_acima(np.array([0.0, 10.0]), np.array([5.0, 4.0]), [10.0, 10.01, 50.0])
+    assert resultado[0] == 4.0
+    assert np.isnan(resultado[1:]).all()
+
+
+def test_volumes_eqd2_do_plano_de_fracao_unica(gravar_dvh):
+    caminho = gravar_dvh(exportar_dvh())
+    tabela = tabela_dvh(caminho, "Encefalo")
+    volumes = calcular_volumes_eqd2(caminho, "Encefalo", 1, alfa_beta=2.0)
+
+    def volume_fisico(dose_cgy):
+        return tabela[np.searchsorted(tabela[:, 0], dose_cgy), 2]
+
+    # Limiares de 1 fx no plano de 1 fx: EQD2 dos dois lados, o volume é o da dose física
+    assert volumes["Volume EQD2 >30.0 Gy (≡ 10 Gy em 1 fx) (cm³)"] == volume_fisico(1000.0)
+    assert volumes["Volume EQD2 >42.0 Gy (≡ 12 Gy em 1 fx) (cm³)"] == volume_fisico(1200.0)
+    # 18 Gy em 3 fx = EQD2 36 Gy, atingido em 1 fx com D·(1 + D/2 Gy) / 2 = 36 Gy: D = √145 - 1 Gy
+    dose_equivalente = 100.0 * (np.sqrt(145.0) - 1.0)
+    assert dose_equivalente == pytest.approx(1104.16, abs=0.01)
+    assert volumes["Volume EQD2 >36.0 Gy (≡ 18 Gy em 3 fx) (cm³)"] == volume_fisico(dose_equivalente)
+
+
+# ------------------------- Chaves de cache com o α/β -------------------------
+
+def test_alfa_beta_muda_as_chaves_de_cache():
+    assert chave_parametros(SRS, {}, 1, alfa_beta=2.0) != chave_parametros(SRS, {}, 1, alfa_beta=3.0)
+    assert chave_parametros(SRS, {}, 1, alfa_beta=2) == chave_parametros(SRS, {}, 1, alfa_beta=2.0)
+
+    cache, conteudo = CachePlanos(), exportar_dvh().encode("utf-8")
+    com_2 = analisar_conteudo_dvh(conteudo, SRS, n_fracoes=1, alfa_beta=2.0, cache=cache)
+    com_3 = analisar_conteudo_dvh(conteudo, SRS, n_fracoes=1, alfa_beta=3.0, cache=cache)
+    assert len(cache._itens) == 2
+    assert com_2 is not com_3
+    assert com_2["alfa_beta"] == 2.0 and com_3["alfa_beta"] == 3.0
+    assert com_2["volumes_eqd2"].keys() != com_3["volumes_eqd2"].keys()
+    assert analisar_conteudo_dvh(conteudo, SRS, n_fracoes=1, alfa_beta=2, cache=cache) is com_2
@@ -0,0 +1,93 @@
+import math
+
+import numpy as np
+import pytest
+
+from conftest import dose_no_raio, exportar_dvh, raios_das_estruturas
+from dvh_curvas import reduzir_curva_lttb
+from dvh_motor import analisar_dvh
+
+SRS = "SRS (Radiocirurgia)"
+
+
+@pytest.fixture
+def resultado(gravar_dvh):
+    return analisar_dvh(gravar_dvh(exportar_dvh()), SRS, n_fracoes=1)
+
+
+def _dose_media_esfera(raio, passos=20000):
+    """Dose média da esfera no modelo radial, integrada em cascas finas (ponto médio)."""
+    soma = 0.0
+    for i in range(passos):
+        r = (i + 0.5) * raio / passos
+        soma += dose_no_raio(r) * 4.0 * math.pi * r ** 2 * raio / passos
+    return soma / (4.0 / 3.0 * math.pi * raio ** 3)
+
+
+# ------------------------- Métricas calculadas das curvas -------------------------
+
+def test_dose_media_pela_integral_da_curva(resultado):
+    curvas = resultado["metricas_curvas"]
+    raio_ptv = raios_das_estruturas()["PTV"]
+
+    assert curvas["Dose média PTV (curva, cGy)"] == pytest.approx(_dose_media_esfera(raio_ptv), rel=1e-3)
+    # A linha "Dose média" exportada soma a curva pelo ponto de cima de cada intervalo: até meio passo
+    # (5 cGy) abaixo da integral pelos trapézios
+    diferenca = curvas["Dose média PTV (curva, cGy)"] - resultado["coletas"]["dose_media_ptv"]
+    assert 0.0 <= diferenca <= 5.0 + 0.1
+
+
+def test_nomes_das_curvas_nao_repetem_colunas_da_planilha(resultado):
+    colunas_planilha = set(resultado["metricas"]) | set(resultado["volumes"])
+    assert not colunas_planilha & set(resultado["metricas_curvas"])
+
+
+def test_volume_de_isodose_igual_ao_da_tabela_do_body(resultado):
+    curvas, coletas = resultado["metricas_curvas"], resultado["coletas"]
+    # 100% e 50% da prescrição caem em pontos da tabela: a interpolação devolve o próprio ponto
+    assert curvas["Volume Isodose 100% (curva, cm³)"] == coletas["volume_iso100"]
+    assert curvas["Volume Isodose 50% (curva, cm³)"] == coletas["volume_iso50"]
+    raio_50 = raios_das_estruturas()["Dose 50[%]"]
+    assert curvas["Volume Isodose 50% (curva, cm³)"] == pytest.approx(4.0 / 3.0 * math.pi * raio_50 ** 3, abs=1e-3)
+    assert curvas["Isodose 100%/PTV"] == pytest.approx(coletas["volume_iso100"] / coletas["volume_ptv"])
+
+
+def test_gn_das_curvas_proximo_do_gn_da_planilha(resultado):
+    gn_planilha = resultado["metricas"]["Gn (Dose integral[PTV]/Dose integral[V50%])"]
+    # Mesma razão, com as integrais das curvas no lugar das doses médias exportadas
+    assert resultado["metricas_curvas"]["Gn (curvas)"] == pytest.approx(gn_planilha, rel=2e-3)
+
+
+# ------------------------- Redução de pontos (LTTB) -------------------------
+
+def _curva_com_ombro():
+    """Platô de 100% até 1000 cGy, queda linear até 1100 cGy e zero depois, em passos de 1 cGy."""
+    x = np.arange(0.0, 3000.0)
+    return x, np.clip(100.0 - (x - 1000.0), 0.0, 100.0)
+
+
+@pytest.mark.parametrize("n_pontos", [3, 4, 20, 500, 2999])
+def test_lttb_mantem_extremos_e_numero_de_pontos(n_pontos):
+    x, y = _curva_com_ombro()
+    rx, ry = reduzir_curva_lttb(x, y, n_pontos)
+    assert len(rx) == len(ry) == n_pontos
+    assert (rx[0], ry[0], rx[-1], ry[-1]) == (x[0], y[0], x[-1], y[-1])
+    # Pontos da curva original, em ordem e sem repetição
+    assert np.all(np.diff(rx) > 0)
+    np.testing.assert_array_equal(ry, y[rx.astype(int)])
+
+
+def test_lttb_preserva_o_ombro_e_a_queda():
+    x, y = _curva_com_ombro()
+    rx, ry = reduzir_curva_lttb(x, y, 20)
+    assert 999.0 in rx and 1100.0 in rx
+    assert np.abs(np.interp(x, rx, ry) - y).max() < 1.0
+
+
+@pytest.mark.parametrize("n, n_pontos", [(10, 10), (10, 50), (2, 3), (0, 5), (100, 2), (100, 0)])
+def test_lttb_devolve_curvas_curtas_sem_mudanca(n, n_pontos):
+    x = np.linspace(0.0, 1.0, n)
+    y = x ** 2
+    rx, ry = reduzir_curva_lttb(list(x), list(y), n_pontos)
+    np.testing.assert_array_equal(rx, x)
+    np.testing.assert_array_equal(ry, y)
@@ -0,0 +1,65 @@
+import pytest
+
+from dvh_estruturas import ALIASES_PADRAO, IndiceEstruturas, normalizar_nome, resolver_estruturas
+
+SRS = "SRS (Radiocirurgia)"
+PULMAO = "SBRT de Pulmão"
+
+
+@pytest.mark.parametrize("nome, chave", [
+    ("Pulmões - PTV", "pulmoesptv"),
+    ("Encéfalo", "encefalo"),
+    ("  ENCEFALO ", "encefalo"),
+    ("Dose 50[%]", "dose50"),
+    ("Straße", "strasse"),
+])
+def test_normalizacao_sem_acentos_maiusculas_e_pontuacao(nome, chave):
+    assert normalizar_nome(nome) == chave
+
+
+def test_nome_com_outra_grafia_e_encontrado():
+    indice = IndiceEstruturas(["PTV", "Encéfalo", "Pulmoes-PTV"])
+    assert indice.resolver("ptv") == "PTV"
+    assert indice.resolver("Encefalo") == "Encéfalo"
+    assert indice.resolver("Pulmões - PTV") == "Pulmoes-PTV"
+    assert indice.resolver("Tronco") is None
+    assert "encefalo" in indice
+
+
+def test_alias_quando_o_nome_nao_existe():
+    indice = IndiceEstruturas(["External", "Brain", "Iso 50"])
+    estruturas = resolver_estruturas(
+        indice, SRS, {"body": "Body", "encefalo": "Encefalo", "iso50": "Dose 50[%]", "ptv": "PTV"}
+    )
+    # "Iso 50" é "Iso50" normalizado; o PTV não existe e fica como informado
+    assert estruturas == {"body": "External", "encefalo": "Brain", "iso50": "Iso 50", "ptv": "PTV"}
+
+
+def test_aliases_de_outro_tipo_de_tratamento_nao_valem():
+    indice = IndiceEstruturas(["Brain"])
+    assert resolver_estruturas(indice, PULMAO, {"encefalo": "Encefalo"}) == {"encefalo": "Encefalo"}
+    assert "Brain" in ALIASES_PADRAO[SRS]["encefalo"]
+
+
+def test_nome_exato_vence_o_alias():
+    # Os dois existem: o nome informado é usado, não o primeiro alias do papel
+    indice = IndiceEstruturas(["Body", "External"])
+    assert resolver_estruturas(indice, SRS, {"body": "External"}) == {"body": "External"}
+    assert indice.resolver("External", ["Body"]) == "External"
+
+
+def test_colisao_de_nomes_normalizados_nao_escolhe_nenhum():
+    indice = IndiceEstruturas(["PTV 1", "PTV-1", "PTV_2"])
+    assert indice.colisoes == {"ptv1": ["PTV 1", "PTV-1"]}
+    # Só pela chave normalizada: ambíguo, tratado como ausente (sem cair nos aliases)
+    assert indice.resolver("ptv1", ["PTV_2"]) is None
+    assert "Ptv.1" not in indice
+    # O nome exato continua resolvendo
+    assert indice.resolver("ptv-1") == "PTV-1"
+    assert indice.resolver("PTV 2") == "PTV_2"
+
+
+def test_mesmo_nome_repetido_nao_e_colisao():
+    indice = IndiceEstruturas(["PTV", "PTV", "ptv"])
+    assert indice.colisoes == {}
+    assert indice.resolver("P.T.V.") == "PTV"
@@ -0,0 +1,48 @@
+import pytest
+
+from dvh_historico import MINIMO_PLANOS, HistoricoMetricas
+from dvh_planilha import EspelhoPlanilha, gravar_plano
+from dvh_planilha_falsa import ClienteFalso
+
+ABA = "SRS (Radiocirurgia)"
+
+
+@pytest.fixture
+def planilha(tmp_path):
+    """Aba com MINIMO_PLANOS + 1 planos de 1 fração (CI1 = 1.0, 1.1, ...) e o espelho sincronizado."""
+    aba = ClienteFalso().open_by_key("teste").add_worksheet(title=ABA)
+    espelho = EspelhoPlanilha(str(tmp_path / "resultados.sqlite3"))
+    for i in range(MINIMO_PLANOS + 1):
+        gravar_plano(aba, {"ID do Paciente": str(i), "Fracionamento": "1", "CI1": f"{1.0 + i / 10:.1f}"}, espelho)
+    return aba, espelho
+
+
+def test_percentil_entre_os_planos_da_coorte(planilha):
+    _, espelho = planilha
+    historico = HistoricoMetricas(espelho)
+    assert historico.atualizar(ABA) == MINIMO_PLANOS + 1
+
+    assert historico.percentil(ABA, 1, "CI1", 1.25) == (50.0, 6)
+    assert historico.percentil(ABA, 3, "CI1", 1.25) is None
+
+
+def test_proprio_plano_fica_fora_do_percentil(planilha):
+    _, espelho = planilha
+    historico = HistoricoMetricas(espelho)
+    historico.atualizar(ABA)
+
+    # O plano da linha 7 (CI1 = 1.5) comparado aos outros cinco: acima de todos
+    assert historico.percentil(ABA, 1, "CI1", 1.5) == (100 * 5.5 / 6, 6)
+    assert historico.percentil(ABA, 1, "CI1", 1.5, linha_propria=7) == (100.0, 5)
+
+
+def test_linha_substituida_troca_os_valores_do_historico(planilha):
+    aba, espelho = planilha
+    historico = HistoricoMetricas(espelho)
+    historico.atualizar(ABA)
+
+    gravar_plano(aba, {"ID do Paciente": "0", "Fracionamento": "1", "CI1": "2.0"}, espelho, linha_existente=2)
+    historico.atualizar_linha(ABA, 2)
+
+    assert list(historico.valores[(ABA, 1)]["CI1"]) == [1.1, 1.2, 1.3, 1.4, 1.5, 2.0]
+    assert historico.atualizar(ABA) == 0
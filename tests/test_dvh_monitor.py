@@ -0,0 +1,180 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import dvh_monitor
+from conftest import exportar_dvh
+from dvh_monitor import MonitorPasta, ObservadorInotify, ObservadorPolling, criar_observador
+from dvh_resultados import ArmazemResultados, conectar
+
+SRS = "SRS (Radiocirurgia)"
+INVALIDO = b"Arquivo que nao e um DVH tabulado\n"
+
+
+@pytest.fixture
+def pasta(tmp_path):
+    caminho = tmp_path / "exportacoes"
+    caminho.mkdir()
+    return caminho
+
+
+@pytest.fixture
+def armazem(tmp_path):
+    return ArmazemResultados(str(tmp_path / "resultados.sqlite3"))
+
+
+@pytest.fixture
+def analises(monkeypatch):
+    """Arquivos entregues ao motor de análise, na ordem."""
+    lidos = []
+    analisar = dvh_monitor.analisar_conteudo_dvh
+
+    def contar(conteudo, *args, **kwargs):
+        lidos.append(conteudo)
+        return analisar(conteudo, *args, **kwargs)
+
+    monkeypatch.setattr(dvh_monitor, "analisar_conteudo_dvh", contar)
+    return lidos
+
+
+def _monitor(pasta, armazem, **opcoes):
+    return MonitorPasta(str(pasta), SRS, n_fracoes=1, armazem=armazem, polling=True, **opcoes)
+
+
+# ------------------------- Escolha do observador -------------------------
+
+def test_polling_quando_pedido(pasta):
+    assert isinstance(criar_observador(str(pasta), polling=True), ObservadorPolling)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify só existe no Linux")
+def test_inotify_no_linux(pasta):
+    observador = criar_observador(str(pasta))
+    try:
+        assert isinstance(observador, ObservadorInotify)
+    finally:
+        observador.fechar()
+
+
+def test_polling_quando_inotify_falha(monkeypatch, pasta, capsys):
+    def falhar(self, pasta):
+        raise OSError(24, "limite de observadores")
+
+    monkeypatch.setattr(sys, "platform", "linux")
+    monkeypatch.setattr(ObservadorInotify, "__init__", falhar)
+    assert isinstance(criar_observador(str(pasta)), ObservadorPolling)
+    assert "usando polling" in capsys.readouterr().out
+
+
+def test_polling_detecta_arquivos_novos_e_alterados(pasta):
+    (pasta / "antigo.txt").write_text("a")
+    observador = ObservadorPolling(str(pasta))
+    assert observador.aguardar(0) == set()
+
+    (pasta / "novo.txt").write_text("b")
+    with open(pasta / "antigo.txt", "a") as f:
+        f.write("mais")
+    assert observador.aguardar(0) == {"novo.txt", "antigo.txt"}
+    assert observador.aguardar(0) == set()
+
+
+# ------------------------- Espera pelo fim da gravação -------------------------
+
+def test_arquivo_so_e_lido_depois_de_ficar_estavel(monkeypatch, pasta, armazem, analises):
+    agora = [100.0]
+    monkeypatch.setattr(dvh_monitor.time, "monotonic", lambda: agora[0])
+    monitor = _monitor(pasta, armazem, espera=2.0)
+    caminho = pasta / "plano.txt"
+    texto = exportar_dvh().encode("utf-8")
+    caminho.write_bytes(texto[:1000])  # exportação pela metade
+    monitor.agendar("plano.txt")
+    monitor.agendar("ignorado.csv")
+    assert list(monitor.pendentes) == [str(caminho)]
+
+    agora[0] += 1.0
+    monitor.processar_estaveis()
+    assert analises == []
+
+    # Continuou crescendo durante a espera: a contagem recomeça
+    caminho.write_bytes(texto)
+    agora[0] += 1.5
+    monitor.processar_estaveis()
+    assert analises == [] and str(caminho) in monitor.pendentes
+
+    agora[0] += 1.0
+    monitor.processar_estaveis()
+    assert analises == []
+    agora[0] += 1.5
+    monitor.processar_estaveis()
+    assert analises == [texto] and not monitor.pendentes
+
+
+def test_arquivo_removido_antes_da_leitura_sai_da_fila(monkeypatch, pasta, armazem, analises):
+    agora = [0.0]
+    monkeypatch.setattr(dvh_monitor.time, "monotonic", lambda: agora[0])
+    monitor = _monitor(pasta, armazem, espera=1.0)
+    (pasta / "temporario.txt").write_bytes(INVALIDO)
+    monitor.agendar("temporario.txt")
+    os.remove(pasta / "temporario.txt")
+    agora[0] += 2.0
+    monitor.processar_estaveis()
+    assert not monitor.pendentes and analises == []
+
+
+# ------------------------- Formato inválido -------------------------
+
+def test_formato_invalido_nao_e_lido_de_novo_ate_mudar(pasta, armazem, analises):
+    caminho = str(pasta / "relatorio.txt")
+    with open(caminho, "wb") as f:
+        f.write(INVALIDO)
+
+    assert _monitor(pasta, armazem).processar(caminho) == "formato_invalido"
+    assert len(analises) == 1
+    # Outro evento ou um reinício do monitor com o mesmo banco: o arquivo não é analisado de novo
+    assert _monitor(pasta, armazem).processar(caminho) is None
+    assert len(analises) == 1
+
+    # Com outros parâmetros (ex.: outra versão do motor) a falha registrada não vale
+    outro = _monitor(pasta, armazem)
+    outro.parametros += "outra versão"
+    assert outro.processar(caminho) == "formato_invalido"
+    assert len(analises) == 2
+
+    # O arquivo mudou (nova exportação com o mesmo nome): é lido de novo
+    with open(caminho, "wb") as f:
+        f.write(exportar_dvh().encode("utf-8"))
+    assert _monitor(pasta, armazem).processar(caminho) == "ok"
+    assert len(analises) == 3
+
+
+def test_laco_de_polling(pasta, armazem, analises):
+    (pasta / "existente.txt").write_bytes(exportar_dvh().encode("utf-8"))
+    monitor = _monitor(pasta, armazem, espera=0.1, intervalo=0.02)
+    parar = threading.Event()
+    thread = threading.Thread(target=monitor.executar, args=(parar.is_set,))
+    thread.start()
+    try:
+        (pasta / "invalido.txt").write_bytes(INVALIDO)
+        (pasta / "novo.txt").write_bytes(exportar_dvh(decimal=".").encode("utf-8"))
+        limite = time.monotonic() + 10.0
+        while len(analises) < 3 and time.monotonic() < limite:
+            time.sleep(0.02)
+        time.sleep(0.3)  # mais algumas verificações sem mudanças
+    finally:
+        parar.set()
+        thread.join()
+
+    assert len(analises) == 3
+    with conectar(armazem.caminho_banco) as conexao:
+        status = dict(conexao.execute("SELECT caminho, status FROM arquivos_processados").fetchall())
+    assert {os.path.basename(caminho): valor for caminho, valor in status.items()} == {
+        "existente.txt": "ok", "invalido.txt": "formato_invalido", "novo.txt": "ok",
+    }
+
+    # Reinício com a pasta inalterada: nada é lido de novo
+    reinicio = _monitor(pasta, armazem, espera=0.0, intervalo=0.01)
+    reinicio.executar(parar=lambda: not reinicio.pendentes)
+    assert len(analises) == 3
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from conftest import exportar_dvh
+from dvh_curvas import decodificar_tabela, separar_estruturas
+from dvh_motor import analisar_dvh, tabela_dvh
+
+# ------------------------- Paridade com a leitura linha a linha -------------------------
+# A leitura em bloco das tabelas deve dar os mesmos valores que a leitura original, que percorria o
+# arquivo linha a linha; as regras originais estão reproduzidas abaixo como referência.
+
+LINHAS_MALFORMADAS = {
+    "PTV": {40: ["", "      n/d                 n/d              n/d"]},
+    "Encefalo": {120: ["Total: 3 linhas", ""]},
+    "Body": {200: ["   1000,000    41,7", "   1000,000    41,7    12,0000    7,0"]},
+}
+
+VARIANTES = {
+    "virgula": {},
+    "ponto": {"decimal": "."},
+    "crlf": {"fim_linha": "\r\n"},
+    "malformadas": {"linhas_extras": LINHAS_MALFORMADAS},
+}
+
+
+def _tabela_original(texto, estrutura):
+    """Linhas (dose, dose relativa, volume) da tabela como na leitura original: 3 valores numéricos."""
+    linhas, coletando, dentro_da_tabela = [], False, False
+    for linha in texto.splitlines():
+        linha_limpa = linha.strip()
+        if linha_limpa.lower().startswith(("estrutura:", "structure:")):
+            coletando = linha_limpa.split(":", 1)[-1].strip().lower() == estrutura.lower()
+            dentro_da_tabela = False
+            continue
+        if not coletando:
+            continue
+        if "Dose relativa [%]" in linha and "Volume da estrutura" in linha:
+            dentro_da_tabela = True
+            continue
+        partes = linha_limpa.split()
+        if not dentro_da_tabela or len(partes) != 3:
+            continue
+        try:
+            linhas.append(tuple(float(p.replace(",", ".")) for p in partes))
+        except ValueError:
+            continue
+    return linhas
+
+
+def _coletas_originais(texto):
+    """Valores coletados pelas regras originais para o SRS (estruturas com os nomes padrão)."""
+    tabelas = {nome: _tabela_original(texto, nome) for nome in ("Body", "PTV", "Overlap", "Encefalo")}
+
+    def volume_dose_relativa(alvo):
+        acima = [(r, v) for _, r, v in tabelas["Body"] if r >= alvo]
+        return min(acima)[1] if acima else None
+
+    def volume_dose_absoluta(alvo):
+        return next((v for d, _, v in tabelas["Encefalo"] if d >= alvo), None)
+
+    def dose_cobrindo(pct):
+        alvo = pct * tabelas["PTV"][0][2]
+        candidatos = [(v, d) for d, _, v in tabelas["PTV"] if v <= alvo]
+        if candidatos:
+            return max(candidatos, key=lambda par: par[0])[1]
+        return min(tabelas["PTV"], key=lambda linha: linha[2])[0]
+
+    coletas = {
+        "volume_ptv": tabelas["PTV"][0][2],
+        "volume_overlap": tabelas["Overlap"][0][2],
+        "volume_iso100": volume_dose_relativa(100.0),
+        "volume_iso50": volume_dose_relativa(50.0),
+        "d2_ptv": dose_cobrindo(0.02),
+        "d5_ptv": dose_cobrindo(0.05),
+        "d95_ptv": dose_cobrindo(0.95),
+        "d98_ptv": dose_cobrindo(0.98),
+    }
+    for gy in (10, 12, 18, 20, 24, 30):
+        coletas[f"volume_{gy}gy"] = volume_dose_absoluta(gy * 100.0)
+    return coletas
+
+
+@pytest.mark.parametrize("variante", VARIANTES)
+def test_tabela_em_bloco_igual_a_leitura_linha_a_linha(variante):
+    texto = exportar_dvh(**VARIANTES[variante])
+    for nome, _, texto_tabela in separar_estruturas(texto):
+        esperado = np.array(_tabela_original(texto, nome)).reshape(-1, 3)
+        np.testing.assert_array_equal(decodificar_tabela(texto_tabela), esperado)
+
+
+@pytest.mark.parametrize("variante", VARIANTES)
+def test_metricas_iguais_as_da_leitura_original(variante, gravar_dvh):
+    texto = exportar_dvh(**VARIANTES[variante])
+    coletas = analisar_dvh(gravar_dvh(texto), "SRS (Radiocirurgia)", n_fracoes=1)["coletas"]
+
+    # As regras originais aplicadas ao arquivo sem variações: o formato não pode mudar os valores
+    esperadas = _coletas_originais(exportar_dvh())
+    assert {chave: coletas[chave] for chave in esperadas} == esperadas
+    assert coletas["dose_prescricao"] == 2400.0
+    assert coletas["dose_max_body"] == coletas["dose_max_ptv"] == 3120.0
+
+
+def test_linhas_com_dois_e_quatro_valores_nao_desalinham_a_tabela():
+    # 2 + 4 valores mantêm o total múltiplo de 3: o caminho rápido não pode aceitar o bloco
+    texto_tabela = "0,0 0,0 5,0\n10,0 0,4\n20,0 0,8 4,0 1,0\n30,0 1,2 3,0\n"
+    np.testing.assert_array_equal(decodificar_tabela(texto_tabela), [[0.0, 0.0, 5.0], [30.0, 1.2, 3.0]])
+
+
+# ------------------------- DVH diferencial -------------------------
+
+def _bloco(texto, nome):
+    """Texto da estrutura (da linha "Estrutura:" até a próxima) para repeti-la no arquivo."""
+    inicio = texto.index(f"Estrutura: {nome}\n")
+    fim = texto.find("Estrutura:", inicio + 1)
+    return texto[inicio:fim if fim != -1 else len(texto)]
+
+
+def test_diferencial_igual_ao_cumulativo(gravar_dvh):
+    cumulativo = analisar_dvh(gravar_dvh(exportar_dvh()), "SRS (Radiocirurgia)", n_fracoes=1)
+    diferencial = analisar_dvh(gravar_dvh(exportar_dvh(diferencial=True)), "SRS (Radiocirurgia)", n_fracoes=1)
+    for chave, valor in cumulativo["volumes"].items():
+        assert diferencial["volumes"][chave] == pytest.approx(valor, rel=1e-4), chave
+
+
+def test_blocos_repetidos_do_diferencial_sao_convertidos_separadamente(gravar_dvh):
+    # A mesma estrutura em dois planos: o volume do segundo bloco não pode somar no V(0) do primeiro
+    cumulativo, diferencial = exportar_dvh(), exportar_dvh(diferencial=True)
+    tabela_cumulativa = tabela_dvh(gravar_dvh(cumulativo + _bloco(cumulativo, "PTV")), "PTV")
+    tabela_diferencial = tabela_dvh(gravar_dvh(diferencial + _bloco(diferencial, "PTV")), "PTV")
+
+    assert tabela_diferencial.shape == tabela_cumulativa.shape
+    np.testing.assert_allclose(tabela_diferencial, tabela_cumulativa, atol=1e-4)
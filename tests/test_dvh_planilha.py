@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dvh_planilha import EspelhoPlanilha, IndiceEnvios, gravar_plano
+from dvh_planilha_falsa import ClienteFalso
+
+ABA = "SRS (Radiocirurgia)"
+
+
+@pytest.fixture
+def banco(tmp_path):
+    return str(tmp_path / "resultados.sqlite3")
+
+
+@pytest.fixture
+def aba():
+    return ClienteFalso().open_by_key("teste").add_worksheet(title=ABA)
+
+
+def _plano(id_paciente, ci="1.0"):
+    return {"Nome do Paciente": f"Paciente {id_paciente}", "ID do Paciente": id_paciente, "CI1": ci}
+
+
+# ------------------------- Espelho local -------------------------
+
+def test_sincronizacao_busca_somente_as_linhas_novas(banco, aba):
+    aba.update(values=[["Nome", "ID", "CI1"], ["A", "1", "1.1"], ["B", "2", "1.2"]], range_name="A1")
+    espelho = EspelhoPlanilha(banco)
+
+    assert espelho.sincronizar(aba) == 2
+    aba.append_row(["C", "3", "1.3"])
+    assert espelho.sincronizar(aba) == 1
+
+    assert aba.chamadas["batch_get"] == 2
+    assert espelho.estado(ABA)["ultima_linha"] == 4
+    assert list(espelho.tabela(ABA)["ID"]) == ["1", "2", "3"]
+    assert list(espelho.tabela(ABA, apos_linha=3)["ID"]) == ["3"]
+
+
+def test_coluna_nova_no_final_mantem_o_espelho(banco, aba):
+    aba.update(values=[["Nome", "ID"], ["A", "1"]], range_name="A1")
+    espelho = EspelhoPlanilha(banco)
+    espelho.sincronizar(aba)
+
+    aba.insert_cols([["CI1"]], col=3)
+    aba.append_row(["B", "2", "1.2"])
+    assert espelho.sincronizar(aba) == 1
+
+    estado = espelho.estado(ABA)
+    assert estado["cabecalho"] == ["Nome", "ID", "CI1"]
+    assert estado["versao_cabecalho"] == 2
+    assert espelho.tabela(ABA).loc[3].tolist() == ["B", "2", "1.2"]
+
+
+def test_coluna_movida_reespelha_a_aba_inteira(banco, aba):
+    aba.update(values=[["Nome", "ID"], ["A", "1"], ["B", "2"]], range_name="A1")
+    espelho = EspelhoPlanilha(banco)
+    espelho.sincronizar(aba)
+
+    # Coluna inserida no início: o cabeçalho espelhado deixa de ser prefixo do atual
+    aba.insert_cols([["Data/Hora", "01/01", "02/01"]], col=1)
+    assert espelho.sincronizar(aba) == 2
+
+    estado = espelho.estado(ABA)
+    assert estado["cabecalho"] == ["Data/Hora", "Nome", "ID"]
+    assert estado["versao_cabecalho"] == 2
+    assert espelho.tabela(ABA).loc[2].tolist() == ["01/01", "A", "1"]
+
+
+# ------------------------- Índice de envios -------------------------
+
+def test_indice_de_envios_por_arquivo_paciente_e_aba(banco):
+    indice = IndiceEnvios(banco)
+    assert indice.obter_linha("hash", "1", ABA) is None
+
+    indice.registrar("hash", "1", ABA, 7)
+    assert indice.obter_linha("hash", "1", ABA) == 7
+    assert indice.obter_linha("hash", "1", "SBRT de Pulmão") is None
+    assert indice.obter_linha("hash", "2", ABA) is None
+
+    indice.registrar("hash", "1", ABA, 9)
+    assert IndiceEnvios(banco).obter_linha("hash", "1", ABA) == 9
+
+
+# ------------------------- Gravação de um plano -------------------------
+
+def test_gravacao_cria_cabecalho_e_acrescenta_linhas(banco, aba):
+    espelho = EspelhoPlanilha(banco)
+
+    assert gravar_plano(aba, _plano("1"), espelho) == ("cabecalho", 2)
+    assert gravar_plano(aba, {**_plano("2"), "GI1": "3.5"}, espelho) == ("nova", 3)
+
+    assert aba.linhas[0] == ["Nome do Paciente", "ID do Paciente", "CI1", "GI1"]
+    assert aba.linhas[2] == ["Paciente 2", "2", "1.0", "3.5"]
+    assert espelho.cabecalho(ABA) == aba.linhas[0]
+    assert list(espelho.tabela(ABA)["ID do Paciente"]) == ["1", "2"]
+    # O cabeçalho vem do espelho: a planilha só foi lida de novo antes de incluir a coluna GI1
+    assert aba.chamadas["batch_get"] == 2
+    assert gravar_plano(aba, _plano("3"), espelho) == ("nova", 4)
+    assert aba.chamadas["batch_get"] == 2
+
+
+def test_gravacao_substitui_a_linha_do_mesmo_paciente(banco, aba):
+    espelho = EspelhoPlanilha(banco)
+    gravar_plano(aba, _plano("1"), espelho)
+    gravar_plano(aba, _plano("2"), espelho)
+
+    assert gravar_plano(aba, _plano("1", ci="0.9"), espelho, linha_existente=2) == ("substituida", 2)
+    assert len(aba.linhas) == 3
+    assert aba.linhas[1] == ["Paciente 1", "1", "0.9"]
+    assert espelho.tabela(ABA).loc[2, "CI1"] == "0.9"
+
+
+def test_coluna_nova_confere_o_cabecalho_alterado_na_planilha(banco, aba):
+    espelho = EspelhoPlanilha(banco)
+    gravar_plano(aba, _plano("1"), espelho)
+
+    # Outra pessoa inclui uma coluna no início depois da sincronização (o espelho ainda é válido)
+    aba.insert_cols([["Data/Hora", "01/01"]], col=1)
+    assert gravar_plano(aba, {**_plano("2"), "GI1": "3.5"}, espelho) == ("nova", 3)
+
+    assert aba.linhas[0] == ["Data/Hora", "Nome do Paciente", "ID do Paciente", "CI1", "GI1"]
+    assert aba.linhas[2] == ["", "Paciente 2", "2", "1.0", "3.5"]
+    assert espelho.cabecalho(ABA) == aba.linhas[0]
+
+
+def test_linha_gravada_e_linha_sincronizada_ficam_iguais_no_espelho(banco, aba):
+    espelho = EspelhoPlanilha(banco)
+    plano = {**_plano("1"), "CI1": 1.23456789, "Fracionamento": 3.0, "V12Gy": None}
+    gravar_plano(aba, plano, espelho)
+    gravada = espelho.tabela(ABA).loc[2].tolist()
+
+    # A planilha mostra "1,23" e "3,00"; o espelho guarda o valor sem formatação
+    assert aba.row_values(2)[2:4] == ["1,23", "3,00"]
+    espelho.sincronizar(aba, completo=True)
+    assert espelho.tabela(ABA).loc[2].tolist() == gravada == ["Paciente 1", "1", "1.23456789", "3", ""]
+
+
+def test_linha_registrada_de_outro_paciente_vira_linha_nova(banco, aba):
+    espelho = EspelhoPlanilha(banco)
+    gravar_plano(aba, _plano("1"), espelho)
+    gravar_plano(aba, _plano("2"), espelho)
+
+    # A linha 3 foi reordenada na planilha e hoje é do paciente 2
+    assert gravar_plano(aba, _plano("1", ci="0.9"), espelho, linha_existente=3) == ("nova", 4)
+    assert aba.linhas[2] == ["Paciente 2", "2", "1.0"]
+    assert aba.linhas[3] == ["Paciente 1", "1", "0.9"]
+
+
+def test_gravacoes_simultaneas_na_aba_vazia_criam_um_cabecalho(banco, aba):
+    espelho = EspelhoPlanilha(banco)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        situacoes = list(executor.map(lambda i: gravar_plano(aba, _plano(str(i)), espelho)[0], range(8)))
+
+    assert situacoes.count("cabecalho") == 1
+    assert aba.linhas[0] == ["Nome do Paciente", "ID do Paciente", "CI1"]
+    assert sorted(linha[1] for linha in aba.linhas[1:]) == [str(i) for i in range(8)]
@@ -0,0 +1,130 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dvh_populacao
+from dvh_populacao import PERCENTIS, BandasPopulacionais, grade_de_dose
+
+SRS = "SRS (Radiocirurgia)"
+DOSE_MAX, PASSO, N_CLASSES = 3000.0, 10.0, 200
+
+
+def _curvas_sinteticas(n, semente=7):
+    """Curvas cumulativas (dose, dose relativa, volume) com volume total, alcance e forma sorteados."""
+    gerador = np.random.default_rng(semente)
+    doses = np.arange(0.0, 2800.0, 5.0)
+    curvas = []
+    for _ in range(n):
+        volume_total = gerador.uniform(1.0, 50.0)
+        alcance = gerador.uniform(800.0, 2700.0)
+        expoente = gerador.uniform(0.5, 4.0)
+        volume = volume_total * np.clip(1.0 - (doses / alcance) ** expoente, 0.0, 1.0)
+        curvas.append(np.column_stack([doses, doses / 24.0, volume]))
+    return curvas
+
+
+def _volumes_na_grade(curvas, grade):
+    """Volume [%] de cada curva nos pontos da grade, calculado direto das curvas."""
+    return np.array([np.interp(grade, c[:, 0], c[:, 2] / c[0, 2] * 100.0, right=0.0) for c in curvas])
+
+
+def _bandas(curvas, papel="PTV"):
+    bandas = BandasPopulacionais(SRS, dose_max_cgy=DOSE_MAX, passo_cgy=PASSO, n_classes=N_CLASSES)
+    for curva in curvas:
+        bandas.adicionar_curva(papel, curva)
+    return bandas
+
+
+# ------------------------- Estatísticas -------------------------
+
+@pytest.mark.parametrize("n", [1, 2, 9])
+def test_media_e_desvio_iguais_aos_do_numpy(n):
+    curvas = _curvas_sinteticas(n)
+    bandas = _bandas(curvas)
+    volumes = _volumes_na_grade(curvas, bandas.grade)
+    tabela = bandas.tabela()
+
+    assert (tabela["n"] == n).all()
+    np.testing.assert_allclose(tabela["media"], volumes.mean(axis=0), atol=1e-9)
+    esperado = volumes.std(axis=0, ddof=1) if n > 1 else np.zeros(len(bandas.grade))
+    np.testing.assert_allclose(tabela["desvio"], esperado, atol=1e-9)
+
+
+@pytest.mark.parametrize("n", [1, 4, 9, 40])
+def test_percentis_dentro_de_uma_classe_do_numpy(n):
+    curvas = _curvas_sinteticas(n, semente=n)
+    bandas = _bandas(curvas)
+    volumes = _volumes_na_grade(curvas, bandas.grade)
+    largura_classe = 100.0 / N_CLASSES
+
+    for p, estimado in bandas.percentis("PTV").items():
+        # O histograma localiza a menor curva com fração acumulada >= p (percentil "inverted_cdf")
+        # e interpola dentro da classe dela
+        esperado = np.percentile(volumes, p, axis=0, method="inverted_cdf")
+        assert np.abs(estimado - esperado).max() <= largura_classe + 1e-9, p
+    mediana = bandas.percentis("PTV", percentis=(50,))[50]
+    assert np.all(np.diff(mediana) <= 1e-9)  # curvas cumulativas: não crescente com a dose
+
+
+def test_grade_comum_e_volume_zero_apos_a_dose_maxima_da_curva():
+    bandas = _bandas(_curvas_sinteticas(3))
+    np.testing.assert_array_equal(bandas.grade, grade_de_dose(DOSE_MAX, PASSO))
+    assert bandas.grade[-1] == DOSE_MAX
+    tabela = bandas.tabela()
+    acima = tabela[tabela["dose_cgy"] >= 2800.0]
+    assert (acima["media"] == 0.0).all()
+    # Os percentis vêm da primeira classe do histograma
+    assert acima["p95"].between(0.0, 100.0 / N_CLASSES).all()
+
+
+# ------------------------- Estado salvo -------------------------
+
+def test_salvar_e_carregar_estado(tmp_path):
+    curvas = _curvas_sinteticas(8)
+    bandas = _bandas(curvas[:5])
+    bandas.adicionar_curva("Encefalo", curvas[0])
+    caminho = tmp_path / "coorte.npz"
+    bandas.salvar_estado(str(caminho))
+
+    carregado = BandasPopulacionais.carregar_estado(str(caminho))
+    assert carregado.tipo_tratamento == SRS and carregado.n_classes == N_CLASSES
+    np.testing.assert_array_equal(carregado.grade, bandas.grade)
+    pd.testing.assert_frame_equal(carregado.tabela(), bandas.tabela())
+
+    # Continuar a agregação a partir do estado dá o mesmo que agregar tudo de uma vez
+    for curva in curvas[5:]:
+        carregado.adicionar_curva("PTV", curva)
+    completo = _bandas(curvas)
+    completo.adicionar_curva("Encefalo", curvas[0])
+    pd.testing.assert_frame_equal(carregado.tabela(), completo.tabela())
+
+
+# ------------------------- Linha de comando -------------------------
+
+def _rodar(monkeypatch, *argumentos):
+    monkeypatch.setattr(sys, "argv", ["dvh_populacao.py", *argumentos])
+    dvh_populacao.main()
+
+
+@pytest.mark.parametrize("argumentos", [("--passo", "5"), ("--dose-max", "6000"), ("--dose-max", "3000", "--passo", "20")])
+def test_grade_diferente_da_do_estado_e_recusada(monkeypatch, tmp_path, capsys, argumentos):
+    estado = tmp_path / "coorte.npz"
+    _bandas(_curvas_sinteticas(2)).salvar_estado(str(estado))
+    with pytest.raises(SystemExit) as erro:
+        _rodar(monkeypatch, "--estado", str(estado), "--saida", str(tmp_path / "bandas.csv"), *argumentos, "x.txt")
+    assert erro.value.code == 2
+    assert "grade" in capsys.readouterr().err
+    assert not (tmp_path / "bandas.csv").exists()
+
+
+def test_grade_igual_a_do_estado_e_aceita(monkeypatch, tmp_path):
+    estado = tmp_path / "coorte.npz"
+    _bandas(_curvas_sinteticas(2)).salvar_estado(str(estado))
+    saida = tmp_path / "bandas.csv"
+    _rodar(monkeypatch, "--estado", str(estado), "--saida", str(saida), "--dose-max", "3000", "--passo", "10",
+           str(tmp_path / "inexistente.txt"))
+    tabela = pd.read_csv(saida)
+    assert tabela["dose_cgy"].max() == DOSE_MAX and (tabela["n"] == 2).all()
+    assert list(tabela.columns[-len(PERCENTIS):]) == [f"p{p}" for p in PERCENTIS]
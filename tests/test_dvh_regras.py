@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dvh_regras import ALERTA, FALHA, NAO_SE_APLICA, OK, SEM_DADO, ProtocoloRegras, resumir
+
+SRS = "SRS (Radiocirurgia)"
+PULMAO = "SBRT de Pulmão"
+
+# Uma regra de cada sentido: CI4 deve ficar acima (min) e V12Gy abaixo (max) dos níveis
+REGRAS = [
+    {"tipo_tratamento": SRS, "metrica": "CI4", "limite": "min", "tolerancia": 0.85, "acao": 0.7},
+    {"tipo_tratamento": SRS, "fracoes": [1], "metrica": "V12Gy", "limite": "max", "tolerancia": 10.0, "acao": 15.0},
+]
+CI4, V12 = "CI4 ≥ 0.85", "V12Gy ≤ 10 [1 fx]"
+
+
+@pytest.fixture
+def protocolo():
+    return ProtocoloRegras(REGRAS)
+
+
+def _avaliar(protocolo, linhas, tipo=SRS):
+    return protocolo.avaliar(pd.DataFrame(linhas), tipo)
+
+
+# ------------------------- Níveis de tolerância e de ação -------------------------
+
+@pytest.mark.parametrize("valor, esperado", [
+    (0.95, OK),
+    (0.85, OK),        # na tolerância
+    (0.80, ALERTA),
+    (0.70, ALERTA),    # no nível de ação
+    (0.69, FALHA),
+    ("0,9", OK),       # texto da planilha com vírgula decimal
+])
+def test_regra_de_minimo(protocolo, valor, esperado):
+    assert _avaliar(protocolo, [{"CI4": valor, "Fracionamento": 1}])[CI4].iloc[0] == esperado
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    (5.0, OK),
+    (10.0, OK),        # na tolerância
+    (12.0, ALERTA),
+    (15.0, ALERTA),    # no nível de ação
+    (15.01, FALHA),
+    ("12,5", ALERTA),
+])
+def test_regra_de_maximo(protocolo, valor, esperado):
+    assert _avaliar(protocolo, [{"V12Gy": valor, "Fracionamento": "1"}])[V12].iloc[0] == esperado
+
+
+def test_varios_planos_de_uma_vez(protocolo):
+    codigos = _avaliar(protocolo, [
+        {"CI4": 0.9, "V12Gy": 16.0, "Fracionamento": 1},
+        {"CI4": 0.6, "V12Gy": 3.0, "Fracionamento": 1},
+    ])
+    assert codigos[CI4].tolist() == [OK, FALHA]
+    assert codigos[V12].tolist() == [FALHA, OK]
+    assert codigos.dtypes.eq(np.int8).all()
+
+
+# ------------------------- Regras que não se aplicam e dados ausentes -------------------------
+
+def test_outro_tipo_de_tratamento_nao_se_aplica(protocolo):
+    codigos = _avaliar(protocolo, [{"CI4": 0.1, "V12Gy": 99.0, "Fracionamento": 1}], tipo=PULMAO)
+    assert codigos.iloc[0].tolist() == [NAO_SE_APLICA, NAO_SE_APLICA]
+
+
+def test_tipo_por_plano_na_coluna(protocolo):
+    tabela = pd.DataFrame([{"tipo_tratamento": SRS, "CI4": 0.1}, {"tipo_tratamento": PULMAO, "CI4": 0.1}])
+    assert protocolo.avaliar(tabela)[CI4].tolist() == [FALHA, NAO_SE_APLICA]
+
+
+@pytest.mark.parametrize("fracoes", [3, "5", None])
+def test_outro_fracionamento_nao_se_aplica(protocolo, fracoes):
+    codigos = _avaliar(protocolo, [{"CI4": 0.9, "V12Gy": 99.0, "Fracionamento": fracoes}])
+    assert codigos[V12].iloc[0] == NAO_SE_APLICA
+    assert codigos[CI4].iloc[0] == OK  # regra sem fracionamento vale para todos
+
+
+def test_valor_ausente_ou_coluna_ausente(protocolo):
+    codigos = _avaliar(protocolo, [
+        {"CI4": np.nan, "Fracionamento": 1},
+        {"CI4": "", "Fracionamento": 1},
+        {"CI4": "n/d", "Fracionamento": 1},
+    ])
+    # Não há coluna V12Gy: sem dado, nunca OK
+    assert (codigos == SEM_DADO).all().all()
+
+
+# ------------------------- Resumo por plano -------------------------
+
+def test_pior_resultado_de_cada_plano(protocolo):
+    linhas = [
+        {"CI4": 0.9, "V12Gy": 5.0},     # OK + OK
+        {"CI4": 0.8, "V12Gy": 5.0},     # ALERTA + OK
+        {"CI4": 0.8, "V12Gy": 20.0},    # ALERTA + FALHA
+        {"CI4": 0.9},                   # OK + sem dado
+        {},                             # sem dado nas duas
+    ]
+    tabela = pd.DataFrame([{**linha, "tipo_tratamento": SRS, "Fracionamento": 1} for linha in linhas])
+    # Último plano: nenhuma regra para o seu tipo de tratamento
+    tabela.loc[5] = {"tipo_tratamento": PULMAO, "CI4": 0.1, "V12Gy": 99.0, "Fracionamento": 1}
+    codigos = protocolo.avaliar(tabela)
+    pior, contagem = resumir(codigos)
+
+    assert pior.tolist() == [OK, ALERTA, FALHA, OK, SEM_DADO, NAO_SE_APLICA]
+    assert contagem.loc[CI4].tolist() == [2, 2, 0, 1]
+    assert contagem.loc[V12].tolist() == [2, 0, 1, 2]
+
+
+def test_niveis_invertidos_sao_recusados():
+    with pytest.raises(ValueError, match="ação"):
+        ProtocoloRegras([{**REGRAS[0], "acao": 0.9}])
+    with pytest.raises(ValueError, match="max"):
+        ProtocoloRegras([{**REGRAS[0], "limite": "menor"}])
@@ -0,0 +1,96 @@
+import os
+import re
+from datetime import datetime
+
+import pytest
+
+from conftest import exportar_dvh
+from dvh_motor import analisar_dvh
+from dvh_relatorio import gerar_lote, nomes_de_saida, relatorio_html, relatorio_pdf
+
+SRS = "SRS (Radiocirurgia)"
+GERADO_EM = datetime(2025, 1, 2, 3, 4)
+# Fora da codificação do Windows usada nas fontes do PDF
+NOME_PACIENTE = "Teste ✓ 患者 Ωmega"
+NOME_PTV = "PTV ✓ 肿瘤"
+
+
+def _resultado(gravar_dvh):
+    texto = exportar_dvh().replace("Teste, Sintético", NOME_PACIENTE).replace("Estrutura: PTV", f"Estrutura: {NOME_PTV}")
+    return analisar_dvh(gravar_dvh(texto), SRS, estruturas={"ptv": NOME_PTV}, n_fracoes=1)
+
+
+def _conferir_pdf(dados):
+    """Cabeçalho, fim de arquivo e tabela xref apontando para o início de cada objeto."""
+    assert dados.startswith(b"%PDF-")
+    assert dados.rstrip().endswith(b"%%EOF")
+    inicio_xref = int(re.search(rb"startxref\n(\d+)\n%%EOF", dados).group(1))
+    assert dados[inicio_xref:].startswith(b"xref\n")
+    cabecalho, *linhas = dados[inicio_xref:].split(b"trailer")[0].splitlines()[1:]
+    primeiro, quantidade = map(int, cabecalho.split())
+    assert primeiro == 0 and len(linhas) == quantidade
+    assert int(re.search(rb"/Size (\d+)", dados).group(1)) == quantidade
+    assert linhas[0].endswith(b"f ")
+    for numero, linha in enumerate(linhas[1:], start=1):
+        posicao, geracao, tipo = linha.split()
+        assert len(linha) == 19 and tipo == b"n" and geracao == b"00000"
+        assert dados[int(posicao):].startswith(b"%d 0 obj\n" % numero)
+    return quantidade - 1
+
+
+def test_relatorio_pdf_valido_com_nomes_fora_do_cp1252(gravar_dvh):
+    resultado = _resultado(gravar_dvh)
+    assert resultado["coletas"]["dose_prescricao"] == 2400.0
+    dados = relatorio_pdf(resultado, GERADO_EM)
+    # Catálogo, páginas, duas fontes e (conteúdo, página) de cada página
+    assert _conferir_pdf(dados) >= 6
+    assert b"(Paciente) Tj" in dados
+    # Os caracteres sem representação ficam de fora do texto
+    assert b"(Teste   mega) Tj" in dados
+    assert b"02/01/2025 03:04" in dados
+
+
+def test_relatorio_html_com_nomes_fora_do_cp1252(gravar_dvh):
+    pagina = relatorio_html(_resultado(gravar_dvh), GERADO_EM)
+    assert NOME_PACIENTE in pagina
+    assert "Gerado em 02/01/2025 03:04" in pagina
+
+
+def test_nomes_de_saida_sem_colisao(tmp_path):
+    caminhos = [str(tmp_path / "a" / "plano.txt"), str(tmp_path / "a" / "outro.txt")]
+    assert nomes_de_saida(caminhos) == ["plano", "outro"]
+    assert nomes_de_saida(caminhos, str(tmp_path / "saida")) == ["plano", "outro"]
+    # Mesmo nome em pastas diferentes, cada relatório na pasta do seu arquivo
+    assert nomes_de_saida([str(tmp_path / "a" / "plano.txt"), str(tmp_path / "b" / "plano.txt")]) == ["plano", "plano"]
+
+
+def test_nomes_de_saida_com_colisao(tmp_path):
+    caminhos = [str(tmp_path / "a" / "plano.txt"), str(tmp_path / "b" / "plano.txt"), str(tmp_path / "a" / "plano.dat")]
+    nomes = nomes_de_saida(caminhos, str(tmp_path / "saida"))
+    assert len(set(nomes)) == 3
+    assert all(re.fullmatch(r"plano_[0-9a-f]{8}", nome) for nome in nomes)
+    # O sufixo depende só do caminho do arquivo, não da ordem do lote
+    assert nomes_de_saida(caminhos[::-1], str(tmp_path / "saida")) == nomes[::-1]
+
+
+@pytest.mark.parametrize("processos", [1, 2])
+def test_lote_com_nomes_repetidos_nao_sobrescreve(tmp_path, processos):
+    caminhos = []
+    for pasta in ("a", "b"):
+        os.makedirs(tmp_path / pasta)
+        caminho = tmp_path / pasta / "plano.txt"
+        caminho.write_bytes(exportar_dvh().replace("000123", f"ID-{pasta}").encode("utf-8"))
+        caminhos.append(str(caminho))
+    saida = tmp_path / "saida"
+    saida.mkdir()
+
+    resultados = list(gerar_lote(caminhos, SRS, n_fracoes=1, pasta_saida=str(saida), processos=processos))
+    assert [erro for _, _, erro in resultados] == [None, None]
+    gravados = [caminho for _, lista, _ in resultados for caminho in lista]
+    assert len(set(gravados)) == 4 and sorted(os.listdir(saida)) == sorted(os.path.basename(c) for c in gravados)
+    for (_, lista, _), pasta in zip(resultados, ("a", "b")):
+        html_gravado = next(caminho for caminho in lista if caminho.endswith(".html"))
+        with open(html_gravado, encoding="utf-8") as f:
+            assert f"ID-{pasta}" in f.read()
+        with open(next(caminho for caminho in lista if caminho.endswith(".pdf")), "rb") as f:
+            _conferir_pdf(f.read())
@@ -0,0 +1,99 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import exportar_dvh
+from dvh_servico import TAMANHO_MAXIMO_ARQUIVO, criar_servidor
+
+SRS = "SRS%20(Radiocirurgia)"
+
+
+@pytest.fixture
+def servidor():
+    """Serviço real em uma porta livre, com um trabalhador e sem fila de espera."""
+    servidor = criar_servidor(porta=0, trabalhadores=1, tamanho_fila=0)
+    thread = threading.Thread(target=servidor.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+    servidor.RequestHandlerClass.fila.encerrar()
+
+
+def _enviar(servidor, caminho, corpo=b"", cabecalhos=None):
+    """POST com os cabeçalhos exatamente como informados (sem Content-Length automático)."""
+    conexao = http.client.HTTPConnection(*servidor.server_address, timeout=30)
+    conexao.putrequest("POST", caminho)
+    for chave, valor in (cabecalhos or {}).items():
+        conexao.putheader(chave, valor)
+    conexao.endheaders()
+    if corpo:
+        conexao.send(corpo)
+    resposta = conexao.getresponse()
+    dados = json.loads(resposta.read().decode("utf-8"))
+    conexao.close()
+    return resposta.status, dados
+
+
+def _enviar_json(servidor, pedido):
+    corpo = json.dumps(pedido).encode("utf-8")
+    return _enviar(servidor, "/analisar", corpo, {
+        "Content-Type": "application/json", "Content-Length": str(len(corpo)),
+    })
+
+
+def test_analise_do_dvh_no_corpo(servidor):
+    corpo = exportar_dvh().encode("utf-8")
+    status, dados = _enviar(servidor, f"/analisar?tipo_tratamento={SRS}&n_fracoes=1", corpo, {
+        "Content-Type": "text/plain", "Content-Length": str(len(corpo)),
+    })
+    assert status == 200
+    assert dados["coletas"]["dose_prescricao"] == 2400.0
+
+
+@pytest.mark.parametrize("tamanho", ["abc", "-1", "1_0", " "])
+def test_content_length_invalido(servidor, tamanho):
+    status, dados = _enviar(servidor, f"/analisar?tipo_tratamento={SRS}", cabecalhos={"Content-Length": tamanho})
+    assert status == 400
+    assert "Content-Length" in dados["erro"]
+
+
+def test_content_length_ausente(servidor):
+    assert _enviar(servidor, f"/analisar?tipo_tratamento={SRS}")[0] == 411
+
+
+def test_corpo_grande_demais_nao_e_lido(servidor):
+    cabecalhos = {"Content-Length": str(TAMANHO_MAXIMO_ARQUIVO + 1)}
+    assert _enviar(servidor, f"/analisar?tipo_tratamento={SRS}", cabecalhos=cabecalhos)[0] == 413
+
+
+@pytest.mark.parametrize("n_fracoes", [0, -3, 2.5, "3.5", "x", True, [1]])
+def test_numero_de_fracoes_invalido(servidor, n_fracoes):
+    pedido = {"dvh": exportar_dvh(), "tipo_tratamento": "SRS (Radiocirurgia)", "n_fracoes": n_fracoes}
+    status, dados = _enviar_json(servidor, pedido)
+    assert status == 400
+    assert "n_fracoes" in dados["erro"]
+
+
+@pytest.mark.parametrize("n_fracoes", [3, 3.0, "3"])
+def test_numero_de_fracoes_inteiro(servidor, n_fracoes):
+    pedido = {"dvh": exportar_dvh(), "tipo_tratamento": "SRS (Radiocirurgia)", "n_fracoes": n_fracoes}
+    assert _enviar_json(servidor, pedido)[0] == 200
+
+
+def test_fila_cheia_responde_503(servidor):
+    # O único trabalhador fica ocupado até o fim do teste
+    fila, liberar = servidor.RequestHandlerClass.fila, threading.Event()
+    ocupado = threading.Thread(target=fila.executar, args=(liberar.wait,))
+    ocupado.start()
+    while fila.pendentes == 0:
+        time.sleep(0.01)
+    try:
+        pedido = {"dvh": exportar_dvh(), "tipo_tratamento": "SRS (Radiocirurgia)"}
+        assert _enviar_json(servidor, pedido)[0] == 503
+    finally:
+        liberar.set()
+        ocupado.join()